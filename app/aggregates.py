@@ -0,0 +1,609 @@
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import Date, DateTime, Integer, Numeric, String, and_, case, cast, delete, extract, func, insert, select
+from sqlalchemy.orm import Session
+from app import archive, models, report_memo
+from app.sketches import SketchKLL
+
+# ============================================================
+# RESÚMENES POR DÍA Y POR HORA
+# ============================================================
+# Los reportes leen resumen_diario y resumen_horario (models.ResumenDiario /
+# ResumenHorario), que crud.sumar_a_resumenes mantiene en cada escritura.
+# Cada período y zona puede tener varias filas (fragmento): se leen sumándolas.
+# reconstruir_resumenes los recalcula desde las tablas de origen (incluidos los
+# meses archivados, ver app/archive.py): lo usan la migración que crea las
+# tablas, el generador de historial y `python -m app.aggregates`.
+
+def _hora_truncada(db: Session, columna):
+    """Fecha truncada a la hora, según el motor"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("hour", columna)
+    return func.strftime("%Y-%m-%d %H:00:00", columna)
+
+def _hora(db: Session, columna):
+    if db.get_bind().dialect.name == "postgresql":
+        return extract("hour", columna)
+    return cast(func.strftime("%H", columna), Integer)
+
+def _segundos_entre(db: Session, inicio, fin):
+    """Segundos transcurridos entre dos columnas de fecha"""
+    if db.get_bind().dialect.name == "postgresql":
+        return extract("epoch", fin - inicio)
+    return (func.julianday(fin) - func.julianday(inicio)) * 86400.0
+
+_EPOCA = datetime(1970, 1, 1)
+
+def _segundos_epoca(db: Session, columna):
+    """Segundos desde 1970 de una columna de fecha, leída como hora local sin zona"""
+    if db.get_bind().dialect.name == "postgresql":
+        return extract("epoch", cast(columna, DateTime(timezone=False)))
+    # julianday guarda milisegundos: redondear deja exactos los límites de intervalo
+    return func.round((func.julianday(columna) - 2440587.5) * 86400.0, 3)
+
+def _como_datetime(valor) -> datetime:
+    return valor if isinstance(valor, datetime) else datetime.fromisoformat(valor)
+
+def _limites(desde: Optional[date], hasta: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Días completos: desde las 00:00 del primero hasta el final del último"""
+    return (
+        datetime.combine(desde, time.min) if desde else None,
+        datetime.combine(hasta, time.max) if hasta else None,
+    )
+
+
+# ============ RECONSTRUCCIÓN DESDE LAS TABLAS DE ORIGEN ============
+def metricas_por_hora(
+    db: Session, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None
+) -> Dict[Tuple[datetime, str], Dict[str, float]]:
+    """Métricas de los resúmenes por (hora, zona), calculadas con GROUP BY sobre los datos crudos"""
+    resultado = {}
+
+    def sumar(hora, zona, metrica, valor):
+        clave = (_como_datetime(hora), zona)
+        fila = resultado.setdefault(clave, dict.fromkeys(models.METRICAS_RESUMEN, 0))
+        fila[metrica] += valor
+
+    asignaciones = archive.seleccion_rango(db, "asignacion", fecha_inicio, fecha_fin, None)
+    segundos = _segundos_entre(db, asignaciones.c.hora_asignado, asignaciones.c.hora_liberado)
+    cerrada = asignaciones.c.hora_liberado != None
+    valida = cerrada & (asignaciones.c.hora_liberado > asignaciones.c.hora_asignado)
+    hora = _hora_truncada(db, asignaciones.c.hora_asignado).label("hora")
+    for h, zona, llegadas, completadas, suma, cortas in db.execute(
+        select(
+            hora,
+            asignaciones.c.zona,
+            func.count(),
+            func.coalesce(func.sum(case((valida, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((valida, segundos), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((and_(cerrada, segundos < 60), 1), else_=0)), 0),
+        ).group_by(hora, asignaciones.c.zona)
+    ).all():
+        sumar(h, zona, "llegadas", llegadas)
+        sumar(h, zona, "estadias_completadas", completadas)
+        sumar(h, zona, "segundos_estadia", float(suma))
+        sumar(h, zona, "estadias_cortas", cortas)
+
+    incidentes = archive.seleccion_rango(db, "incidente", fecha_inicio, fecha_fin, None)
+    hora = _hora_truncada(db, incidentes.c.hora_de_registro).label("hora")
+    for h, zona, tipo, total in db.execute(
+        select(hora, incidentes.c.zona, incidentes.c.tipo_de_incidente, func.count())
+        .group_by(hora, incidentes.c.zona, incidentes.c.tipo_de_incidente)
+    ).all():
+        if tipo == "estacionamiento_lleno":
+            sumar(h, zona, "estacionamiento_lleno", total)
+        elif tipo not in models.TIPOS_INCIDENTE_AUTOMATICOS:
+            sumar(h, zona, "incidentes_manuales", total)
+
+    ayuda = models.SolicitudAyuda
+    hora = _hora_truncada(db, ayuda.fecha_hora).label("hora")
+    consulta = select(hora, func.count()).group_by(hora)
+    if fecha_inicio:
+        consulta = consulta.where(ayuda.fecha_hora >= fecha_inicio)
+    if fecha_fin:
+        consulta = consulta.where(ayuda.fecha_hora <= fecha_fin)
+    for h, total in db.execute(consulta).all():
+        sumar(h, models.ZONA_POR_DEFECTO, "solicitudes_ayuda", total)
+
+    rechazo = models.RechazoPorMinuto
+    hora = _hora_truncada(db, rechazo.minuto).label("hora")
+    consulta = select(hora, rechazo.zona, func.sum(rechazo.cantidad)).group_by(hora, rechazo.zona)
+    if fecha_inicio:
+        consulta = consulta.where(rechazo.minuto >= fecha_inicio)
+    if fecha_fin:
+        consulta = consulta.where(rechazo.minuto <= fecha_fin)
+    for h, zona, total in db.execute(consulta).all():
+        sumar(h, zona, "rechazos", int(total))
+
+    return resultado
+
+
+def reconstruir_resumenes(db: Session, desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """
+    Recalcular los resúmenes de los días [desde, hasta] (sin límites: todos)
+    desde las tablas de origen. No hace commit. Devuelve las horas escritas.
+    """
+    fecha_inicio, fecha_fin = _limites(desde, hasta)
+    horario, diario = models.ResumenHorario.__table__, models.ResumenDiario.__table__
+
+    borrar_horas = delete(horario)
+    borrar_dias = delete(diario)
+    if desde:
+        borrar_horas = borrar_horas.where(horario.c.hora >= fecha_inicio)
+        borrar_dias = borrar_dias.where(diario.c.dia >= desde)
+    if hasta:
+        borrar_horas = borrar_horas.where(horario.c.hora <= fecha_fin)
+        borrar_dias = borrar_dias.where(diario.c.dia <= hasta)
+    db.execute(borrar_horas)
+    db.execute(borrar_dias)
+
+    por_hora = metricas_por_hora(db, fecha_inicio, fecha_fin)
+    por_dia = {}
+    for (hora, zona), metricas in por_hora.items():
+        acumulado = por_dia.setdefault((hora.date(), zona), dict.fromkeys(models.METRICAS_RESUMEN, 0))
+        for metrica, valor in metricas.items():
+            acumulado[metrica] += valor
+
+    # Los reportes guardados de los días recalculados se invalidan al confirmar
+    report_memo.marcar_dias(db, [desde or date.min, hasta or date.today()])
+
+    if por_hora:
+        db.execute(insert(horario), [{"hora": h, "zona": z, **m} for (h, z), m in sorted(por_hora.items())])
+        db.execute(insert(diario), [{"dia": d, "zona": z, **m} for (d, z), m in sorted(por_dia.items())])
+    return len(por_hora)
+
+
+# ============ LECTURA PARA LOS REPORTES ============
+def tiempo_promedio_horas(metricas: Dict[str, float]) -> float:
+    """Estadía promedio en horas (1 decimal) de un resumen de métricas"""
+    if not metricas["estadias_completadas"]:
+        return 0
+    return round(metricas["segundos_estadia"] / 3600 / metricas["estadias_completadas"], 1)
+
+
+def horas_pico(llegadas: Dict[int, int], limite: int) -> list:
+    """
+    Las `limite` horas del día con más llegadas (empates por hora), con la
+    ocupación como porcentaje de la hora más concurrida
+    """
+    pico = sorted(llegadas.items(), key=lambda item: (-item[1], item[0]))[:limite]
+    maximo = pico[0][1] if pico else 0
+    return [
+        {"hora": f"{h:02d}:00-{(h+1):02d}:00", "ocupacion": round(cantidad / maximo * 100, 0) if maximo > 0 else 0}
+        for h, cantidad in pico
+    ]
+
+
+def _sumas(tabla, zona: Optional[str]):
+    """
+    SUM de cada métrica. Con zona, solo suman las filas de esa zona salvo las
+    solicitudes de ayuda, que no tienen zona y se cuentan siempre.
+    """
+    columnas = []
+    for metrica in models.METRICAS_RESUMEN:
+        columna = tabla.c[metrica]
+        if zona and metrica != "solicitudes_ayuda":
+            columna = case((tabla.c.zona == zona, columna), else_=0)
+        columnas.append(func.coalesce(func.sum(columna), 0).label(metrica))
+    return columnas
+
+
+def _fila_a_metricas(fila) -> Dict[str, float]:
+    metricas = {metrica: int(fila[i] or 0) for i, metrica in enumerate(models.METRICAS_RESUMEN)}
+    metricas["segundos_estadia"] = float(fila[models.METRICAS_RESUMEN.index("segundos_estadia")] or 0)
+    return metricas
+
+
+def resumen_por_dia(
+    db: Session, fecha_inicio: datetime, fecha_fin: datetime, zona: Optional[str] = None
+) -> Dict[str, Dict[str, float]]:
+    """Métricas por día ("AAAA-MM-DD") de los días con actividad en el rango"""
+    diario = models.ResumenDiario.__table__
+    filas = db.execute(
+        select(diario.c.dia, *_sumas(diario, zona))
+        .where(diario.c.dia >= fecha_inicio.date(), diario.c.dia <= fecha_fin.date())
+        .group_by(diario.c.dia)
+    ).all()
+    return {fila[0].isoformat(): _fila_a_metricas(fila[1:]) for fila in filas}
+
+
+def resumen_total(
+    db: Session, fecha_inicio: datetime, fecha_fin: datetime, zona: Optional[str] = None
+) -> Dict[str, float]:
+    """Métricas sumadas sobre todos los días del rango"""
+    diario = models.ResumenDiario.__table__
+    fila = db.execute(
+        select(*_sumas(diario, zona)).where(diario.c.dia >= fecha_inicio.date(), diario.c.dia <= fecha_fin.date())
+    ).one()
+    return _fila_a_metricas(fila)
+
+
+def llegadas_por_hora(
+    db: Session, fecha_inicio: datetime, fecha_fin: datetime, zona: Optional[str] = None
+) -> Dict[int, int]:
+    """Vehículos por hora del día (0-23) en los días del rango"""
+    horario = models.ResumenHorario.__table__
+    desde, hasta = _limites(fecha_inicio.date(), fecha_fin.date())
+    hora = _hora(db, horario.c.hora).label("hora_del_dia")
+    consulta = select(hora, func.sum(horario.c.llegadas)).where(
+        horario.c.hora >= desde, horario.c.hora <= hasta, horario.c.llegadas > 0
+    )
+    if zona:
+        consulta = consulta.where(horario.c.zona == zona)
+    return {int(h): int(total) for h, total in db.execute(consulta.group_by(hora)).all()}
+
+
+# ============ ASIGNACIONES EN UN RANGO ARBITRARIO ============
+def metricas_asignaciones(
+    db: Session,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    zona: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Asignaciones, estadías cerradas y sus horas totales entre dos momentos
+    cualquiera (no necesariamente días completos), con una consulta agregada
+    sobre la tabla caliente y los meses archivados
+    """
+    asignaciones = archive.seleccion_rango(db, "asignacion", fecha_inicio, fecha_fin, zona)
+    cerrada = asignaciones.c.hora_liberado != None
+    segundos = _segundos_entre(db, asignaciones.c.hora_asignado, asignaciones.c.hora_liberado)
+    total, cerradas, suma = db.execute(select(
+        func.count(),
+        func.coalesce(func.sum(case((cerrada, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((cerrada, segundos), else_=0.0)), 0.0),
+    )).one()
+    return {"asignaciones": total, "cerradas": cerradas, "horas_totales": float(suma) / 3600}
+
+
+# ============ OCUPACIÓN SIMULTÁNEA (BARRIDO DE INTERVALOS) ============
+# Resoluciones de /reports/ocupacion-timeline y máximo de intervalos por respuesta
+RESOLUCIONES = {"minuto": timedelta(minutes=1), "hora": timedelta(hours=1), "dia": timedelta(days=1)}
+OCUPACION_TIMELINE_MAX_PUNTOS = int(os.getenv("OCUPACION_TIMELINE_MAX_PUNTOS", "50000"))
+
+
+def _truncar(momento: datetime, resolucion: str) -> datetime:
+    momento = momento.replace(second=0, microsecond=0)
+    if resolucion != "minuto":
+        momento = momento.replace(minute=0)
+    if resolucion == "dia":
+        momento = momento.replace(hour=0)
+    return momento
+
+
+def _eventos_ocupacion(db: Session, inicio: datetime, fin: datetime, zona: Optional[str]):
+    """
+    Ocupación al comenzar el rango y momentos (segundos) de llegada y de salida,
+    ordenados, de las asignaciones que se cruzan con [inicio, fin). Solo se
+    leen dos columnas numéricas por asignación; ordenar es O(n log n).
+    """
+    fin_s = (fin - _EPOCA).total_seconds()
+    salidas = []
+
+    # Asignaciones que empezaron antes y seguían activas al comenzar el rango
+    # (a lo sumo una por espacio)
+    previas = archive.seleccion_abiertas_en(db, "asignacion", inicio, zona)
+    activas = db.execute(select(_segundos_epoca(db, previas.c.hora_liberado))).scalars().all()
+    ocupacion_inicial = len(activas)
+    salidas.extend(s for s in activas if s is not None and s < fin_s)
+
+    # Asignaciones que empezaron dentro del rango
+    asignaciones = archive.seleccion_rango(db, "asignacion", inicio, fin, zona)
+    resultado = db.execute(
+        select(
+            _segundos_epoca(db, asignaciones.c.hora_asignado),
+            _segundos_epoca(db, asignaciones.c.hora_liberado),
+        ).where(asignaciones.c.hora_asignado < fin),
+        execution_options={"yield_per": 20000}
+    )
+    llegadas = []
+    for lote in resultado.partitions():
+        for llegada, salida in lote:
+            llegadas.append(llegada)
+            if salida is not None and salida < fin_s:
+                # Una salida registrada antes que la llegada cuenta como estadía nula
+                salidas.append(salida if salida > llegada else llegada)
+    llegadas.sort()
+    salidas.sort()
+    return ocupacion_inicial, llegadas, salidas
+
+
+def _barrido(ocupacion: int, limites: list, llegadas: list, salidas: list, capacidad: int) -> list:
+    """
+    Recorrer llegadas y salidas en orden (a igual momento, primero las salidas)
+    acumulando, por intervalo [limites[i], limites[i+1]), la ocupación
+    ponderada por tiempo, la máxima y los segundos con ocupación >= capacidad
+    """
+    infinito = float("inf")
+    umbral = capacidad if capacidad > 0 else infinito
+    llegadas.append(infinito)
+    salidas.append(infinito)
+    i = j = 0
+    proxima_llegada, proxima_salida = llegadas[0], salidas[0]
+
+    intervalos = []
+    for desde, hasta in zip(limites, limites[1:]):
+        # Los eventos justo en el límite cuentan desde este intervalo
+        while proxima_salida <= desde:
+            ocupacion -= 1
+            j += 1
+            proxima_salida = salidas[j]
+        while proxima_llegada <= desde:
+            ocupacion += 1
+            i += 1
+            proxima_llegada = llegadas[i]
+
+        area = lleno = 0.0
+        maxima = ocupacion
+        t = desde
+        while True:
+            if proxima_salida <= proxima_llegada:
+                if proxima_salida >= hasta:
+                    break
+                tramo = proxima_salida - t
+                t = proxima_salida
+                j += 1
+                proxima_salida = salidas[j]
+                delta = -1
+            else:
+                if proxima_llegada >= hasta:
+                    break
+                tramo = proxima_llegada - t
+                t = proxima_llegada
+                i += 1
+                proxima_llegada = llegadas[i]
+                delta = 1
+            area += ocupacion * tramo
+            if ocupacion >= umbral:
+                lleno += tramo
+            ocupacion += delta
+            if ocupacion > maxima:
+                maxima = ocupacion
+        area += ocupacion * (hasta - t)
+        if ocupacion >= umbral:
+            lleno += hasta - t
+        intervalos.append((area, maxima, lleno))
+    return intervalos
+
+
+def ocupacion_timeline(
+    db: Session,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    zona: Optional[str],
+    resolucion: str,
+    capacidad: int
+) -> dict:
+    """
+    Ocupación simultánea real (no solo horas de llegada) por minuto, hora o
+    día entre fecha_inicio y fecha_fin (sin pasar de ahora): promedio ponderado
+    por tiempo, máxima, espacio-horas y minutos con el estacionamiento lleno
+    (ocupación >= capacidad)
+    """
+    fin = min(fecha_fin, datetime.now())
+    paso = RESOLUCIONES[resolucion]
+    limites_dt = []
+    momento = _truncar(fecha_inicio, resolucion)
+    while momento < fin:
+        limites_dt.append(momento)
+        if len(limites_dt) > OCUPACION_TIMELINE_MAX_PUNTOS:
+            raise ValueError(
+                f"El rango tiene más de {OCUPACION_TIMELINE_MAX_PUNTOS} intervalos de un {resolucion}: "
+                f"usar una resolución mayor o un rango menor"
+            )
+        momento += paso
+    if not limites_dt:
+        return {"intervalos": [], "totales": {"espacio_horas": 0, "minutos_lleno": 0, "ocupacion_maxima": 0}}
+    limites_dt.append(min(momento, fin))
+
+    ocupacion_inicial, llegadas, salidas = _eventos_ocupacion(db, limites_dt[0], limites_dt[-1], zona)
+    limites = [(m - _EPOCA).total_seconds() for m in limites_dt]
+    acumulado = _barrido(ocupacion_inicial, limites, llegadas, salidas, capacidad)
+
+    intervalos = []
+    for desde, hasta, (area, maxima, lleno) in zip(limites_dt, limites_dt[1:], acumulado):
+        segundos = (hasta - desde).total_seconds()
+        intervalos.append({
+            "inicio": desde.isoformat(),
+            "ocupacion_promedio": round(area / segundos, 2) if segundos else 0,
+            "ocupacion_maxima": maxima,
+            "espacio_horas": round(area / 3600, 2),
+            "minutos_lleno": round(lleno / 60, 1),
+        })
+    return {
+        "intervalos": intervalos,
+        "totales": {
+            "espacio_horas": round(sum(a for a, _, _ in acumulado) / 3600, 2),
+            "minutos_lleno": round(sum(l for _, _, l in acumulado) / 60, 1),
+            "ocupacion_maxima": max(m for _, m, _ in acumulado),
+        },
+    }
+
+
+# ============ PERCENTILES DE ESTADÍA (SKETCHES KLL) ============
+# Cada salida deja su duración en estadia_pendiente (crud.sumar_a_cuantiles) y
+# crud.compactar_cuantiles la agrega en segundo plano a los sketches de su día
+# de llegada, por zona y por espacio. Los percentiles de un rango unen los
+# sketches de sus días y las duraciones todavía pendientes: no se vuelven a
+# leer las asignaciones.
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def _dia(db: Session, columna):
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(columna, Date)
+    return func.date(columna)
+
+def _lista_de_valores(db: Session, valor):
+    """Valores del grupo separados por comas (string_agg / group_concat)"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.string_agg(cast(func.round(cast(valor, Numeric), 1), String), ",")
+    return func.group_concat(func.round(valor, 1), ",")
+
+def _como_fecha(valor) -> date:
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+
+def reconstruir_cuantiles(db: Session, desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """
+    Recalcular los sketches de duración de los días [desde, hasta] (sin
+    límites: todos) desde las tablas de origen. Las duraciones de cada grupo
+    llegan juntas desde la base (GROUP BY) y se escriben de a lotes, sin
+    tener todo el historial en memoria. No hace commit. Devuelve los días-zona escritos.
+    """
+    fecha_inicio, fecha_fin = _limites(desde, hasta)
+    escritos = 0
+    # Las duraciones pendientes de esos días ya quedan en los sketches recalculados
+    pendiente = models.EstadiaPendiente.__table__
+    borrar = delete(pendiente)
+    if desde:
+        borrar = borrar.where(pendiente.c.dia >= desde)
+    if hasta:
+        borrar = borrar.where(pendiente.c.dia <= hasta)
+    db.execute(borrar)
+
+    for modelo, columna in ((models.CuantilesEstadiaDiarios, "zona"), (models.CuantilesEstadiaEspacio, "id_de_espacio")):
+        tabla = modelo.__table__
+        borrar = delete(tabla)
+        if desde:
+            borrar = borrar.where(tabla.c.dia >= desde)
+        if hasta:
+            borrar = borrar.where(tabla.c.dia <= hasta)
+        db.execute(borrar)
+
+        asignaciones = archive.seleccion_rango(db, "asignacion", fecha_inicio, fecha_fin, None)
+        segundos = _segundos_entre(db, asignaciones.c.hora_asignado, asignaciones.c.hora_liberado)
+        dia = _dia(db, asignaciones.c.hora_asignado).label("dia")
+        clave = asignaciones.c[columna]
+        resultado = db.execute(
+            select(dia, clave, func.max(asignaciones.c.zona), _lista_de_valores(db, segundos))
+            .where(asignaciones.c.hora_liberado != None, asignaciones.c.hora_liberado > asignaciones.c.hora_asignado)
+            .group_by(dia, clave),
+            execution_options={"yield_per": 1000}
+        )
+        for lote in resultado.partitions():
+            filas = []
+            for dia_grupo, valor, zona, valores in lote:
+                sketch = SketchKLL()
+                sketch.agregar_varios(float(v) for v in valores.split(","))
+                fila = {"dia": _como_fecha(dia_grupo), columna: valor, "estadias": sketch.n, "sketch": sketch.a_json()}
+                if columna != "zona":
+                    fila["zona"] = zona
+                filas.append(fila)
+            db.execute(insert(tabla), filas)
+            if columna == "zona":
+                escritos += len(filas)
+    return escritos
+
+
+def _percentiles(sketch: SketchKLL) -> dict:
+    """Cantidad de estadías y p50/p90/p99 en minutos (1 decimal)"""
+    valores = sketch.cuantiles(PERCENTILES)
+    return {
+        "estadias": sketch.n,
+        **{f"p{round(q * 100)}_minutos": round(v / 60, 1) if v is not None else None for q, v in valores.items()},
+    }
+
+
+def percentiles_estadia(
+    db: Session,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    zona: Optional[str] = None,
+    agrupar: Optional[str] = None
+) -> dict:
+    """
+    Percentiles de duración de las estadías que llegaron en el rango, uniendo
+    los sketches diarios y las duraciones pendientes de compactar: del total
+    y, según agrupar, por día ("dia") o por espacio ("espacio")
+    """
+    pendiente = models.EstadiaPendiente.__table__
+    espacio = models.Espacio.__table__
+    consulta = (
+        select(pendiente.c.dia, pendiente.c.id_de_espacio, espacio.c.numero_de_espacio, pendiente.c.zona,
+               pendiente.c.segundos)
+        .outerjoin(espacio, espacio.c.id == pendiente.c.id_de_espacio)
+        .where(pendiente.c.dia >= fecha_inicio.date(), pendiente.c.dia <= fecha_fin.date())
+    )
+    if zona:
+        consulta = consulta.where(pendiente.c.zona == zona)
+    pendientes = db.execute(consulta).all()
+
+    diarios = models.CuantilesEstadiaDiarios.__table__
+    consulta = select(diarios.c.dia, diarios.c.sketch).where(
+        diarios.c.dia >= fecha_inicio.date(), diarios.c.dia <= fecha_fin.date()
+    )
+    if zona:
+        consulta = consulta.where(diarios.c.zona == zona)
+
+    total = SketchKLL()
+    por_dia: Dict[date, SketchKLL] = {}
+    for dia, texto in db.execute(consulta.order_by(diarios.c.dia)):
+        sketch = SketchKLL.desde_json(texto)
+        total.unir(sketch)
+        if agrupar == "dia":
+            por_dia.setdefault(dia, SketchKLL()).unir(sketch)
+    total.agregar_varios(fila.segundos for fila in pendientes)
+    resultado = {"total": _percentiles(total)}
+
+    if agrupar == "dia":
+        for fila in pendientes:
+            por_dia.setdefault(fila.dia, SketchKLL()).agregar(fila.segundos)
+        resultado["por_dia"] = [
+            {"fecha": dia.isoformat(), **_percentiles(por_dia[dia])} for dia in sorted(por_dia)
+        ]
+
+    elif agrupar == "espacio":
+        por_espacio = models.CuantilesEstadiaEspacio.__table__
+        consulta = (
+            select(por_espacio.c.id_de_espacio, espacio.c.numero_de_espacio, por_espacio.c.zona, por_espacio.c.sketch)
+            .outerjoin(espacio, espacio.c.id == por_espacio.c.id_de_espacio)
+            .where(por_espacio.c.dia >= fecha_inicio.date(), por_espacio.c.dia <= fecha_fin.date())
+        )
+        if zona:
+            consulta = consulta.where(por_espacio.c.zona == zona)
+        # Ordenadas por espacio: se une un espacio a la vez
+        espacios = []
+        actual = None
+        for espacio_id, numero, zona_espacio, texto in db.execute(
+            consulta.order_by(por_espacio.c.id_de_espacio), execution_options={"yield_per": 5000}
+        ):
+            if actual is None or actual[0] != espacio_id:
+                actual = (espacio_id, numero, zona_espacio, SketchKLL())
+                espacios.append(actual)
+            actual[3].unir(SketchKLL.desde_json(texto))
+        if pendientes:
+            por_id = {actual[0]: actual for actual in espacios}
+            for fila in pendientes:
+                if fila.id_de_espacio not in por_id:
+                    por_id[fila.id_de_espacio] = (fila.id_de_espacio, fila.numero_de_espacio, fila.zona, SketchKLL())
+                por_id[fila.id_de_espacio][3].agregar(fila.segundos)
+            espacios = [por_id[espacio_id] for espacio_id in sorted(por_id)]
+        resultado["por_espacio"] = [
+            {"id_de_espacio": espacio_id, "numero_de_espacio": numero, "zona": zona_espacio, **_percentiles(sketch)}
+            for espacio_id, numero, zona_espacio, sketch in espacios
+        ]
+    return resultado
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal, engine
+    from app.migrations import migrar
+
+    parser = argparse.ArgumentParser(description="Recalcular los resúmenes por día y hora y los percentiles de estadía")
+    parser.add_argument("--desde", type=date.fromisoformat, help="primer día (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="último día (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    migrar(engine)
+    db = SessionLocal()
+    try:
+        horas = reconstruir_resumenes(db, args.desde, args.hasta)
+        dias = reconstruir_cuantiles(db, args.desde, args.hasta)
+        db.commit()
+        print(f"✅ Resúmenes recalculados: {horas} horas con actividad")
+        print(f"✅ Percentiles de estadía recalculados: {dias} días por zona")
+    finally:
+        db.close()
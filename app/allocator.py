@@ -0,0 +1,139 @@
+import heapq
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app import models
+
+# Pools de espacios: "si" = reservados, "no" = no reservados
+POOLS = ("si", "no")
+
+# Segundos mínimos entre recargas de una zona cuando su pool está vacío
+ASIGNADOR_RECARGA_SEGUNDOS = float(os.getenv("ASIGNADOR_RECARGA_SEGUNDOS", "2"))
+
+
+def pool_de(reservado: str) -> str:
+    return "si" if reservado == "si" else "no"
+
+
+class AsignadorEspacios:
+    """
+    Asignador de espacios libres residente en memoria.
+
+    Mantiene un min-heap por zona y pool (reservado / no reservado) ordenado
+    por numero_de_espacio, de modo que tomar o devolver un espacio cuesta
+    O(log n) en lugar de un SELECT sobre la tabla espacio, y una zona llena no
+    afecta a las demás.
+
+    La base de datos sigue siendo la fuente de verdad: los heaps se reconstruyen
+    desde la tabla al iniciar (o en el primer uso) y las entradas obsoletas se
+    descartan de forma perezosa al sacarlas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heaps: Dict[Tuple[str, str], List[Tuple[int, int]]] = defaultdict(list)
+        self._libres: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self._cargado = False
+        self._recargas: Dict[str, float] = {}  # zona -> time.monotonic() de su última recarga
+        self._carga_total = float("-inf")
+
+    def cargar(self, db: Session, zona: Optional[str] = None):
+        """Reconstruir los pools desde la tabla espacio (todas las zonas o solo una)"""
+        query = db.query(
+            models.Espacio.id,
+            models.Espacio.numero_de_espacio,
+            models.Espacio.reservado,
+            models.Espacio.zona
+        ).filter(models.Espacio.estado == "libre")
+        if zona is not None:
+            query = query.filter(models.Espacio.zona == zona)
+
+        heaps = defaultdict(list)
+        libres = defaultdict(set)
+        for espacio_id, numero, reservado, zona_espacio in query.all():
+            clave = (zona_espacio, pool_de(reservado))
+            heaps[clave].append((numero, espacio_id))
+            libres[clave].add(espacio_id)
+        for heap in heaps.values():
+            heapq.heapify(heap)
+
+        with self._lock:
+            if zona is None:
+                self._heaps = heaps
+                self._libres = libres
+                self._cargado = True
+                self._carga_total = time.monotonic()
+            else:
+                self._recargas[zona] = time.monotonic()
+                for pool in POOLS:
+                    clave = (zona, pool)
+                    if clave in heaps or clave in self._heaps:
+                        self._heaps[clave] = heaps.get(clave, [])
+                        self._libres[clave] = libres.get(clave, set())
+
+    def _asegurar_cargado(self, db: Session):
+        if not self._cargado:
+            self.cargar(db)
+
+    def disponibles(self, db: Session, reservado: str, zona: str = models.ZONA_POR_DEFECTO) -> int:
+        """
+        Cantidad de espacios libres en el pool de la zona.
+        Si el pool está vacío se recarga esa zona desde la base de datos, por si
+        otro proceso liberó espacios, pero a lo sumo una vez cada
+        ASIGNADOR_RECARGA_SEGUNDOS: un pool vacío es una zona llena, y cada
+        rechazo no debe pagar un SELECT.
+        """
+        self._asegurar_cargado(db)
+        with self._lock:
+            cantidad = len(self._libres.get((zona, reservado), ()))
+            ahora = time.monotonic()
+            ultima = max(self._recargas.get(zona, float("-inf")), self._carga_total)
+            recargar = cantidad == 0 and ahora - ultima >= ASIGNADOR_RECARGA_SEGUNDOS
+            if recargar:
+                # Reservar la recarga: los pedidos simultáneos no la repiten
+                self._recargas[zona] = ahora
+        if recargar:
+            self.cargar(db, zona)
+            with self._lock:
+                cantidad = len(self._libres.get((zona, reservado), ()))
+        return cantidad
+
+    def tomar(self, db: Session, reservado: str, zona: str = models.ZONA_POR_DEFECTO) -> Optional[int]:
+        """Sacar del pool el espacio libre con menor número. Devuelve su id o None"""
+        self._asegurar_cargado(db)
+        with self._lock:
+            heap = self._heaps.get((zona, reservado), [])
+            libres = self._libres.get((zona, reservado), set())
+            while heap:
+                _, espacio_id = heapq.heappop(heap)
+                if espacio_id in libres:
+                    libres.discard(espacio_id)
+                    return espacio_id
+        return None
+
+    def devolver(self, espacio):
+        """Volver a poner un espacio libre en su pool (acepta un Espacio o una fila con sus columnas)"""
+        clave = (espacio.zona, pool_de(espacio.reservado))
+        with self._lock:
+            if not self._cargado or espacio.id in self._libres[clave]:
+                return
+            heapq.heappush(self._heaps[clave], (espacio.numero_de_espacio, espacio.id))
+            self._libres[clave].add(espacio.id)
+
+    def descartar(self, espacio_id: int):
+        """Quitar un espacio de los pools (la entrada del heap se ignora al sacarla)"""
+        with self._lock:
+            for libres in self._libres.values():
+                libres.discard(espacio_id)
+
+    def sincronizar(self, espacio: models.Espacio):
+        """Reflejar en los pools el estado actual de un espacio ya guardado"""
+        self.descartar(espacio.id)
+        if espacio.estado == "libre":
+            self.devolver(espacio)
+
+
+asignador = AsignadorEspacios()
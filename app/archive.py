@@ -0,0 +1,290 @@
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import (
+    Column, Index, MetaData, Table, and_, delete, func, insert, inspect, or_, select, union_all
+)
+from sqlalchemy.orm import Session
+from app import models
+
+# ============================================================
+# ARCHIVO MENSUAL (separación caliente / frío)
+# ============================================================
+# Las asignaciones cerradas y los incidentes resueltos más antiguos que
+# ARCHIVO_ANTIGUEDAD_DIAS se mueven a tablas por mes (asignacion_archivo_AAAA_MM,
+# incidente_archivo_AAAA_MM). Las tablas calientes quedan con los datos
+# recientes y las filas abiertas; los reportes unen los meses archivados que
+# toca el rango consultado (registrados en archivo_mensual).
+
+ARCHIVO_ANTIGUEDAD_DIAS = int(os.getenv("ARCHIVO_ANTIGUEDAD_DIAS", "90"))
+# Cada cuántas horas la aplicación archiva en segundo plano (0 = nunca)
+ARCHIVO_INTERVALO_HORAS = float(os.getenv("ARCHIVO_INTERVALO_HORAS", "24"))
+
+# origen -> (tabla caliente, columna de fecha, columna de cierre)
+_ORIGENES = {
+    "asignacion": (models.Asignacion.__table__, "hora_asignado", "hora_liberado"),
+    "incidente": (models.Incidente.__table__, "hora_de_registro", "hora_de_solucion"),
+}
+
+_metadata_archivo = MetaData()
+
+
+def _primer_dia_del_mes(momento) -> date:
+    return date(momento.year, momento.month, 1)
+
+def _mes_siguiente(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def tabla_archivo(origen: str, mes: date) -> Table:
+    """Tabla de archivo de un origen y mes (mismas columnas, sin claves foráneas)"""
+    nombre = f"{origen}_archivo_{mes:%Y_%m}"
+    if nombre in _metadata_archivo.tables:
+        return _metadata_archivo.tables[nombre]
+    caliente, columna_fecha, _ = _ORIGENES[origen]
+    columnas = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+        for c in caliente.columns
+    ]
+    return Table(
+        nombre, _metadata_archivo, *columnas,
+        Index(f"ix_{nombre}_{columna_fecha}", columna_fecha),
+        Index(f"ix_{nombre}_zona_{columna_fecha}", "zona", columna_fecha),
+    )
+
+
+def tablas_en_rango(
+    db: Session,
+    origen: str,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None
+) -> List[Table]:
+    """Tablas de archivo cuyo mes se cruza con el rango (sin límites: todas)"""
+    query = db.query(models.ArchivoMensual.mes).filter(models.ArchivoMensual.origen == origen)
+    if fecha_inicio:
+        query = query.filter(models.ArchivoMensual.mes >= _primer_dia_del_mes(fecha_inicio))
+    if fecha_fin:
+        query = query.filter(models.ArchivoMensual.mes <= _primer_dia_del_mes(fecha_fin))
+    return [tabla_archivo(origen, mes) for (mes,) in query.order_by(models.ArchivoMensual.mes).all()]
+
+
+def eliminar_tablas_archivo(bind) -> int:
+    """
+    Borrar todas las tablas de archivo mensuales. No están en Base.metadata,
+    así que Base.metadata.drop_all no las toca: sin esto, una base reiniciada
+    seguiría uniendo a los reportes los meses archivados de antes. Se buscan
+    por nombre (también las vacías, que archivo_mensual no registra).
+    Devuelve la cantidad de tablas borradas.
+    """
+    patron = re.compile(rf"({'|'.join(_ORIGENES)})_archivo_(\d{{4}})_(\d{{2}})")
+    borradas = 0
+    for nombre in inspect(bind).get_table_names():
+        coincidencia = patron.fullmatch(nombre)
+        if coincidencia:
+            origen, anio, mes = coincidencia.groups()
+            tabla_archivo(origen, date(int(anio), int(mes), 1)).drop(bind=bind, checkfirst=True)
+            borradas += 1
+    return borradas
+
+
+# ============ ARCHIVAR ============
+def _condicion_archivable(origen: str, desde: datetime, hasta: datetime, id_maximo: int):
+    caliente, columna_fecha, columna_cierre = _ORIGENES[origen]
+    condicion = and_(
+        caliente.c[columna_cierre] != None,
+        caliente.c[columna_fecha] >= desde,
+        caliente.c[columna_fecha] < hasta,
+        # La fila con el id más alto se queda: SQLite reutilizaría su id
+        caliente.c.id < id_maximo,
+    )
+    if origen == "asignacion":
+        # Las asignaciones aún referenciadas por una Idempotency-Key se quedan
+        condicion = and_(condicion, caliente.c.id.notin_(
+            select(models.ClaveIdempotencia.asignacion_id).where(
+                models.ClaveIdempotencia.asignacion_id != None
+            )
+        ))
+    return condicion
+
+
+def archivar(db: Session, antiguedad_dias: int = ARCHIVO_ANTIGUEDAD_DIAS) -> Dict[str, int]:
+    """
+    Mover a las tablas de archivo las filas cerradas anteriores al corte.
+    Cada mes se copia y se borra en su propia transacción.
+    Devuelve la cantidad de filas archivadas por origen.
+    """
+    corte = (datetime.now() - timedelta(days=antiguedad_dias)).replace(hour=0, minute=0, second=0, microsecond=0)
+    archivadas = {}
+
+    for origen, (caliente, columna_fecha, columna_cierre) in _ORIGENES.items():
+        archivadas[origen] = 0
+        id_maximo = db.execute(select(func.max(caliente.c.id))).scalar()
+        primera = db.execute(
+            select(func.min(caliente.c[columna_fecha])).where(
+                caliente.c[columna_cierre] != None,
+                caliente.c[columna_fecha] < corte
+            )
+        ).scalar()
+        if primera is None:
+            continue
+
+        mes = _primer_dia_del_mes(primera)
+        while datetime.combine(mes, datetime.min.time()) < corte:
+            desde = datetime.combine(mes, datetime.min.time())
+            hasta = min(datetime.combine(_mes_siguiente(mes), datetime.min.time()), corte)
+            condicion = _condicion_archivable(origen, desde, hasta, id_maximo)
+
+            tabla = tabla_archivo(origen, mes)
+            tabla.create(bind=db.connection(), checkfirst=True)
+            ultimo_cierre = db.execute(select(func.max(caliente.c[columna_cierre])).where(condicion)).scalar()
+            nombres = [c.name for c in caliente.columns]
+            db.execute(insert(tabla).from_select(nombres, select(*[caliente.c[n] for n in nombres]).where(condicion)))
+            filas = db.execute(delete(caliente).where(condicion)).rowcount
+
+            if filas:
+                registro = db.get(models.ArchivoMensual, (origen, mes))
+                if registro is None:
+                    registro = models.ArchivoMensual(origen=origen, mes=mes, tabla=tabla.name, filas=0)
+                    db.add(registro)
+                registro.filas += filas
+                if registro.ultimo_cierre is None or ultimo_cierre > registro.ultimo_cierre:
+                    registro.ultimo_cierre = ultimo_cierre
+                registro.actualizado = datetime.now()
+                archivadas[origen] += filas
+            db.commit()
+            mes = _mes_siguiente(mes)
+
+    print(f"📦 Archivo: {archivadas['asignacion']} asignaciones y {archivadas['incidente']} incidentes "
+          f"anteriores al {corte.date().isoformat()}")
+    return archivadas
+
+
+# ============ CONSULTAS (tabla caliente + archivo) ============
+def consultas_rango(db: Session, origen: str, fecha_inicio, fecha_fin, zona, filtro=None, con_espacio=False):
+    """
+    Un SELECT por tabla: los meses archivados del rango (del más antiguo al
+    más reciente) y al final la tabla caliente, con las columnas de la tabla
+    (y numero_de_espacio si con_espacio)
+    """
+    caliente, columna_fecha, _ = _ORIGENES[origen]
+    nombres = [c.name for c in caliente.columns]
+    espacio = models.Espacio.__table__
+    partes = []
+    for tabla in tablas_en_rango(db, origen, fecha_inicio, fecha_fin) + [caliente]:
+        columnas = [tabla.c[n] for n in nombres]
+        if con_espacio:
+            columnas.append(espacio.c.numero_de_espacio)
+        consulta = select(*columnas)
+        if con_espacio:
+            consulta = consulta.outerjoin(espacio, espacio.c.id == tabla.c.id_de_espacio)
+        if fecha_inicio:
+            consulta = consulta.where(tabla.c[columna_fecha] >= fecha_inicio)
+        if fecha_fin:
+            consulta = consulta.where(tabla.c[columna_fecha] <= fecha_fin)
+        if zona:
+            consulta = consulta.where(tabla.c.zona == zona)
+        if filtro is not None:
+            consulta = consulta.where(filtro(tabla))
+        partes.append(consulta)
+    return partes
+
+
+def seleccion_rango(db: Session, origen: str, fecha_inicio, fecha_fin, zona, filtro=None, con_espacio=False):
+    """
+    SELECT de la tabla caliente y de los meses archivados del rango, unidos con
+    UNION ALL. Devuelve un subquery con las columnas de la tabla (y
+    numero_de_espacio si con_espacio).
+    """
+    partes = consultas_rango(db, origen, fecha_inicio, fecha_fin, zona, filtro, con_espacio)
+    return (partes[0] if len(partes) == 1 else union_all(*partes)).subquery()
+
+
+def seleccion_abiertas_en(db: Session, origen: str, momento: datetime, zona):
+    """
+    Filas que empezaron antes de momento y seguían abiertas en ese momento
+    (sin cierre o cerradas después), unidas con UNION ALL. De los meses
+    archivados solo se leen los que tienen algún cierre posterior
+    (archivo_mensual.ultimo_cierre): una estadía larga obliga a leer su mes,
+    pero el resto del historial no se toca. En la tabla caliente las abiertas
+    y las cerradas después se piden por separado, así cada parte usa el índice
+    de la columna de cierre.
+    """
+    caliente, columna_fecha, columna_cierre = _ORIGENES[origen]
+    registro = models.ArchivoMensual
+    meses = db.query(registro.mes).filter(
+        registro.origen == origen,
+        registro.mes <= _primer_dia_del_mes(momento),
+        or_(registro.ultimo_cierre == None, registro.ultimo_cierre > momento)
+    ).order_by(registro.mes).all()
+
+    # Las filas archivadas están todas cerradas
+    tablas = [tabla_archivo(origen, mes) for (mes,) in meses]
+    condiciones = [(tabla, tabla.c[columna_cierre] > momento) for tabla in tablas] + [
+        (caliente, caliente.c[columna_cierre] == None),
+        (caliente, caliente.c[columna_cierre] > momento),
+    ]
+    partes = []
+    for tabla, cierre in condiciones:
+        consulta = select(tabla).where(tabla.c[columna_fecha] < momento, cierre)
+        if zona:
+            consulta = consulta.where(tabla.c.zona == zona)
+        partes.append(consulta)
+    return union_all(*partes).subquery()
+
+
+def _filtro_tipos(tipos=None, excluir_tipos=None):
+    if not tipos and not excluir_tipos:
+        return None
+    def filtro(tabla):
+        condiciones = []
+        if tipos:
+            condiciones.append(tabla.c.tipo_de_incidente.in_(tipos))
+        if excluir_tipos:
+            condiciones.append(tabla.c.tipo_de_incidente.notin_(excluir_tipos))
+        return and_(*condiciones)
+    return filtro
+
+
+def incidentes_en_rango(
+    db: Session,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    zona: Optional[str] = None,
+    tipos: Optional[List[str]] = None,
+    excluir_tipos: Optional[List[str]] = None
+):
+    """Incidentes por hora_de_registro, más recientes primero, con numero_de_espacio"""
+    subquery = seleccion_rango(
+        db, "incidente", fecha_inicio, fecha_fin, zona, _filtro_tipos(tipos, excluir_tipos), con_espacio=True
+    )
+    return db.execute(select(subquery).order_by(subquery.c.hora_de_registro.desc())).all()
+
+
+def contar_incidentes(
+    db: Session,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    zona: Optional[str] = None,
+    tipos: Optional[List[str]] = None,
+    excluir_tipos: Optional[List[str]] = None
+) -> int:
+    subquery = seleccion_rango(db, "incidente", fecha_inicio, fecha_fin, zona, _filtro_tipos(tipos, excluir_tipos))
+    return db.execute(select(func.count()).select_from(subquery)).scalar() or 0
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal, engine
+    from app.migrations import migrar
+
+    parser = argparse.ArgumentParser(description="Archivar asignaciones cerradas e incidentes resueltos")
+    parser.add_argument("--dias", type=int, default=ARCHIVO_ANTIGUEDAD_DIAS, help="antigüedad mínima en días")
+    args = parser.parse_args()
+
+    migrar(engine)
+    db = SessionLocal()
+    try:
+        archivar(db, args.dias)
+    finally:
+        db.close()
@@ -1,9 +1,17 @@
+import os
+import random
 import pytz
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
-from datetime import datetime
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, and_, or_, case, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from collections import defaultdict
 from typing import List, Optional
-from app import models, schemas
+from app import aggregates, archive, models, report_memo, schemas
+from app.allocator import asignador, POOLS, pool_de
+from app.idempotency import TTL_CLAVES
+from app.report_cache import marcar_cambio
+from app.sketches import SketchKLL
 
 # ============ ADMIN ============
 def create_admin(db: Session, admin: schemas.AdminCreate):
@@ -73,10 +81,17 @@ def delete_usuario_reserva(db: Session, ci: int):
 
 # ============ ESPACIOS ============
 def create_espacio(db: Session, espacio: schemas.EspacioCreate):
-    db_espacio = models.Espacio(**espacio.model_dump())
+    datos = espacio.model_dump()
+    datos["zona"] = datos.get("zona") or models.ZONA_POR_DEFECTO
+    db_espacio = models.Espacio(**datos)
     db.add(db_espacio)
+    ajustar_contador(
+        db, db_espacio.zona, db_espacio.reservado,
+        total=1, ocupados=1 if db_espacio.estado == "ocupado" else 0
+    )
     db.commit()
     db.refresh(db_espacio)
+    asignador.sincronizar(db_espacio)
     return db_espacio
 
 def get_espacio(db: Session, espacio_id: int):
@@ -85,38 +100,214 @@ def get_espacio(db: Session, espacio_id: int):
 def get_espacio_by_numero(db: Session, numero: int):
     return db.query(models.Espacio).filter(models.Espacio.numero_de_espacio == numero).first()
 
-def get_espacios(db: Session):
-    return db.query(models.Espacio).order_by(models.Espacio.numero_de_espacio).all()
+def get_espacios(db: Session, zona: Optional[str] = None):
+    query = db.query(models.Espacio)
+    if zona:
+        query = query.filter(models.Espacio.zona == zona)
+    return query.order_by(models.Espacio.numero_de_espacio).all()
 
-def get_espacios_disponibles(db: Session, solo_no_reservados: bool = False):
+def get_espacios_disponibles(db: Session, solo_no_reservados: bool = False, zona: Optional[str] = None):
     """
     Obtener espacios disponibles.
     Si solo_no_reservados=True, solo devuelve espacios libres y no reservados (para usuarios normales)
     Si solo_no_reservados=False, devuelve todos los espacios libres
+    Si se indica zona, solo los de esa zona
     """
     query = db.query(models.Espacio).filter(models.Espacio.estado == "libre")
+    if zona:
+        query = query.filter(models.Espacio.zona == zona)
     if solo_no_reservados:
         query = query.filter(models.Espacio.reservado == "no")
     return query.all()
 
+def get_zonas(db: Session):
+    """Zonas existentes, desde los contadores de ocupación"""
+    return [
+        zona for (zona,) in db.query(models.ContadorOcupacion.zona).distinct().order_by(
+            models.ContadorOcupacion.zona
+        ).all()
+    ]
+
 def update_espacio(db: Session, espacio_id: int, espacio_update: schemas.EspacioUpdate):
     espacio = get_espacio(db, espacio_id)
-    if espacio:
-        if espacio_update.estado:
-            espacio.estado = espacio_update.estado
-        if espacio_update.reservado:
-            espacio.reservado = espacio_update.reservado
-        db.commit()
-        db.refresh(espacio)
+    while espacio:
+        estado_anterior, reservado_anterior, zona_anterior = espacio.estado, espacio.reservado, espacio.zona
+        estado = espacio_update.estado or estado_anterior
+        reservado = espacio_update.reservado or reservado_anterior
+        zona = espacio_update.zona or zona_anterior
+        
+        # UPDATE condicional: si el espacio cambió desde que se leyó (p. ej. un
+        # reclamo concurrente) se vuelve a leer, para no desajustar los contadores
+        filas = db.query(models.Espacio).filter(
+            models.Espacio.id == espacio_id,
+            models.Espacio.estado == estado_anterior,
+            models.Espacio.reservado == reservado_anterior,
+            models.Espacio.zona == zona_anterior
+        ).update({"estado": estado, "reservado": reservado, "zona": zona}, synchronize_session=False)
+        
+        if filas == 1:
+            if ajustar_contador(
+                db, zona_anterior, reservado_anterior,
+                total=-1, ocupados=-1 if estado_anterior == "ocupado" else 0
+            ):
+                ajustar_contador(
+                    db, zona, reservado,
+                    total=1, ocupados=1 if estado == "ocupado" else 0
+                )
+            db.commit()
+            db.refresh(espacio)
+            asignador.sincronizar(espacio)
+            break
+        
+        db.rollback()
+        espacio = get_espacio(db, espacio_id)
     return espacio
 
+def desocupar_espacio(db: Session, espacio: models.Espacio) -> bool:
+    """
+    Pasar un espacio de "ocupado" a "libre" con un UPDATE condicional y
+    descontarlo de los contadores. Devuelve False si ya estaba libre. No hace commit.
+    """
+    filas = db.query(models.Espacio).filter(
+        models.Espacio.id == espacio.id,
+        models.Espacio.estado == "ocupado",
+        models.Espacio.reservado == espacio.reservado,
+        models.Espacio.zona == espacio.zona
+    ).update({"estado": "libre"}, synchronize_session=False)
+    if filas == 1:
+        ajustar_contador(db, espacio.zona, espacio.reservado, ocupados=-1)
+    return filas == 1
+
+
+# ============ CONTADORES DE OCUPACIÓN ============
+# Filas por zona y pool (ver models.ContadorOcupacion)
+CONTADOR_FRAGMENTOS = max(int(os.getenv("CONTADOR_FRAGMENTOS", "8")), 1)
+
+def _contar_espacios(db: Session, zona: Optional[str] = None):
+    """Contar espacios por zona y pool directamente desde la tabla espacio"""
+    db.flush()
+    query = db.query(
+        models.Espacio.zona,
+        models.Espacio.reservado,
+        func.count(models.Espacio.id),
+        func.sum(case((models.Espacio.estado == "ocupado", 1), else_=0))
+    )
+    if zona is not None:
+        query = query.filter(models.Espacio.zona == zona)
+    filas = query.group_by(models.Espacio.zona, models.Espacio.reservado).all()
+    
+    conteo = {}
+    if zona is not None:
+        conteo[zona] = {pool: {"total": 0, "ocupados": 0} for pool in POOLS}
+    for zona_espacio, reservado, total, ocupados in filas:
+        por_pool = conteo.setdefault(zona_espacio, {pool: {"total": 0, "ocupados": 0} for pool in POOLS})
+        por_pool[pool_de(reservado)]["total"] += total
+        por_pool[pool_de(reservado)]["ocupados"] += ocupados or 0
+    return conteo
+
+def recalcular_contadores(db: Session, zona: Optional[str] = None):
+    """
+    Reconstruir los contadores de ocupación desde la tabla espacio (todas las
+    zonas o solo una). Se usa al iniciar y cuando faltan contadores. No hace commit.
+    """
+    conteo = _contar_espacios(db, zona)
+    query = db.query(models.ContadorOcupacion)
+    if zona is not None:
+        query = query.filter(models.ContadorOcupacion.zona == zona)
+    query.delete(synchronize_session=False)
+    marcar_cambio(db)
+    # El conteo queda en el fragmento 0 y los demás empiezan en cero
+    db.add_all([
+        models.ContadorOcupacion(
+            zona=zona_espacio, reservado=pool, fragmento=fragmento,
+            **(valores if fragmento == 0 else {"total": 0, "ocupados": 0})
+        )
+        for zona_espacio, por_pool in conteo.items()
+        for pool, valores in por_pool.items()
+        for fragmento in range(CONTADOR_FRAGMENTOS)
+    ])
+    db.flush()
+
+def ajustar_contador(db: Session, zona: str, reservado: str, total: int = 0, ocupados: int = 0) -> bool:
+    """
+    Sumar/restar a los contadores de una zona y pool dentro de la transacción
+    actual, en un fragmento al azar (solo se bloquea esa fila).
+    Devuelve False si los contadores de la zona no existían y se recalcularon
+    desde la tabla (el recálculo ya incluye los cambios hechos en esta transacción).
+    """
+    filas = db.query(models.ContadorOcupacion).filter(
+        models.ContadorOcupacion.zona == zona,
+        models.ContadorOcupacion.reservado == pool_de(reservado),
+        models.ContadorOcupacion.fragmento == random.randrange(CONTADOR_FRAGMENTOS)
+    ).update({
+        models.ContadorOcupacion.total: models.ContadorOcupacion.total + total,
+        models.ContadorOcupacion.ocupados: models.ContadorOcupacion.ocupados + ocupados
+    }, synchronize_session=False)
+    marcar_cambio(db)
+    if filas == 0:
+        # Contadores sin inicializar (o zona nueva): se recalculan incluyendo este cambio
+        recalcular_contadores(db, zona)
+        return False
+    return True
+
+def _ajustar_contadores(db: Session, deltas: dict):
+    """Aplicar ajustes acumulados {(zona, pool): ocupados} de una operación masiva"""
+    for (zona, pool), ocupados in sorted(deltas.items()):
+        if ocupados:
+            ajustar_contador(db, zona, pool, ocupados=ocupados)
+
+def get_contadores(db: Session, zona: Optional[str] = None):
+    """
+    Obtener la ocupación actual en tiempo constante (suma los fragmentos de
+    los contadores por pool). Sin zona, suma todas las zonas.
+    """
+    query = db.query(models.ContadorOcupacion)
+    if zona is not None:
+        query = query.filter(models.ContadorOcupacion.zona == zona)
+    filas = query.all()
+    
+    conteo = {pool: {"total": 0, "ocupados": 0} for pool in POOLS}
+    if filas:
+        for c in filas:
+            conteo[c.reservado]["total"] += c.total
+            conteo[c.reservado]["ocupados"] += c.ocupados
+    else:
+        # Contadores sin inicializar: contar desde la tabla
+        for por_pool in _contar_espacios(db, zona).values():
+            for pool, valores in por_pool.items():
+                conteo[pool]["total"] += valores["total"]
+                conteo[pool]["ocupados"] += valores["ocupados"]
+    
+    reservados = conteo["si"]
+    no_reservados = conteo["no"]
+    return {
+        "total": reservados["total"] + no_reservados["total"],
+        "reservados": reservados["total"],
+        "no_reservados": no_reservados["total"],
+        "ocupados": reservados["ocupados"] + no_reservados["ocupados"],
+        "ocupados_reservados": reservados["ocupados"],
+        "ocupados_no_reservados": no_reservados["ocupados"],
+        "libres_reservados": reservados["total"] - reservados["ocupados"],
+        "libres_no_reservados": no_reservados["total"] - no_reservados["ocupados"],
+        "disponibles": (reservados["total"] - reservados["ocupados"]) + (no_reservados["total"] - no_reservados["ocupados"])
+    }
+
 
 # ============ ASIGNACIONES ============
-def create_asignacion(db: Session, ci: Optional[int] = None):
+def create_asignacion(
+    db: Session,
+    ci: Optional[int] = None,
+    clave: Optional[models.ClaveIdempotencia] = None,
+    zona: str = models.ZONA_POR_DEFECTO
+):
     """
-    Crear una nueva asignación de espacio.
-    - Si ci es None: usuario normal, buscar espacio libre NO reservado
-    - Si ci tiene valor: usuario con reserva, buscar espacio libre RESERVADO
+    Crear una nueva asignación de espacio en una zona.
+    - Si ci es None: usuario normal, tomar espacio libre NO reservado
+    - Si ci tiene valor: usuario con reserva, tomar espacio libre RESERVADO
+
+    El espacio se toma del asignador en memoria (sin escanear la tabla espacio),
+    se reclama con un UPDATE condicional y se devuelve al pool si el commit falla.
+    Si se pasa una clave de idempotencia reservada, se confirma junto con la asignación.
     """
     
     if ci:
@@ -124,79 +315,247 @@ def create_asignacion(db: Session, ci: Optional[int] = None):
         usuario = get_usuario_reserva(db, ci)
         if not usuario:
             return None  # Usuario no existe en tabla de reservas
-        
-        # Buscar espacio libre y reservado
-        espacio_disponible = db.query(models.Espacio).filter(
-            and_(
-                models.Espacio.estado == "libre",
-                models.Espacio.reservado == "si"
-            )
-        ).first()
-        
-        if not espacio_disponible:
-            return None  # No hay espacios reservados disponibles
-        
-        # Crear asignación con CI
-        db_asignacion = models.Asignacion(
-            ci_reserva=ci,
-            id_de_espacio=espacio_disponible.id
-        )
-        
+        pool = "si"
     else:
         # Usuario normal
-        # Buscar espacio libre y NO reservado
-        espacio_disponible = db.query(models.Espacio).filter(
-            and_(
-                models.Espacio.estado == "libre",
-                models.Espacio.reservado == "no"
-            )
-        ).first()
+        pool = "no"
+    
+    espacio_id = _reclamar_con_recarga(db, zona, pool)
+    if espacio_id is None:
+        return None  # No hay espacios disponibles
+    
+    db_asignacion = models.Asignacion(
+        ci_reserva=ci if ci else None,
+        id_de_espacio=espacio_id,
+        zona=zona,
+        hora_asignado=datetime.now()
+    )
+    
+    db.add(db_asignacion)
+    sumar_a_resumenes(db, [(db_asignacion.hora_asignado, zona, {"llegadas": 1})])
+    if clave is not None:
+        clave.asignacion = db_asignacion
+        clave.status_code = 200
+    _commit_asignaciones(db, [espacio_id])
+    db.refresh(db_asignacion)
+    return db_asignacion
+
+def create_asignaciones_lote(db: Session, solicitudes: List[schemas.AsignacionCreate]):
+    """
+    Crear varias asignaciones en una sola transacción (entradas con varias barreras).
+    Devuelve (ids, zonas_desconocidas): una lista paralela a solicitudes con el
+    id de la asignación creada, o None si la solicitud no se asignó, y las
+    zonas del lote que no tienen espacios. Como el 404 "Zona no encontrada" de
+    /solicitar, esas solicitudes no cuentan como rechazo. Los rechazos por
+    falta de espacio se registran en la misma transacción.
+    """
+    zonas_lote = {s.zona or models.ZONA_POR_DEFECTO for s in solicitudes}
+    zonas_desconocidas = zonas_lote - {
+        zona for (zona,) in db.query(models.Espacio.zona).filter(models.Espacio.zona.in_(zonas_lote)).distinct().all()
+    }
+    
+    cis_reserva = {s.ci for s in solicitudes if s.ci}
+    usuarios = set()
+    if cis_reserva:
+        usuarios = {
+            ci for (ci,) in db.query(models.UsuarioReserva.ci).filter(
+                models.UsuarioReserva.ci.in_(cis_reserva)
+            ).all()
+        }
+    
+    ahora = datetime.now()
+    resultados = []
+    reclamados = []
+    rechazados = []
+    agotados = set()
+    ocupados_por_pool = defaultdict(int)
+    for solicitud in solicitudes:
+        ci = solicitud.ci
+        zona = solicitud.zona or models.ZONA_POR_DEFECTO
+        if zona in zonas_desconocidas or (ci and ci not in usuarios):
+            resultados.append(None)  # Zona sin espacios, o usuario que no existe en tabla de reservas
+            continue
         
-        if not espacio_disponible:
-            return None  # No hay espacios disponibles
+        pool = "si" if ci else "no"
+        espacio_id = None
+        if (zona, pool) not in agotados:
+            espacio_id = _reclamar_con_recarga(db, zona, pool, contar=False)
+        if espacio_id is None:
+            # Pool agotado: el resto del lote para este pool se rechaza sin consultar
+            agotados.add((zona, pool))
+            resultados.append(None)
+            rechazados.append((ci, zona))
+            continue
         
-        # Crear asignación sin CI
         db_asignacion = models.Asignacion(
-            ci_reserva=None,
-            id_de_espacio=espacio_disponible.id
+            ci_reserva=ci if ci else None,
+            id_de_espacio=espacio_id,
+            zona=zona,
+            hora_asignado=ahora
         )
+        db.add(db_asignacion)
+        reclamados.append(espacio_id)
+        ocupados_por_pool[(zona, pool)] += 1
+        resultados.append(db_asignacion)
     
-    # Actualizar estado del espacio a ocupado
-    espacio_disponible.estado = "ocupado"
+    # Un solo ajuste de contadores por zona y pool para todo el lote
+    _ajustar_contadores(db, ocupados_por_pool)
+    llegadas_por_zona = defaultdict(int)
+    for (zona, _), cantidad in ocupados_por_pool.items():
+        llegadas_por_zona[zona] += cantidad
+    sumar_a_resumenes(db, [(ahora, zona, {"llegadas": n}) for zona, n in llegadas_por_zona.items()])
     
-    db.add(db_asignacion)
-    db.commit()
-    db.refresh(db_asignacion)
-    return db_asignacion
+    for zona in {zona for _, zona in rechazados}:
+        registrar_rechazos(db, [ci for ci, z in rechazados if z == zona], zona)
+    db.flush()
+    ids = [a.id if a is not None else None for a in resultados]
+    _commit_asignaciones(db, reclamados)
+    return ids, zonas_desconocidas
+
+def _reclamar_siguiente(db: Session, zona: str, pool: str, contar: bool = True) -> Optional[int]:
+    """
+    Tomar el espacio libre de menor número del pool y reclamarlo con un
+    UPDATE condicional: solo una transacción puede pasar el espacio de
+    "libre" a "ocupado", aunque otro proceso tenga el mismo candidato.
+    """
+    while True:
+        candidato = asignador.tomar(db, pool, zona)
+        if candidato is None:
+            return None
+        if reclamar_espacio(db, candidato, zona, pool, contar=contar):
+            return candidato
+        # Si no se pudo reclamar, la entrada estaba obsoleta: probar el siguiente
+
+def _reclamar_con_recarga(db: Session, zona: str, pool: str, contar: bool = True) -> Optional[int]:
+    """
+    _reclamar_siguiente, y si el pool quedó vacío, una vez más después de
+    recargar la zona (asignador.disponibles): otro proceso pudo liberar
+    espacios o tomar los que este tenía en memoria
+    """
+    espacio_id = _reclamar_siguiente(db, zona, pool, contar=contar)
+    if espacio_id is None and asignador.disponibles(db, pool, zona) > 0:
+        espacio_id = _reclamar_siguiente(db, zona, pool, contar=contar)
+    return espacio_id
+
+def _commit_asignaciones(db: Session, espacios_reclamados: List[int]):
+    """Confirmar la transacción; si falla, devolver los espacios reclamados al asignador"""
+    try:
+        db.commit()
+    except IntegrityError:
+        # Algún espacio ya tenía una asignación activa: no volver a ofrecerlos
+        # hasta la próxima recarga del asignador
+        db.rollback()
+        for espacio_id in espacios_reclamados:
+            asignador.descartar(espacio_id)
+        raise
+    except Exception:
+        db.rollback()
+        for espacio_id in espacios_reclamados:
+            espacio = get_espacio(db, espacio_id)
+            if espacio:
+                asignador.sincronizar(espacio)
+        raise
+
+def registrar_rechazos(db: Session, cis: List[Optional[int]], zona: str = models.ZONA_POR_DEFECTO):
+    """
+    Registrar solicitudes rechazadas por falta de espacio sumándolas al
+    contador del minuto actual (un upsert por pool, no una fila por rechazo).
+    No hace commit.
+    """
+    por_pool = defaultdict(int)
+    for ci in cis:
+        por_pool["si" if ci else "no"] += 1
+    if not por_pool:
+        return
+    
+    minuto = datetime.now().replace(second=0, microsecond=0)
+    tabla = models.RechazoPorMinuto.__table__
+    stmt = _insert_dialecto(db)(tabla).values([
+        {"minuto": minuto, "zona": zona, "reservado": pool, "cantidad": cantidad}
+        for pool, cantidad in por_pool.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[tabla.c.minuto, tabla.c.zona, tabla.c.reservado],
+        set_={"cantidad": tabla.c.cantidad + stmt.excluded.cantidad}
+    ))
+    sumar_a_resumenes(db, [(minuto, zona, {"rechazos": sum(por_pool.values())})])
+
+def _insert_dialecto(db: Session):
+    """INSERT con soporte de ON CONFLICT según el motor (SQLite o PostgreSQL)"""
+    # Importados aquí: el dialecto postgresql no se carga si no se usa
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def reclamar_espacio(db: Session, espacio_id: int, zona: str, reservado: str, contar: bool = True) -> bool:
+    """
+    Marcar un espacio como ocupado solo si sigue libre y en el pool esperado.
+    Es una única sentencia UPDATE ... WHERE estado = 'libre': devuelve True si
+    esta transacción ganó el espacio. No hace commit.
+    Con contar=False el llamador ajusta los contadores de ocupación por su cuenta.
+    """
+    filas = db.query(models.Espacio).filter(
+        models.Espacio.id == espacio_id,
+        models.Espacio.estado == "libre",
+        models.Espacio.reservado == reservado,
+        models.Espacio.zona == zona
+    ).update({"estado": "ocupado"}, synchronize_session=False)
+    if filas == 1 and contar:
+        ajustar_contador(db, zona, reservado, ocupados=1)
+    return filas == 1
+
+def _query_asignaciones(db: Session):
+    """
+    Asignaciones con el espacio y el usuario con reserva que devuelve
+    AsignacionResponse, cargados en la misma consulta (JOIN) y no con una
+    consulta perezosa por fila
+    """
+    return db.query(models.Asignacion).options(
+        joinedload(models.Asignacion.espacio, innerjoin=True),
+        joinedload(models.Asignacion.usuario_reserva)
+    )
 
 def get_asignacion(db: Session, asignacion_id: int):
-    return db.query(models.Asignacion).filter(models.Asignacion.id == asignacion_id).first()
+    return _query_asignaciones(db).filter(models.Asignacion.id == asignacion_id).first()
 
-def get_asignaciones_activas(db: Session):
-    return db.query(models.Asignacion).filter(
+def get_asignaciones_activas(db: Session, zona: Optional[str] = None):
+    query = _query_asignaciones(db).filter(
         models.Asignacion.hora_liberado == None
-    ).all()
+    )
+    if zona:
+        query = query.filter(models.Asignacion.zona == zona)
+    return query.all()
 
-def get_asignaciones_by_date_range(db: Session, fecha_inicio: datetime, fecha_fin: datetime):
-    return db.query(models.Asignacion).filter(
+def get_asignaciones_by_date_range(db: Session, fecha_inicio: datetime, fecha_fin: datetime, zona: Optional[str] = None):
+    query = _query_asignaciones(db).filter(
         and_(
             models.Asignacion.hora_asignado >= fecha_inicio,
             models.Asignacion.hora_asignado <= fecha_fin
         )
-    ).all()
+    )
+    if zona:
+        query = query.filter(models.Asignacion.zona == zona)
+    return query.all()
 
 def liberar_asignacion(db: Session, asignacion_id: int):
     asignacion = get_asignacion(db, asignacion_id)
     if asignacion and not asignacion.hora_liberado:
         asignacion.hora_liberado = datetime.now()
+        sumar_a_resumenes(db, [_evento_cierre(asignacion.hora_asignado, asignacion.hora_liberado, asignacion.zona)])
+        sumar_a_cuantiles(db, [_estadia(asignacion)])
         
         # Liberar el espacio (cambiar estado a libre, mantener reservado como está)
         espacio = get_espacio(db, asignacion.id_de_espacio)
         if espacio:
-            espacio.estado = "libre"
+            desocupar_espacio(db, espacio)
         
         db.commit()
         db.refresh(asignacion)
+        
+        if espacio:
+            asignador.devolver(espacio)
     return asignacion
 
 def liberar_espacio(db: Session, espacio_id: int):
@@ -211,40 +570,395 @@ def liberar_espacio(db: Session, espacio_id: int):
     
     if asignacion:
         asignacion.hora_liberado = datetime.now()
+        sumar_a_resumenes(db, [_evento_cierre(asignacion.hora_asignado, asignacion.hora_liberado, asignacion.zona)])
+        sumar_a_cuantiles(db, [_estadia(asignacion)])
     
     # Actualizar estado del espacio
     espacio = get_espacio(db, espacio_id)
     if espacio:
-        espacio.estado = "libre"
+        desocupar_espacio(db, espacio)
         db.commit()
         db.refresh(espacio)
+        asignador.devolver(espacio)
     
     return espacio
 
 
+# Tolerancia para relojes de sensores adelantados: un evento con hora posterior
+# a ahora + SENSORES_TOLERANCIA_SEGUNDOS se descarta
+SENSORES_TOLERANCIA_SEGUNDOS = float(os.getenv("SENSORES_TOLERANCIA_SEGUNDOS", "60"))
+
+def aplicar_eventos_sensores(db: Session, eventos: List[schemas.EventoSensor]):
+    """
+    Aplicar un lote de eventos de sensores en una sola transacción.
+    - Descarta los eventos con hora futura (más allá de SENSORES_TOLERANCIA_SEGUNDOS)
+    - Se queda con el último evento (por timestamp) de cada espacio
+    - "libre": libera el espacio y cierra su asignación activa con la hora del
+      evento, salvo que el evento sea anterior al inicio de esa asignación
+      (un evento atrasado de la estadía anterior): entonces se ignora
+    - "ocupado": marca el espacio ocupado y registra "ocupación sin asignar"
+    Los cambios se aplican con UPDATEs masivos, no uno por evento.
+    """
+    limite = datetime.now() + timedelta(seconds=SENSORES_TOLERANCIA_SEGUNDOS)
+    validos = [evento for evento in eventos if _hora_local(evento.timestamp) <= limite]
+    
+    # Colapsar eventos duplicados: gana el más reciente de cada espacio
+    ultimos = {}
+    for evento in validos:
+        actual = ultimos.get(evento.espacio_id)
+        if actual is None or _hora_local(evento.timestamp) >= _hora_local(actual.timestamp):
+            ultimos[evento.espacio_id] = evento
+    
+    # Los espacios se leen con FOR UPDATE (en orden de id): su asignación
+    # activa no puede cambiar entre la lectura y el cierre
+    espacios = {}
+    for ids in _en_lotes(sorted(ultimos)):
+        for fila in db.query(
+            models.Espacio.id,
+            models.Espacio.numero_de_espacio,
+            models.Espacio.estado,
+            models.Espacio.reservado,
+            models.Espacio.zona
+        ).filter(models.Espacio.id.in_(ids)).order_by(models.Espacio.id).with_for_update().all():
+            espacios[fila.id] = fila
+    
+    por_liberar = [i for i, e in ultimos.items() if i in espacios and e.estado == "libre" and espacios[i].estado == "ocupado"]
+    por_ocupar = [i for i, e in ultimos.items() if i in espacios and e.estado == "ocupado" and espacios[i].estado == "libre"]
+    
+    # Asignaciones activas de los espacios a liberar: un "libre" anterior a la
+    # llegada no puede cerrarla (quedaría con hora_liberado < hora_asignado)
+    activas = {}
+    for ids in _en_lotes(por_liberar):
+        for fila in db.query(
+            models.Asignacion.id,
+            models.Asignacion.id_de_espacio,
+            models.Asignacion.hora_asignado,
+            models.Asignacion.zona
+        ).filter(
+            models.Asignacion.id_de_espacio.in_(ids),
+            models.Asignacion.hora_liberado == None
+        ).all():
+            activas[fila.id_de_espacio] = fila
+    atrasados = [
+        i for i in por_liberar
+        if i in activas and _hora_local(ultimos[i].timestamp) < activas[i].hora_asignado.replace(tzinfo=None)
+    ]
+    if atrasados:
+        print(f"⏪ Eventos \"libre\" anteriores a la asignación activa ignorados: {len(atrasados)}")
+        ignorados = set(atrasados)
+        por_liberar = [i for i in por_liberar if i not in ignorados]
+    
+    liberados = _cambiar_estado_masivo(db, por_liberar, "ocupado", "libre")
+    ocupados = _cambiar_estado_masivo(db, por_ocupar, "libre", "ocupado")
+    
+    # Cerrar las asignaciones activas de los espacios liberados
+    cierres = []
+    eventos_resumen = []
+    estadias = []
+    for espacio_id in liberados:
+        if espacio_id not in activas:
+            continue
+        asignacion = activas[espacio_id]
+        hora_liberado = _hora_local(ultimos[espacio_id].timestamp)
+        cierres.append({"id": asignacion.id, "hora_liberado": hora_liberado})
+        eventos_resumen.append(_evento_cierre(asignacion.hora_asignado, hora_liberado, asignacion.zona))
+        estadias.append((asignacion.hora_asignado, hora_liberado, asignacion.zona, espacio_id))
+    if cierres:
+        db.execute(update(models.Asignacion), cierres)
+    
+    # Ocupación detectada por sensor sin asignación previa
+    db.add_all([
+        models.Incidente(
+            id_de_espacio=espacio_id,
+            tipo_de_incidente="ocupación sin asignar",
+            nota="Sensor detectó ocupación sin asignación",
+            hora_de_registro=_hora_local(ultimos[espacio_id].timestamp),
+            zona=espacios[espacio_id].zona
+        )
+        for espacio_id in ocupados
+    ])
+    eventos_resumen.extend(
+        (_hora_local(ultimos[espacio_id].timestamp), espacios[espacio_id].zona, _metricas_incidente("ocupación sin asignar"))
+        for espacio_id in ocupados
+    )
+    sumar_a_resumenes(db, eventos_resumen)
+    sumar_a_cuantiles(db, estadias)
+    
+    # Un solo ajuste de contadores por zona y pool
+    deltas = defaultdict(int)
+    for espacio_id in liberados:
+        deltas[(espacios[espacio_id].zona, pool_de(espacios[espacio_id].reservado))] -= 1
+    for espacio_id in ocupados:
+        deltas[(espacios[espacio_id].zona, pool_de(espacios[espacio_id].reservado))] += 1
+    _ajustar_contadores(db, deltas)
+    
+    db.commit()
+    
+    for espacio_id in liberados:
+        asignador.devolver(espacios[espacio_id])
+    for espacio_id in ocupados:
+        asignador.descartar(espacio_id)
+    
+    return {
+        "recibidos": len(eventos),
+        "espacios": len(ultimos),
+        "liberados": len(liberados),
+        "ocupados": len(ocupados),
+        "asignaciones_cerradas": len(cierres),
+        "sin_cambios": len(ultimos) - len(liberados) - len(ocupados) - len(atrasados) - len(set(ultimos) - set(espacios)),
+        "futuros": len(eventos) - len(validos),
+        "atrasados": len(atrasados),
+        "desconocidos": sorted(set(ultimos) - set(espacios)),
+        "zonas": sorted({espacios[i].zona for i in list(liberados) + list(ocupados)})
+    }
+
+def _cambiar_estado_masivo(db: Session, espacio_ids: List[int], estado_anterior: str, estado_nuevo: str) -> List[int]:
+    """UPDATE condicional masivo de estado; devuelve los ids que realmente cambiaron"""
+    cambiados = []
+    for ids in _en_lotes(espacio_ids):
+        cambiados.extend(db.execute(
+            update(models.Espacio)
+            .where(models.Espacio.id.in_(ids), models.Espacio.estado == estado_anterior)
+            .values(estado=estado_nuevo)
+            .returning(models.Espacio.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all())
+    return cambiados
+
+def _en_lotes(valores: list, tamaño: int = 500):
+    for i in range(0, len(valores), tamaño):
+        yield valores[i:i + tamaño]
+
+def _hora_local(momento: datetime) -> datetime:
+    """Convertir a hora local sin zona horaria (como se guardan las horas de liberación)"""
+    if momento.tzinfo:
+        return momento.astimezone().replace(tzinfo=None)
+    return momento
+
+
+# ============ RESÚMENES POR DÍA Y HORA ============
+# Filas por hora/día y zona (ver models.ResumenHorario)
+RESUMEN_FRAGMENTOS = max(int(os.getenv("RESUMEN_FRAGMENTOS", "8")), 1)
+
+def sumar_a_resumenes(db: Session, eventos):
+    """
+    Sumar métricas a resumen_horario y resumen_diario en la transacción actual
+    (un upsert por tabla), en un fragmento al azar: solo se bloquean esas
+    filas. eventos: lista de (momento, zona, {métrica: delta}). No hace commit.
+    """
+    por_hora = {}
+    for momento, zona, deltas in eventos:
+        if not deltas:
+            continue
+        hora = momento.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+        fila = por_hora.setdefault((hora, zona), dict.fromkeys(models.METRICAS_RESUMEN, 0))
+        for metrica, delta in deltas.items():
+            fila[metrica] += delta
+    if not por_hora:
+        return
+    marcar_cambio(db)
+    report_memo.marcar_dias(db, {hora.date() for hora, _ in por_hora})
+    
+    por_dia = {}
+    for (hora, zona), deltas in por_hora.items():
+        fila = por_dia.setdefault((hora.date(), zona), dict.fromkeys(models.METRICAS_RESUMEN, 0))
+        for metrica, delta in deltas.items():
+            fila[metrica] += delta
+    
+    fragmento = random.randrange(RESUMEN_FRAGMENTOS)
+    _upsert_resumen(db, models.ResumenHorario.__table__, "hora", por_hora, fragmento)
+    _upsert_resumen(db, models.ResumenDiario.__table__, "dia", por_dia, fragmento)
+
+def _upsert_resumen(db: Session, tabla, columna_periodo: str, filas: dict, fragmento: int):
+    # Filas ordenadas por clave: transacciones concurrentes bloquean en el mismo orden
+    stmt = _insert_dialecto(db)(tabla).values([
+        {columna_periodo: periodo, "zona": zona, "fragmento": fragmento, **deltas}
+        for (periodo, zona), deltas in sorted(filas.items())
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[tabla.c[columna_periodo], tabla.c.zona, tabla.c.fragmento],
+        set_={metrica: tabla.c[metrica] + stmt.excluded[metrica] for metrica in models.METRICAS_RESUMEN}
+    ))
+
+def _evento_cierre(hora_asignado: datetime, hora_liberado: datetime, zona: str):
+    """Métricas de una estadía cerrada, contadas en la hora de llegada"""
+    segundos = (hora_liberado.replace(tzinfo=None) - hora_asignado.replace(tzinfo=None)).total_seconds()
+    return (hora_asignado, zona, {
+        "estadias_completadas": 1 if segundos > 0 else 0,
+        "segundos_estadia": segundos if segundos > 0 else 0.0,
+        "estadias_cortas": 1 if segundos < 60 else 0,
+    })
+
+def _metricas_incidente(tipo: str) -> dict:
+    if tipo == "estacionamiento_lleno":
+        return {"estacionamiento_lleno": 1}
+    if tipo in models.TIPOS_INCIDENTE_AUTOMATICOS:
+        return {}
+    return {"incidentes_manuales": 1}
+
+
+# ============ PERCENTILES DE ESTADÍA ============
+# Las salidas solo agregan filas a estadia_pendiente; compactar_cuantiles las
+# une a los sketches fuera del camino de escritura (ver models.EstadiaPendiente)
+CUANTILES_COMPACTAR_SEGUNDOS = float(os.getenv("CUANTILES_COMPACTAR_SEGUNDOS", "60"))
+CUANTILES_COMPACTAR_LOTE = int(os.getenv("CUANTILES_COMPACTAR_LOTE", "20000"))
+
+def _estadia(asignacion: models.Asignacion):
+    return (asignacion.hora_asignado, asignacion.hora_liberado, asignacion.zona, asignacion.id_de_espacio)
+
+def sumar_a_cuantiles(db: Session, estadias):
+    """
+    Dejar la duración de estadías cerradas en estadia_pendiente (un INSERT,
+    sin leer ni bloquear los sketches). estadias: lista de (hora_asignado,
+    hora_liberado, zona, id_de_espacio); las de duración no positiva no
+    cuentan. No hace commit.
+    """
+    filas = []
+    for hora_asignado, hora_liberado, zona, espacio_id in estadias:
+        segundos = (hora_liberado.replace(tzinfo=None) - hora_asignado.replace(tzinfo=None)).total_seconds()
+        if segundos <= 0:
+            continue
+        filas.append({
+            "dia": hora_asignado.replace(tzinfo=None).date(), "zona": zona,
+            "id_de_espacio": espacio_id, "segundos": round(segundos, 1)
+        })
+    if filas:
+        db.execute(models.EstadiaPendiente.__table__.insert(), filas)
+
+def compactar_cuantiles(db: Session) -> int:
+    """
+    Agregar hasta CUANTILES_COMPACTAR_LOTE estadías pendientes a los sketches
+    por zona y por espacio, y borrarlas, en una transacción. El DELETE ...
+    RETURNING reparte las filas: dos workers compactando a la vez nunca
+    agregan la misma estadía dos veces. Devuelve las estadías agregadas.
+    """
+    pendiente = models.EstadiaPendiente.__table__
+    filas = db.execute(
+        pendiente.delete()
+        .where(pendiente.c.id.in_(
+            select(pendiente.c.id).order_by(pendiente.c.id).limit(CUANTILES_COMPACTAR_LOTE).scalar_subquery()
+        ))
+        .returning(pendiente.c.dia, pendiente.c.zona, pendiente.c.id_de_espacio, pendiente.c.segundos)
+    ).all()
+    if not filas:
+        db.rollback()
+        return 0
+
+    por_zona = defaultdict(list)
+    por_espacio = defaultdict(list)
+    zona_de_espacio = {}
+    for dia, zona, espacio_id, segundos in filas:
+        por_zona[(dia, zona)].append(segundos)
+        por_espacio[(dia, espacio_id)].append(segundos)
+        zona_de_espacio[(dia, espacio_id)] = {"zona": zona}
+    _sumar_a_sketches(db, models.CuantilesEstadiaDiarios, "zona", por_zona)
+    _sumar_a_sketches(db, models.CuantilesEstadiaEspacio, "id_de_espacio", por_espacio, zona_de_espacio)
+    db.commit()
+    return len(filas)
+
+def _sumar_a_sketches(db: Session, modelo, columna: str, valores: dict, extra: Optional[dict] = None):
+    """
+    Leer, actualizar y reescribir los sketches de las claves (dia, columna).
+    Las filas que faltan se insertan vacías primero: ese INSERT toma el lock de
+    escritura en SQLite, y en PostgreSQL las filas se leen con FOR UPDATE, así
+    dos compactaciones simultáneas del mismo día no se pisan.
+    """
+    tabla = modelo.__table__
+    claves = sorted(valores)  # Mismo orden de bloqueo en todas las transacciones
+    vacio = SketchKLL().a_json()
+    db.execute(_insert_dialecto(db)(tabla).values([
+        {"dia": dia, columna: valor, "estadias": 0, "sketch": vacio, **(extra or {}).get((dia, valor), {})}
+        for dia, valor in claves
+    ]).on_conflict_do_nothing(index_elements=[tabla.c.dia, tabla.c[columna]]))
+    
+    filas = db.execute(
+        select(tabla.c.dia, tabla.c[columna], tabla.c.sketch)
+        .where(tuple_(tabla.c.dia, tabla.c[columna]).in_(claves))
+        .order_by(tabla.c.dia, tabla.c[columna])
+        .with_for_update()
+    ).all()
+    cambios = []
+    for dia, valor, texto in filas:
+        sketch = SketchKLL.desde_json(texto)
+        sketch.agregar_varios(valores[(dia, valor)])
+        cambios.append({"dia": dia, columna: valor, "estadias": sketch.n, "sketch": sketch.a_json()})
+    db.execute(update(modelo), cambios)
+
+
+# ============ IDEMPOTENCIA ============
+def get_clave_idempotencia(db: Session, clave: str):
+    """Obtener el resultado guardado de una Idempotency-Key vigente"""
+    return db.query(models.ClaveIdempotencia).filter(
+        models.ClaveIdempotencia.clave == clave,
+        models.ClaveIdempotencia.creado >= datetime.now() - TTL_CLAVES
+    ).first()
+
+def reservar_clave_idempotencia(db: Session, clave: str):
+    """
+    Insertar la clave antes de procesar la solicitud (sin commit). Si otra
+    solicitud con la misma clave ya la insertó, la clave primaria lo impide y
+    se devuelve None. Las claves vencidas con el mismo valor se reemplazan.
+    """
+    db.query(models.ClaveIdempotencia).filter(
+        models.ClaveIdempotencia.clave == clave,
+        models.ClaveIdempotencia.creado < datetime.now() - TTL_CLAVES
+    ).delete(synchronize_session=False)
+    db_clave = models.ClaveIdempotencia(clave=clave)
+    db.add(db_clave)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return db_clave
+
+def purgar_claves_idempotencia(db: Session):
+    """Eliminar las claves de idempotencia vencidas"""
+    db.query(models.ClaveIdempotencia).filter(
+        models.ClaveIdempotencia.creado < datetime.now() - TTL_CLAVES
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
 # ============ INCIDENTES ============
 def create_incidente(db: Session, incidente: schemas.IncidenteCreate):
-    db_incidente = models.Incidente(**incidente.model_dump())
+    datos = incidente.model_dump()
+    if not datos.get("zona"):
+        # Por defecto, la zona del espacio afectado
+        espacio = get_espacio(db, datos["id_de_espacio"])
+        datos["zona"] = espacio.zona if espacio else models.ZONA_POR_DEFECTO
+    db_incidente = models.Incidente(**datos, hora_de_registro=datetime.now())
     db.add(db_incidente)
+    sumar_a_resumenes(db, [(db_incidente.hora_de_registro, db_incidente.zona, _metricas_incidente(db_incidente.tipo_de_incidente))])
     db.commit()
     db.refresh(db_incidente)
     return db_incidente
 
+def _query_incidentes(db: Session):
+    """Incidentes con el espacio que devuelve IncidenteResponse (JOIN, sin consultas por fila)"""
+    return db.query(models.Incidente).options(joinedload(models.Incidente.espacio, innerjoin=True))
+
 def get_incidente(db: Session, incidente_id: int):
-    return db.query(models.Incidente).filter(models.Incidente.id == incidente_id).first()
+    return _query_incidentes(db).filter(models.Incidente.id == incidente_id).first()
 
-def get_incidentes_activos(db: Session):
-    return db.query(models.Incidente).filter(
+def get_incidentes_activos(db: Session, zona: Optional[str] = None):
+    query = _query_incidentes(db).filter(
         models.Incidente.hora_de_solucion == None
-    ).all()
+    )
+    if zona:
+        query = query.filter(models.Incidente.zona == zona)
+    return query.all()
 
-def get_incidentes_by_date_range(db: Session, fecha_inicio: datetime, fecha_fin: datetime):
-    return db.query(models.Incidente).filter(
+def get_incidentes_by_date_range(db: Session, fecha_inicio: datetime, fecha_fin: datetime, zona: Optional[str] = None):
+    query = _query_incidentes(db).filter(
         and_(
             models.Incidente.hora_de_registro >= fecha_inicio,
             models.Incidente.hora_de_registro <= fecha_fin
         )
-    ).all()
+    )
+    if zona:
+        query = query.filter(models.Incidente.zona == zona)
+    return query.all()
 
 def resolver_incidente(db: Session, incidente_id: int, nota: Optional[str] = None):
     incidente = get_incidente(db, incidente_id)
@@ -252,51 +966,38 @@ def resolver_incidente(db: Session, incidente_id: int, nota: Optional[str] = Non
         incidente.hora_de_solucion = datetime.now()
         if nota:
             incidente.nota = nota
+        marcar_cambio(db)
+        report_memo.marcar_dias(db, [incidente.hora_de_registro.date()])
         db.commit()
         db.refresh(incidente)
     return incidente
 
 
 # ============ REPORTES Y ESTADÍSTICAS ============
-def get_estadisticas(db: Session, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None):
-    # Estadísticas generales de espacios
-    total_espacios = db.query(models.Espacio).count()
-    espacios_disponibles = db.query(models.Espacio).filter(models.Espacio.estado == "libre").count()
-    espacios_ocupados = db.query(models.Espacio).filter(models.Espacio.estado == "ocupado").count()
-    espacios_reservados = db.query(models.Espacio).filter(models.Espacio.reservado == "si").count()
-    
-    # Filtrar por rango de fechas si se proporciona
-    query_asignaciones = db.query(models.Asignacion)
-    query_incidentes = db.query(models.Incidente)
-    
-    if fecha_inicio and fecha_fin:
-        query_asignaciones = query_asignaciones.filter(
-            and_(
-                models.Asignacion.hora_asignado >= fecha_inicio,
-                models.Asignacion.hora_asignado <= fecha_fin
-            )
-        )
-        query_incidentes = query_incidentes.filter(
-            and_(
-                models.Incidente.hora_de_registro >= fecha_inicio,
-                models.Incidente.hora_de_registro <= fecha_fin
-            )
-        )
+def get_estadisticas(
+    db: Session,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    zona: Optional[str] = None
+):
+    # Estadísticas generales de espacios (desde los contadores de ocupación)
+    contadores = get_contadores(db, zona)
+    total_espacios = contadores["total"]
+    espacios_disponibles = contadores["disponibles"]
+    espacios_ocupados = contadores["ocupados"]
+    espacios_reservados = contadores["reservados"]
     
-    total_asignaciones = query_asignaciones.count()
-    total_incidentes = query_incidentes.count()
-    
-    # Calcular promedio de horas de ocupación
-    asignaciones_completadas = query_asignaciones.filter(
-        models.Asignacion.hora_liberado != None
-    ).all()
+    # Asignaciones e incidentes del rango (o de todo el historial), incluidos
+    # los meses archivados, agregados en la base de datos
+    if not (fecha_inicio and fecha_fin):
+        fecha_inicio = fecha_fin = None
+    asignaciones = aggregates.metricas_asignaciones(db, fecha_inicio, fecha_fin, zona)
+    total_asignaciones = asignaciones["asignaciones"]
+    total_incidentes = archive.contar_incidentes(db, fecha_inicio, fecha_fin, zona)
     
-    if asignaciones_completadas:
-        total_horas = sum([
-            (asig.hora_liberado - asig.hora_asignado).total_seconds() / 3600
-            for asig in asignaciones_completadas
-        ])
-        promedio_horas = total_horas / len(asignaciones_completadas)
+    # Promedio de horas de ocupación de las asignaciones cerradas
+    if asignaciones["cerradas"]:
+        promedio_horas = asignaciones["horas_totales"] / asignaciones["cerradas"]
     else:
         promedio_horas = 0.0
     
@@ -1,20 +1,139 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+
+def _env_bool(nombre: str, defecto: bool) -> bool:
+    valor = os.getenv(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+
+# ============ CONFIGURACIÓN (variables de entorno) ============
+# URL de la base de datos (por defecto SQLite local; para sitios grandes, PostgreSQL)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./parking.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+# Tiempo máximo por sentencia (PostgreSQL); en SQLite se usa busy_timeout
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# PRAGMAs aplicados a cada conexión SQLite nueva
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # negativo = KiB (64 MB)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", "268435456"))  # 256 MB
+
+# Camino de lectura de los reportes: por defecto la misma base (lectores WAL
+# en conexiones propias); puede apuntar a una réplica de solo lectura
+REPORTES_DATABASE_URL = os.getenv("REPORTES_DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+DB_REPORTES_POOL_SIZE = int(os.getenv("DB_REPORTES_POOL_SIZE", "5"))
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+ES_SQLITE = _url.get_backend_name() == "sqlite"
+_SQLITE_EN_MEMORIA = ES_SQLITE and _url.database in (None, "", ":memory:")
+
+_url_reportes = make_url(REPORTES_DATABASE_URL)
+
+
+def _url_async(url) -> str:
+    """URL equivalente con driver async (aiosqlite / asyncpg), salvo que se indique ASYNC_DATABASE_URL"""
+    if os.getenv("ASYNC_DATABASE_URL"):
+        return os.getenv("ASYNC_DATABASE_URL")
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}.get(url.get_backend_name())
+    if driver is None:
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def _opciones_engine(asincrono: bool = False, url=_url, pool_size: int = DB_POOL_SIZE) -> dict:
+    opciones = {}
+    if url.get_backend_name() == "sqlite":
+        # check_same_thread=False es necesario para SQLite con FastAPI
+        opciones["connect_args"] = {"check_same_thread": False}
+    elif url.get_backend_name() == "postgresql":
+        if asincrono:
+            opciones["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            opciones["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        opciones["pool_size"] = pool_size
+        opciones["max_overflow"] = DB_MAX_OVERFLOW
+        opciones["pool_pre_ping"] = DB_POOL_PRE_PING
+    return opciones
+
+
+def _configurar_conexion_sqlite(dbapi_connection, connection_record):
+    """
+    PRAGMAs por conexión: con WAL los reportes largos no bloquean las escrituras
+    de los kioscos, y busy_timeout espera el lock en lugar de fallar enseguida.
+    """
+    cursor = dbapi_connection.cursor()
+    if not _SQLITE_EN_MEMORIA:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
 
-# URL de la base de datos SQLite local
-SQLALCHEMY_DATABASE_URL = "sqlite:///./parking.db"
 
 # Crear el engine de SQLAlchemy
-# check_same_thread=False es necesario para SQLite con FastAPI
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_opciones_engine())
 
 # Crear SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine async (aiosqlite / asyncpg) para los routers del camino caliente: las
+# consultas no ocupan un hilo del threadpool mientras la base de datos espera
+SQLALCHEMY_ASYNC_DATABASE_URL = _url_async(_url)
+
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, **_opciones_engine(asincrono=True))
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False)
+
+if ES_SQLITE:
+    event.listen(engine, "connect", _configurar_conexion_sqlite)
+    event.listen(async_engine.sync_engine, "connect", _configurar_conexion_sqlite)
+
+# ============ CAMINO DE LECTURA (reportes) ============
+def _configurar_lectura_sqlite(dbapi_connection, connection_record):
+    """
+    Conexión de reportes: de solo lectura y sin el BEGIN implícito de
+    pysqlite (que solo abre transacción antes de escribir). El BEGIN se emite
+    en _iniciar_snapshot, de modo que todas las consultas de un reporte leen
+    la misma instantánea WAL hasta el rollback final.
+    """
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _iniciar_snapshot(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+if _SQLITE_EN_MEMORIA and REPORTES_DATABASE_URL == SQLALCHEMY_DATABASE_URL:
+    # Una base en memoria solo existe en su propia conexión
+    engine_reportes = engine
+else:
+    opciones_reportes = _opciones_engine(url=_url_reportes, pool_size=DB_REPORTES_POOL_SIZE)
+    if _url_reportes.get_backend_name() == "postgresql":
+        # Instantánea única por transacción y sin escrituras
+        opciones_reportes["isolation_level"] = "REPEATABLE READ"
+        opciones_reportes["connect_args"]["options"] += " -c default_transaction_read_only=on"
+    engine_reportes = create_engine(REPORTES_DATABASE_URL, **opciones_reportes)
+    if _url_reportes.get_backend_name() == "sqlite":
+        event.listen(engine_reportes, "connect", _configurar_conexion_sqlite)
+        event.listen(engine_reportes, "connect", _configurar_lectura_sqlite)
+        event.listen(engine_reportes, "begin", _iniciar_snapshot)
+
+ReportesSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine_reportes)
+
 # Base class para los modelos
 Base = declarative_base()
 
@@ -24,4 +143,35 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency para los reportes: sesión de solo lectura en su propio pool; cada
+# request es una sola transacción (una instantánea) que se descarta al final
+def get_db_reportes():
+    db = ReportesSessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+# Dependency para obtener una sesión async. La lógica de crud es síncrona y se
+# ejecuta con db.run_sync(...), que usa esta misma conexión async
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def ejecutar_en_sesion(db: AsyncSession, funcion, *args, esquema=None):
+    """
+    Ejecutar una función síncrona funcion(sesion, *args) sobre la conexión async.
+    Si se indica un esquema, el resultado se serializa dentro de la misma sesión
+    (las relaciones perezosas no se pueden cargar después, fuera de run_sync).
+    """
+    def _ejecutar(sesion):
+        resultado = funcion(sesion, *args)
+        if esquema is None or resultado is None:
+            return resultado
+        if isinstance(resultado, list):
+            return [esquema.model_validate(r) for r in resultado]
+        return esquema.model_validate(resultado)
+    return await db.run_sync(_ejecutar)
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+from sqlalchemy import select
+from app import archive, models
+from app.database import ReportesSessionLocal
+
+# ============================================================
+# EXPORTACIÓN DEL HISTORIAL (CSV / NDJSON)
+# ============================================================
+# Las exportaciones se envían por partes: cada tabla (meses archivados y tabla
+# caliente) se lee con un cursor del lado del servidor, de a
+# EXPORTAR_LOTE_FILAS filas, y cada lote se escribe y se envía antes de leer
+# el siguiente. La memoria no depende del tamaño del rango, y la cabecera sale
+# antes de la primera consulta.
+
+EXPORTAR_LOTE_FILAS = int(os.getenv("EXPORTAR_LOTE_FILAS", "1000"))
+
+# origen -> columnas exportadas, en orden
+COLUMNAS = {
+    "asignaciones": [
+        "id", "ci_reserva", "id_de_espacio", "numero_de_espacio", "zona", "hora_asignado", "hora_liberado"
+    ],
+    "incidentes": [
+        "id", "tipo_de_incidente", "hora_de_registro", "hora_de_solucion", "nota",
+        "id_de_espacio", "numero_de_espacio", "zona"
+    ],
+    "ayuda": ["id", "fecha_hora", "atendida", "fecha_hora_atencion", "notas", "ubicacion"],
+}
+
+FORMATOS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def _consultas(db, origen: str, fecha_inicio, fecha_fin, zona) -> list:
+    """Consultas a recorrer en orden, cada una ordenada por su fecha (por índice)"""
+    if origen == "ayuda":
+        # Las solicitudes de ayuda no tienen zona
+        tabla = models.SolicitudAyuda.__table__
+        consulta = select(*[tabla.c[n] for n in COLUMNAS["ayuda"]])
+        if fecha_inicio:
+            consulta = consulta.where(tabla.c.fecha_hora >= fecha_inicio)
+        if fecha_fin:
+            consulta = consulta.where(tabla.c.fecha_hora <= fecha_fin)
+        return [consulta.order_by(tabla.c.fecha_hora, tabla.c.id)]
+
+    origen_archivo, columna_fecha = {
+        "asignaciones": ("asignacion", "hora_asignado"),
+        "incidentes": ("incidente", "hora_de_registro"),
+    }[origen]
+    consultas = []
+    for consulta in archive.consultas_rango(db, origen_archivo, fecha_inicio, fecha_fin, zona, con_espacio=True):
+        columnas = consulta.selected_columns
+        consultas.append(
+            consulta.with_only_columns(*[columnas[n] for n in COLUMNAS[origen]])
+            .order_by(columnas[columna_fecha], columnas["id"])
+        )
+    return consultas
+
+
+def _valor(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def _escribir_csv(filas) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_valor(v) for v in fila] for fila in filas)
+    return buffer.getvalue()
+
+
+def _escribir_ndjson(filas, columnas: List[str]) -> str:
+    return "".join(
+        json.dumps(dict(zip(columnas, map(_valor, fila))), ensure_ascii=False) + "\n"
+        for fila in filas
+    )
+
+
+def exportar(
+    origen: str,
+    formato: str,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    zona: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Generador con el contenido de la exportación, por lotes. Usa su propia
+    sesión de lectura, que vive mientras dura la respuesta (una sola
+    instantánea de principio a fin).
+    """
+    columnas = COLUMNAS[origen]
+    if formato == "csv":
+        yield _escribir_csv([columnas]).encode("utf-8")
+
+    db = ReportesSessionLocal()
+    try:
+        for consulta in _consultas(db, origen, fecha_inicio, fecha_fin, zona):
+            # yield_per: cursor del lado del servidor (stream_results) y filas
+            # leídas de a lotes, sin cargar el resultado completo
+            resultado = db.execute(consulta, execution_options={"yield_per": EXPORTAR_LOTE_FILAS})
+            for lote in resultado.partitions():
+                if formato == "csv":
+                    yield _escribir_csv(lote).encode("utf-8")
+                else:
+                    yield _escribir_ndjson(lote, columnas).encode("utf-8")
+    finally:
+        db.rollback()
+        db.close()
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+# Cantidad máxima de claves recordadas en memoria y tiempo de validez de una clave
+CAPACIDAD_CLAVES = 10000
+TTL_CLAVES = timedelta(hours=24)
+
+
+class IndiceIdempotencia:
+    """
+    Índice en memoria de resultados por Idempotency-Key, acotado (LRU) y con
+    expiración. Evita ir a la base de datos en los reintentos de los kioscos;
+    la tabla clave_idempotencia es el respaldo cuando la clave no está aquí
+    (otro worker, reinicio o clave desalojada).
+    """
+
+    def __init__(self, capacidad: int = CAPACIDAD_CLAVES, ttl: timedelta = TTL_CLAVES):
+        self.capacidad = capacidad
+        self.ttl_segundos = ttl.total_seconds()
+        self._lock = threading.Lock()
+        self._claves: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        with self._lock:
+            entrada = self._claves.get(clave)
+            if entrada is None:
+                return None
+            expira, resultado = entrada
+            if expira < time.monotonic():
+                del self._claves[clave]
+                return None
+            self._claves.move_to_end(clave)
+            return resultado
+
+    def guardar(self, clave: str, resultado: dict):
+        with self._lock:
+            self._claves[clave] = (time.monotonic() + self.ttl_segundos, resultado)
+            self._claves.move_to_end(clave)
+            while len(self._claves) > self.capacidad:
+                self._claves.popitem(last=False)
+
+
+indice_idempotencia = IndiceIdempotencia()
@@ -1,17 +1,100 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.database import engine, async_engine, SessionLocal
+from app.allocator import asignador
+from app import archive, crud, report_jobs
+from app.migrations import verificar_esquema
 from app.routers import spaces, admin, usuarios_reserva, assignments, incidents, reports, websocket, ayuda
 
+# El esquema se verifica al arrancar, no al importar: importar app.main no
+# toca la base de datos
+def preparar_esquema():
+    """Migrar solo si la huella del esquema guardada no coincide con la del código"""
+    if verificar_esquema(engine):
+        print("🗄️  Esquema actualizado")
+
+
+def cargar_estado_espacios():
+    """Reconstruir el asignador de espacios libres y los contadores de ocupación"""
+    db = SessionLocal()
+    try:
+        crud.recalcular_contadores(db)
+        db.commit()
+        asignador.cargar(db)
+        crud.purgar_claves_idempotencia(db)
+    finally:
+        db.close()
+
+
+def _archivar():
+    db = SessionLocal()
+    try:
+        archive.archivar(db)
+    except Exception as e:
+        print(f"❌ Error al archivar: {e}")
+    finally:
+        db.close()
+
+
+async def _archivar_periodicamente():
+    """Mover el historial cerrado a las tablas de archivo cada ARCHIVO_INTERVALO_HORAS"""
+    while True:
+        await asyncio.to_thread(_archivar)
+        await asyncio.sleep(archive.ARCHIVO_INTERVALO_HORAS * 3600)
+
+
+def _compactar_cuantiles():
+    db = SessionLocal()
+    try:
+        # Un lote por transacción, hasta vaciar las estadías pendientes
+        while crud.compactar_cuantiles(db) >= crud.CUANTILES_COMPACTAR_LOTE:
+            pass
+    except Exception as e:
+        print(f"❌ Error al compactar los percentiles de estadía: {e}")
+    finally:
+        db.close()
+
+
+async def _compactar_cuantiles_periodicamente():
+    """Agregar las estadías pendientes a los sketches cada CUANTILES_COMPACTAR_SEGUNDOS"""
+    while True:
+        await asyncio.sleep(crud.CUANTILES_COMPACTAR_SEGUNDOS)
+        await asyncio.to_thread(_compactar_cuantiles)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ============ ARRANQUE ============
+    preparar_esquema()
+    cargar_estado_espacios()
+    tarea_archivo = None
+    if archive.ARCHIVO_INTERVALO_HORAS > 0:
+        tarea_archivo = asyncio.create_task(_archivar_periodicamente())
+    tarea_cuantiles = None
+    if crud.CUANTILES_COMPACTAR_SEGUNDOS > 0:
+        tarea_cuantiles = asyncio.create_task(_compactar_cuantiles_periodicamente())
+    # Los trabajos de reportes avisan por el WebSocket desde sus hilos usando este bucle
+    report_jobs.iniciar(asyncio.get_running_loop())
+
+    yield
+
+    # ============ CIERRE ============
+    for tarea in (tarea_archivo, tarea_cuantiles):
+        if tarea:
+            tarea.cancel()
+    report_jobs.detener()
+    # Cerrar las conexiones aiosqlite del pool (cada una tiene su propio hilo)
+    await async_engine.dispose()
 
-# Crear las tablas en la base de datos
-Base.metadata.create_all(bind=engine)
 
 # Crear la aplicación FastAPI
 app = FastAPI(
     title="Sistema de Gestión de Estacionamiento",
     description="API para gestionar espacios de estacionamiento, asignaciones y reportes",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir conexiones desde el frontend
@@ -0,0 +1,259 @@
+import hashlib
+from datetime import datetime
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from app.database import Base
+from app import aggregates, archive, crud, models
+
+
+# ============================================================
+# MIGRACIONES VERSIONADAS
+# ============================================================
+# Cada migración es (versión, descripción, función(conexión)). Se aplican en
+# orden, una sola vez, y se registran en la tabla version_esquema. Deben ser
+# idempotentes: en una base nueva create_all ya crea las columnas e índices
+# actuales y la migración solo se registra.
+
+def _columnas(conn: Connection, tabla: str):
+    return {columna["name"] for columna in inspect(conn).get_columns(tabla)}
+
+def _agregar_columna_zona(conn: Connection, tabla: str):
+    if "zona" not in _columnas(conn, tabla):
+        conn.execute(text(
+            f"ALTER TABLE {tabla} ADD COLUMN zona VARCHAR(50) NOT NULL DEFAULT '{models.ZONA_POR_DEFECTO}'"
+        ))
+
+def _crear_indices(conn: Connection, tabla: str, nombres):
+    """Crear los índices declarados en models.py que falten en una tabla existente"""
+    indices = {indice.name: indice for indice in Base.metadata.tables[tabla].indexes}
+    for nombre in nombres:
+        indices[nombre].create(conn, checkfirst=True)
+
+
+def _migracion_1_zonas(conn: Connection):
+    for tabla in ("espacio", "asignacion", "incidente"):
+        _agregar_columna_zona(conn, tabla)
+    # Los contadores son derivados: si son de antes de las zonas se recrean
+    # (create_all los vuelve a crear y el inicio de la aplicación los recalcula)
+    if "zona" not in _columnas(conn, "contador_ocupacion"):
+        models.ContadorOcupacion.__table__.drop(conn)
+        models.ContadorOcupacion.__table__.create(conn)
+
+def _cerrar_asignaciones_duplicadas(conn: Connection) -> int:
+    """
+    Dejar una sola asignación activa por espacio antes de crear
+    ux_asignacion_espacio_activa. Las versiones anteriores al UPDATE
+    condicional podían asignar dos veces el mismo espacio: se conserva la más
+    reciente y las demás se cierran a la hora en que empezó esa. Devuelve la
+    cantidad de asignaciones cerradas.
+    """
+    asignacion = models.Asignacion.__table__
+    espacios = conn.execute(
+        select(asignacion.c.id_de_espacio)
+        .where(asignacion.c.hora_liberado == None)
+        .group_by(asignacion.c.id_de_espacio)
+        .having(func.count() > 1)
+    ).scalars().all()
+    cerradas = 0
+    for espacio_id in espacios:
+        abiertas = conn.execute(
+            select(asignacion.c.id, asignacion.c.hora_asignado)
+            .where(asignacion.c.id_de_espacio == espacio_id, asignacion.c.hora_liberado == None)
+            .order_by(asignacion.c.hora_asignado.desc(), asignacion.c.id.desc())
+        ).all()
+        vigente = abiertas[0]
+        conn.execute(
+            update(asignacion)
+            .where(asignacion.c.id.in_([fila.id for fila in abiertas[1:]]))
+            .values(hora_liberado=vigente.hora_asignado or datetime.now())
+        )
+        cerradas += len(abiertas) - 1
+
+    if espacios:
+        # El espacio sigue con una asignación activa: tiene que figurar ocupado,
+        # y los contadores se recalculan desde la tabla
+        espacio = models.Espacio.__table__
+        conn.execute(update(espacio).where(espacio.c.id.in_(espacios)).values(estado="ocupado"))
+        crud.recalcular_contadores(Session(bind=conn))
+        print(f"🧹 Asignaciones activas duplicadas cerradas: {cerradas} (en {len(espacios)} espacios)")
+    return cerradas
+
+def _migracion_2_indices_camino_caliente(conn: Connection):
+    _cerrar_asignaciones_duplicadas(conn)
+    _crear_indices(conn, "espacio", [
+        "ix_espacio_estado_reservado",
+        "ix_espacio_zona_estado_reservado",
+    ])
+    _crear_indices(conn, "asignacion", [
+        "ix_asignacion_hora_asignado",
+        "ix_asignacion_zona_hora_asignado",
+        "ux_asignacion_espacio_activa",
+    ])
+    _crear_indices(conn, "incidente", [
+        "ix_incidente_tipo_hora_registro",
+        "ix_incidente_zona_hora_registro",
+        "ix_incidente_activo_tipo",
+    ])
+
+def _migracion_3_archivo_mensual(conn: Connection):
+    models.ArchivoMensual.__table__.create(conn, checkfirst=True)
+
+def _migracion_4_resumenes(conn: Connection):
+    models.ResumenHorario.__table__.create(conn, checkfirst=True)
+    models.ResumenDiario.__table__.create(conn, checkfirst=True)
+    # Los resúmenes se cargan con el historial existente
+    aggregates.reconstruir_resumenes(Session(bind=conn))
+
+
+def _migracion_5_cuantiles_estadia(conn: Connection):
+    models.CuantilesEstadiaDiarios.__table__.create(conn, checkfirst=True)
+    models.CuantilesEstadiaEspacio.__table__.create(conn, checkfirst=True)
+    aggregates.reconstruir_cuantiles(Session(bind=conn))
+
+
+def _migracion_6_contadores_fragmentados(conn: Connection):
+    # Los contadores son derivados: se recrean con la columna fragmento y se recalculan
+    if "fragmento" not in _columnas(conn, "contador_ocupacion"):
+        models.ContadorOcupacion.__table__.drop(conn)
+        models.ContadorOcupacion.__table__.create(conn)
+        crud.recalcular_contadores(Session(bind=conn))
+
+
+def _migracion_7_resumenes_fragmentados(conn: Connection):
+    # Los resúmenes también son derivados: se recrean con la columna fragmento
+    # y se recalculan desde las tablas de origen
+    if "fragmento" not in _columnas(conn, "resumen_horario"):
+        for tabla in (models.ResumenHorario.__table__, models.ResumenDiario.__table__):
+            tabla.drop(conn)
+            tabla.create(conn)
+        aggregates.reconstruir_resumenes(Session(bind=conn))
+
+
+def _migracion_8_estadias_pendientes(conn: Connection):
+    models.EstadiaPendiente.__table__.create(conn, checkfirst=True)
+
+
+def _migracion_9_asignaciones_activas_en(conn: Connection):
+    _crear_indices(conn, "asignacion", [
+        "ix_asignacion_hora_liberado",
+        "ix_asignacion_zona_hora_liberado",
+    ])
+    if "ultimo_cierre" not in _columnas(conn, "archivo_mensual"):
+        conn.execute(text("ALTER TABLE archivo_mensual ADD COLUMN ultimo_cierre TIMESTAMP"))
+    # Los meses ya archivados toman el cierre más tardío de su tabla
+    registro = models.ArchivoMensual.__table__
+    for origen, mes in conn.execute(select(registro.c.origen, registro.c.mes)).all():
+        tabla = archive.tabla_archivo(origen, mes)
+        _, _, columna_cierre = archive._ORIGENES[origen]
+        conn.execute(
+            update(registro)
+            .where(registro.c.origen == origen, registro.c.mes == mes)
+            .values(ultimo_cierre=select(func.max(tabla.c[columna_cierre])).scalar_subquery())
+        )
+
+
+MIGRACIONES = [
+    (1, "Columna zona en espacio, asignacion e incidente", _migracion_1_zonas),
+    (2, "Índices compuestos y parciales de reportes y asignaciones", _migracion_2_indices_camino_caliente),
+    (3, "Registro de tablas de archivo mensuales", _migracion_3_archivo_mensual),
+    (4, "Resúmenes de reportes por día y hora", _migracion_4_resumenes),
+    (5, "Percentiles de estadía por día (sketches KLL)", _migracion_5_cuantiles_estadia),
+    (6, "Contadores de ocupación en varias filas por pool", _migracion_6_contadores_fragmentados),
+    (7, "Resúmenes de reportes en varias filas por hora y zona", _migracion_7_resumenes_fragmentados),
+    (8, "Estadías pendientes de agregar a los percentiles", _migracion_8_estadias_pendientes),
+    (9, "Índices de asignaciones activas en un momento y último cierre de cada mes archivado", _migracion_9_asignaciones_activas_en),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def version_aplicada(conn: Connection) -> int:
+    if not inspect(conn).has_table(models.VersionEsquema.__tablename__):
+        return 0
+    version = conn.execute(text("SELECT MAX(version) FROM version_esquema")).scalar()
+    return version or 0
+
+
+# ============================================================
+# HUELLA DEL ESQUEMA
+# ============================================================
+# Resumen de las tablas, columnas e índices declarados en models.py y de la
+# versión de migraciones. Se guarda en huella_esquema al migrar; al arrancar
+# basta una consulta para saber si la base ya está al día, sin create_all ni
+# inspección de tablas.
+
+def huella_esquema() -> str:
+    partes = [f"version={VERSION_ACTUAL}"]
+    for tabla in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        partes.append(f"tabla {tabla.name}")
+        for columna in tabla.columns:
+            partes.append(f"  {columna.name} {columna.type} nullable={columna.nullable} pk={columna.primary_key}")
+        for indice in sorted(tabla.indexes, key=lambda i: i.name):
+            columnas = ",".join(c.name for c in indice.columns)
+            donde = indice.dialect_options["sqlite"].get("where")
+            partes.append(f"  indice {indice.name} ({columnas}) unique={indice.unique} where={donde}")
+    return hashlib.sha256("\n".join(partes).encode("utf-8")).hexdigest()
+
+
+def _huella_guardada(conn: Connection):
+    try:
+        return conn.execute(
+            select(models.HuellaEsquema.huella).where(models.HuellaEsquema.id == 1)
+        ).scalar()
+    except DBAPIError:
+        # Base anterior a huella_esquema (o vacía)
+        return None
+
+
+def _guardar_huella(engine: Engine, huella: str):
+    with engine.begin() as conn:
+        conn.execute(models.HuellaEsquema.__table__.delete())
+        conn.execute(models.HuellaEsquema.__table__.insert().values(
+            id=1, huella=huella, actualizada=datetime.now()
+        ))
+
+
+def verificar_esquema(engine: Engine) -> bool:
+    """
+    Paso de arranque: si la huella guardada coincide con la del código no hace
+    nada más; si no, migra y guarda la nueva. Devuelve True si hubo que migrar.
+    """
+    huella = huella_esquema()
+    with engine.connect() as conn:
+        if _huella_guardada(conn) == huella:
+            return False
+    migrar(engine)
+    return True
+
+
+def migrar(engine: Engine) -> int:
+    """
+    Llevar la base de datos a la versión actual: crea las tablas que falten
+    y aplica, en una transacción cada una, las migraciones pendientes.
+    Devuelve la versión final.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as conn:
+        version = version_aplicada(conn)
+
+    for numero, descripcion, funcion in MIGRACIONES:
+        if numero <= version:
+            continue
+        with engine.begin() as conn:
+            funcion(conn)
+            conn.execute(models.VersionEsquema.__table__.insert().values(
+                version=numero, descripcion=descripcion, aplicada=datetime.now()
+            ))
+        print(f"🗄️  Migración {numero} aplicada: {descripcion}")
+        version = numero
+
+    _guardar_huella(engine, huella_esquema())
+    return version
+
+
+if __name__ == "__main__":
+    from app.database import engine
+    print(f"✅ Esquema en la versión {migrar(engine)}")
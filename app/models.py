@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, Date, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -11,6 +11,12 @@ from .database import Base
 
 paraguay_tz = pytz.timezone("America/Asuncion")
 
+# Zona (nivel / playa) usada cuando no se indica otra
+ZONA_POR_DEFECTO = "general"
+
+# Incidentes que registra el sistema (no cuentan como incidentes manuales)
+TIPOS_INCIDENTE_AUTOMATICOS = ("estacionamiento_lleno", "solicitud_rechazada")
+
 class Admin(Base):
     __tablename__ = "admin"
 
@@ -38,10 +44,33 @@ class Espacio(Base):
     numero_de_espacio = Column(Integer, unique=True, nullable=False)  # 1, 2, 3, ..., 20
     estado = Column(String(20), nullable=False, default="libre")  # libre, ocupado
     reservado = Column(String(5), nullable=False, default="no")  # si, no
+    zona = Column(String(50), nullable=False, default=ZONA_POR_DEFECTO, server_default=ZONA_POR_DEFECTO)  # nivel / playa
     
     # Relaciones
     asignaciones = relationship("Asignacion", back_populates="espacio")
     incidentes = relationship("Incidente", back_populates="espacio")
+    
+    __table_args__ = (
+        Index("ix_espacio_estado_reservado", "estado", "reservado"),
+        Index("ix_espacio_zona_estado_reservado", "zona", "estado", "reservado"),
+    )
+
+
+class ContadorOcupacion(Base):
+    """
+    Contadores de ocupación por zona y pool, mantenidos en la misma transacción
+    que cada cambio de estado de un espacio (evita contar la tabla espacio).
+    Cada zona y pool se reparte en varias filas (fragmento) y cada cambio suma
+    a una al azar: las asignaciones simultáneas del mismo pool no esperan el
+    lock de una sola fila. El valor es la suma de los fragmentos.
+    """
+    __tablename__ = "contador_ocupacion"
+
+    zona = Column(String(50), primary_key=True)
+    reservado = Column(String(5), primary_key=True)  # si, no
+    fragmento = Column(Integer, primary_key=True, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    ocupados = Column(Integer, nullable=False, default=0)
 
 
 class Asignacion(Base):
@@ -52,10 +81,46 @@ class Asignacion(Base):
     id_de_espacio = Column(Integer, ForeignKey("espacio.id"), nullable=False)
     hora_asignado = Column(DateTime(timezone=True), server_default=func.now())
     hora_liberado = Column(DateTime(timezone=True), nullable=True)
+    zona = Column(String(50), nullable=False, default=ZONA_POR_DEFECTO, server_default=ZONA_POR_DEFECTO)  # copiada del espacio
     
     # Relaciones
     espacio = relationship("Espacio", back_populates="asignaciones")
     usuario_reserva = relationship("UsuarioReserva", back_populates="asignaciones")
+    
+    __table_args__ = (
+        Index("ix_asignacion_hora_asignado", "hora_asignado"),
+        Index("ix_asignacion_zona_hora_asignado", "zona", "hora_asignado"),
+        # Asignaciones activas en un momento: abiertas o cerradas después
+        # (aggregates._eventos_ocupacion)
+        Index("ix_asignacion_hora_liberado", "hora_liberado", "hora_asignado"),
+        Index("ix_asignacion_zona_hora_liberado", "zona", "hora_liberado", "hora_asignado"),
+        # Como máximo una asignación activa por espacio. Las bases de versiones
+        # anteriores pueden tener duplicadas: la migración 2 las cierra antes de
+        # crear el índice (migrations._cerrar_asignaciones_duplicadas)
+        Index(
+            "ux_asignacion_espacio_activa",
+            "id_de_espacio",
+            unique=True,
+            sqlite_where=hora_liberado.is_(None),
+            postgresql_where=hora_liberado.is_(None)
+        ),
+    )
+
+
+class ClaveIdempotencia(Base):
+    """
+    Resultado de una solicitud de asignación identificada por Idempotency-Key.
+    Se guarda en la misma transacción que la asignación o el rechazo.
+    """
+    __tablename__ = "clave_idempotencia"
+
+    clave = Column(String(100), primary_key=True)
+    asignacion_id = Column(Integer, ForeignKey("asignacion.id"), nullable=True)
+    status_code = Column(Integer, nullable=False, default=200)
+    detalle = Column(Text, nullable=True)
+    creado = Column(DateTime, nullable=False, default=datetime.now)
+
+    asignacion = relationship("Asignacion")
 
 
 class Incidente(Base):
@@ -67,9 +132,177 @@ class Incidente(Base):
     hora_de_registro = Column(DateTime(timezone=True), server_default=func.now())
     hora_de_solucion = Column(DateTime(timezone=True), nullable=True)
     nota = Column(Text, nullable=True)
+    zona = Column(String(50), nullable=False, default=ZONA_POR_DEFECTO, server_default=ZONA_POR_DEFECTO)
     
     # Relación
     espacio = relationship("Espacio", back_populates="incidentes")
+    
+    __table_args__ = (
+        Index("ix_incidente_tipo_hora_registro", "tipo_de_incidente", "hora_de_registro"),
+        Index("ix_incidente_zona_hora_registro", "zona", "hora_de_registro"),
+        # Búsqueda del incidente activo de un tipo y zona (p. ej. "estacionamiento_lleno")
+        Index(
+            "ix_incidente_activo_tipo",
+            "zona",
+            "tipo_de_incidente",
+            sqlite_where=hora_de_solucion.is_(None),
+            postgresql_where=hora_de_solucion.is_(None)
+        ),
+    )
+
+class VersionEsquema(Base):
+    """Migraciones aplicadas a la base de datos (ver app/migrations.py)"""
+    __tablename__ = "version_esquema"
+
+    version = Column(Integer, primary_key=True)
+    descripcion = Column(String(200), nullable=False)
+    aplicada = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class HuellaEsquema(Base):
+    """
+    Huella del esquema aplicado (ver app/migrations.py). Si coincide con la
+    del código, el arranque no necesita inspeccionar la base de datos.
+    """
+    __tablename__ = "huella_esquema"
+
+    id = Column(Integer, primary_key=True)  # una sola fila, id = 1
+    huella = Column(String(64), nullable=False)
+    actualizada = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class ArchivoMensual(Base):
+    """
+    Tablas de archivo mensuales (ver app/archive.py): filas cerradas de
+    asignacion e incidente movidas fuera de las tablas calientes. Los reportes
+    consultan aquí qué meses hay que unir a un rango de fechas, y con
+    ultimo_cierre qué meses pueden tener filas abiertas en un momento dado.
+    """
+    __tablename__ = "archivo_mensual"
+
+    origen = Column(String(50), primary_key=True)  # asignacion, incidente
+    mes = Column(Date, primary_key=True)  # primer día del mes
+    tabla = Column(String(100), nullable=False)
+    filas = Column(Integer, nullable=False, default=0)
+    ultimo_cierre = Column(DateTime, nullable=True)  # cierre más tardío de sus filas
+    actualizado = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class RechazoPorMinuto(Base):
+    """
+    Solicitudes rechazadas por falta de espacio, agregadas por minuto, zona y
+    pool. Se actualiza con upserts (una fila por minuto en lugar de un
+    incidente por auto rechazado).
+    """
+    __tablename__ = "rechazo_por_minuto"
+
+    minuto = Column(DateTime, primary_key=True)  # truncado al minuto, hora local
+    zona = Column(String(50), primary_key=True)
+    reservado = Column(String(5), primary_key=True)  # si, no
+    cantidad = Column(Integer, nullable=False, default=0)
+
+
+# Métricas acumuladas en ResumenHorario y ResumenDiario
+METRICAS_RESUMEN = (
+    "llegadas",
+    "estadias_completadas",
+    "segundos_estadia",
+    "estadias_cortas",
+    "rechazos",
+    "estacionamiento_lleno",
+    "incidentes_manuales",
+    "solicitudes_ayuda",
+)
+
+
+class ResumenHorario(Base):
+    """
+    Métricas de reportes por hora y zona, sumadas en la misma transacción que
+    cada llegada, salida, rechazo, incidente o solicitud de ayuda (ver
+    crud.sumar_a_resumenes). Las estadías se cuentan en la hora de llegada.
+    Las solicitudes de ayuda no tienen zona y se guardan en ZONA_POR_DEFECTO.
+    Como en ContadorOcupacion, cada hora y zona se reparte en varias filas
+    (fragmento) y cada transacción suma a una al azar; los reportes suman los
+    fragmentos.
+    """
+    __tablename__ = "resumen_horario"
+
+    hora = Column(DateTime, primary_key=True)  # truncada a la hora, hora local
+    zona = Column(String(50), primary_key=True)
+    fragmento = Column(Integer, primary_key=True, default=0)
+    llegadas = Column(Integer, nullable=False, default=0)
+    estadias_completadas = Column(Integer, nullable=False, default=0)  # con duración positiva
+    segundos_estadia = Column(Float, nullable=False, default=0)
+    estadias_cortas = Column(Integer, nullable=False, default=0)  # menos de 1 minuto (no utilizadas)
+    rechazos = Column(Integer, nullable=False, default=0)
+    estacionamiento_lleno = Column(Integer, nullable=False, default=0)
+    incidentes_manuales = Column(Integer, nullable=False, default=0)
+    solicitudes_ayuda = Column(Integer, nullable=False, default=0)
+
+
+class ResumenDiario(Base):
+    """Las mismas métricas que ResumenHorario, por día y zona (también en fragmentos)"""
+    __tablename__ = "resumen_diario"
+
+    dia = Column(Date, primary_key=True)
+    zona = Column(String(50), primary_key=True)
+    fragmento = Column(Integer, primary_key=True, default=0)
+    llegadas = Column(Integer, nullable=False, default=0)
+    estadias_completadas = Column(Integer, nullable=False, default=0)
+    segundos_estadia = Column(Float, nullable=False, default=0)
+    estadias_cortas = Column(Integer, nullable=False, default=0)
+    rechazos = Column(Integer, nullable=False, default=0)
+    estacionamiento_lleno = Column(Integer, nullable=False, default=0)
+    incidentes_manuales = Column(Integer, nullable=False, default=0)
+    solicitudes_ayuda = Column(Integer, nullable=False, default=0)
+
+
+class CuantilesEstadiaDiarios(Base):
+    """
+    Sketch KLL (app/sketches.py) de las duraciones de estadía (segundos, solo
+    positivas) por día de llegada y zona. Las salidas no lo tocan: dejan su
+    duración en EstadiaPendiente y crud.compactar_cuantiles la agrega en
+    segundo plano. Los de varios días se unen para obtener percentiles de
+    cualquier rango.
+    """
+    __tablename__ = "cuantiles_estadia_diarios"
+
+    dia = Column(Date, primary_key=True)
+    zona = Column(String(50), primary_key=True)
+    estadias = Column(Integer, nullable=False, default=0)
+    sketch = Column(Text, nullable=False)  # SketchKLL.a_json()
+
+
+class CuantilesEstadiaEspacio(Base):
+    """El mismo sketch por día de llegada y espacio"""
+    __tablename__ = "cuantiles_estadia_espacio"
+
+    dia = Column(Date, primary_key=True)
+    id_de_espacio = Column(Integer, primary_key=True)
+    zona = Column(String(50), nullable=False)
+    estadias = Column(Integer, nullable=False, default=0)
+    sketch = Column(Text, nullable=False)
+
+
+class EstadiaPendiente(Base):
+    """
+    Duraciones de estadía que todavía no se agregaron a los sketches. Cada
+    salida solo inserta una fila aquí (ver crud.sumar_a_cuantiles), sin
+    bloquear filas compartidas. crud.compactar_cuantiles las une a los
+    sketches y las borra; mientras tanto los reportes las suman al leer.
+    """
+    __tablename__ = "estadia_pendiente"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    dia = Column(Date, nullable=False)  # día de llegada
+    zona = Column(String(50), nullable=False)
+    id_de_espacio = Column(Integer, nullable=False)
+    segundos = Column(Float, nullable=False)  # solo positivas
+
+    __table_args__ = (
+        Index("ix_estadia_pendiente_dia", "dia"),
+    )
+
 
 class SolicitudAyuda(Base):
     __tablename__ = "solicitudes_ayuda"
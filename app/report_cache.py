@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Hashable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Respuestas de reportes recordadas en memoria y segundos de validez (0 = sin cache)
+REPORTES_CACHE_CAPACIDAD = int(os.getenv("REPORTES_CACHE_CAPACIDAD", "256"))
+REPORTES_CACHE_TTL_SEGUNDOS = float(os.getenv("REPORTES_CACHE_TTL_SEGUNDOS", "30"))
+
+
+class CacheReportes:
+    """
+    Cache en memoria de respuestas de reportes, acotado (LRU) y con expiración.
+
+    Cada entrada guarda la versión de datos con la que se calculó. Las
+    escrituras de asignaciones, incidentes y ayuda marcan su sesión
+    (marcar_cambio) y, al confirmarse, suben la versión: desde ese momento las
+    entradas anteriores ya no sirven. Mientras no haya cambios, los paneles que
+    consultan cada pocos segundos comparten un único cálculo por reporte.
+
+    La versión es de este proceso: los cambios hechos por otros workers se ven
+    cuando vence el TTL.
+    """
+
+    def __init__(self, capacidad: int = REPORTES_CACHE_CAPACIDAD, ttl_segundos: float = REPORTES_CACHE_TTL_SEGUNDOS):
+        self.capacidad = capacidad
+        self.ttl_segundos = ttl_segundos
+        self.version = 0
+        self.aciertos = 0
+        self.calculos = 0
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Un lock por grupo de claves: si muchos piden el mismo reporte a la
+        # vez, uno lo calcula y el resto espera su resultado
+        self._locks_calculo = [threading.Lock() for _ in range(32)]
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self._entradas.clear()
+
+    def _leer(self, clave: Hashable, version: int):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return False, None
+            expira, version_entrada, resultado = entrada
+            if version_entrada != version or expira < time.monotonic():
+                del self._entradas[clave]
+                return False, None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return True, resultado
+
+    def _guardar(self, clave: Hashable, version: int, resultado):
+        with self._lock:
+            if version != self.version:
+                return  # Los datos cambiaron mientras se calculaba
+            self._entradas[clave] = (time.monotonic() + self.ttl_segundos, version, resultado)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def obtener_o_calcular(self, clave: Hashable, calcular: Callable):
+        if self.ttl_segundos <= 0 or self.capacidad <= 0:
+            return calcular()
+        encontrado, resultado = self._leer(clave, self.version)
+        if encontrado:
+            return resultado
+        with self._locks_calculo[hash(clave) % len(self._locks_calculo)]:
+            # La versión se toma antes de calcular: si cambia durante el
+            # cálculo, el resultado no se guarda
+            version = self.version
+            encontrado, resultado = self._leer(clave, version)
+            if encontrado:
+                return resultado
+            resultado = calcular()
+            with self._lock:
+                self.calculos += 1
+            self._guardar(clave, version, resultado)
+            return resultado
+
+
+cache_reportes = CacheReportes()
+
+
+def en_cache(funcion):
+    """
+    Decorador para endpoints de reportes: la clave es el endpoint y sus
+    parámetros (sin la sesión de base de datos).
+    """
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        clave = (funcion.__name__,) + tuple(sorted((k, v) for k, v in kwargs.items() if k != "db"))
+        return cache_reportes.obtener_o_calcular(clave, lambda: funcion(*args, **kwargs))
+    return envoltura
+
+
+# ============ INVALIDACIÓN AL CONFIRMAR ESCRITURAS ============
+def marcar_cambio(db: Session):
+    """Marcar que la transacción actual cambia datos de reportes"""
+    db.info["datos_cambiados"] = True
+
+@event.listens_for(Session, "after_commit")
+def _subir_version(sesion: Session):
+    if sesion.info.pop("datos_cambiados", False):
+        cache_reportes.invalidar()
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_marca(sesion: Session):
+    sesion.info.pop("datos_cambiados", None)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy.orm import Session
+from app.database import ReportesSessionLocal
+
+# ============================================================
+# TRABAJOS DE REPORTES EN SEGUNDO PLANO
+# ============================================================
+# Un reporte largo (meses de /reports/rango-detallado) se pide como trabajo:
+# POST /reports/trabajos devuelve un id enseguida y el cálculo corre en un pool
+# de REPORTES_TRABAJOS_WORKERS hilos, sin ocupar un worker HTTP mientras tanto.
+# Un pedido igual a otro que todavía no terminó recibe ese mismo trabajo. El
+# estado y el resultado se guardan como JSON en REPORTES_TRABAJOS_DIR, así
+# cualquier worker puede responder la consulta, y se borran
+# REPORTES_TRABAJOS_TTL_HORAS después de terminar. Al terminar se avisa a los
+# clientes del WebSocket (/ws) con un mensaje "trabajo_reporte".
+
+REPORTES_TRABAJOS_DIR = os.getenv("REPORTES_TRABAJOS_DIR", "reportes_trabajos")
+REPORTES_TRABAJOS_WORKERS = int(os.getenv("REPORTES_TRABAJOS_WORKERS", "2"))
+REPORTES_TRABAJOS_MAX_PENDIENTES = int(os.getenv("REPORTES_TRABAJOS_MAX_PENDIENTES", "20"))
+REPORTES_TRABAJOS_TTL_HORAS = float(os.getenv("REPORTES_TRABAJOS_TTL_HORAS", "24"))
+
+_ID_VALIDO = re.compile(r"[0-9a-f]{32}")
+
+
+class ColaLlena(Exception):
+    """Ya hay REPORTES_TRABAJOS_MAX_PENDIENTES trabajos sin terminar en este worker"""
+
+
+_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_bucle: Optional[asyncio.AbstractEventLoop] = None  # Para avisar por el WebSocket desde los hilos
+_en_curso: Dict[str, str] = {}  # clave del pedido -> id del trabajo sin terminar
+_futuros: Dict[str, Future] = {}
+
+
+# ============ ARCHIVOS ============
+def _ruta_estado(trabajo_id: str) -> str:
+    return os.path.join(REPORTES_TRABAJOS_DIR, f"{trabajo_id}.estado.json")
+
+def ruta_resultado(trabajo_id: str) -> str:
+    return os.path.join(REPORTES_TRABAJOS_DIR, f"{trabajo_id}.json")
+
+def _escribir_json(ruta: str, datos: dict):
+    """Escribir a un temporal y renombrar: nunca se lee un archivo a medias"""
+    os.makedirs(REPORTES_TRABAJOS_DIR, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(datos, archivo)
+    os.replace(temporal, ruta)
+
+def _vencido(estado: dict, ahora: datetime) -> bool:
+    return bool(estado.get("vence")) and datetime.fromisoformat(estado["vence"]) <= ahora
+
+
+def leer_estado(trabajo_id: str) -> Optional[dict]:
+    """Estado guardado del trabajo, o None si no existe o ya venció"""
+    if not _ID_VALIDO.fullmatch(trabajo_id):
+        return None
+    try:
+        with open(_ruta_estado(trabajo_id), encoding="utf-8") as archivo:
+            estado = json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return None
+    return None if _vencido(estado, datetime.now()) else estado
+
+
+def purgar() -> int:
+    """Borrar el estado y el resultado de los trabajos vencidos. Devuelve la cantidad borrada."""
+    if not os.path.isdir(REPORTES_TRABAJOS_DIR):
+        return 0
+    ahora = datetime.now()
+    borrados = 0
+    for nombre in os.listdir(REPORTES_TRABAJOS_DIR):
+        if not nombre.endswith(".estado.json"):
+            continue
+        trabajo_id = nombre[:-len(".estado.json")]
+        try:
+            with open(_ruta_estado(trabajo_id), encoding="utf-8") as archivo:
+                estado = json.load(archivo)
+        except (FileNotFoundError, ValueError):
+            continue
+        if _vencido(estado, ahora):
+            for ruta in (ruta_resultado(trabajo_id), _ruta_estado(trabajo_id)):
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+            borrados += 1
+    return borrados
+
+
+# ============ EJECUCIÓN ============
+def _notificar(estado: dict):
+    if _bucle is None or _bucle.is_closed():
+        return
+    # Importado aquí: el router del WebSocket no es necesario para usar la cola
+    from app.routers.websocket import notify_clients
+    asyncio.run_coroutine_threadsafe(notify_clients("trabajo_reporte", {
+        "id": estado["id"], "tipo": estado["tipo"], "estado": estado["estado"], "error": estado["error"]
+    }), _bucle)
+
+
+def _terminar(clave: str, estado: dict):
+    ahora = datetime.now()
+    estado["terminado"] = ahora.isoformat()
+    estado["vence"] = (ahora + timedelta(hours=REPORTES_TRABAJOS_TTL_HORAS)).isoformat()
+    _escribir_json(_ruta_estado(estado["id"]), estado)
+    with _lock:
+        _en_curso.pop(clave, None)
+        _futuros.pop(estado["id"], None)
+    _notificar(estado)
+
+
+def _ejecutar(clave: str, estado: dict, calcular: Callable[[Session], dict]):
+    estado.update(estado="ejecutando", iniciado=datetime.now().isoformat())
+    _escribir_json(_ruta_estado(estado["id"]), estado)
+    print(f"⚙️  Trabajo de reporte {estado['id']} ({estado['tipo']}) iniciado")
+
+    # Una sesión de lectura por trabajo: todo el cálculo ve una misma instantánea
+    db = ReportesSessionLocal()
+    try:
+        _escribir_json(ruta_resultado(estado["id"]), calcular(db))
+        estado["estado"] = "terminado"
+        print(f"✅ Trabajo de reporte {estado['id']} ({estado['tipo']}) terminado")
+    except Exception as e:
+        print(f"❌ Error en el trabajo de reporte {estado['id']} ({estado['tipo']}): {e}")
+        if not isinstance(e, ValueError):  # ValueError: parámetros fuera de rango
+            traceback.print_exc()
+        estado.update(estado="error", error=str(e))
+    finally:
+        db.rollback()
+        db.close()
+        _terminar(clave, estado)
+
+
+def enviar(tipo: str, parametros: dict, calcular: Callable[[Session], dict]) -> dict:
+    """
+    Encolar el cálculo de un reporte y devolver su estado. Si el mismo pedido
+    (tipo y parámetros) ya está pendiente o ejecutándose, se devuelve ese
+    trabajo en lugar de crear otro. Lanza ColaLlena si no hay lugar.
+    """
+    global _pool
+    clave = json.dumps([tipo, parametros], sort_keys=True)
+    with _lock:
+        existente = _en_curso.get(clave)
+        if existente:
+            estado = leer_estado(existente)
+            if estado:
+                return estado
+        if len(_en_curso) >= REPORTES_TRABAJOS_MAX_PENDIENTES:
+            raise ColaLlena(f"Hay {len(_en_curso)} trabajos de reportes sin terminar, reintentar más tarde")
+
+        estado = {
+            "id": uuid.uuid4().hex,
+            "tipo": tipo,
+            "parametros": parametros,
+            "estado": "pendiente",
+            "creado": datetime.now().isoformat(),
+            "iniciado": None,
+            "terminado": None,
+            "vence": None,
+            "error": None,
+        }
+        _escribir_json(_ruta_estado(estado["id"]), estado)
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=REPORTES_TRABAJOS_WORKERS, thread_name_prefix="reportes")
+        _en_curso[clave] = estado["id"]
+        _futuros[estado["id"]] = _pool.submit(_ejecutar, clave, dict(estado), calcular)
+    purgar()
+    return estado
+
+
+# ============ ARRANQUE Y CIERRE ============
+def iniciar(bucle: asyncio.AbstractEventLoop):
+    """Recordar el bucle de eventos (avisos por WebSocket) y borrar los trabajos vencidos"""
+    global _bucle
+    _bucle = bucle
+    borrados = purgar()
+    if borrados:
+        print(f"🗑️  Trabajos de reportes vencidos borrados: {borrados}")
+
+
+def detener():
+    """
+    Cerrar el pool sin esperar: los trabajos en ejecución terminan, y los que
+    seguían en cola quedan con error para que no se consulten para siempre
+    """
+    global _pool, _bucle
+    _bucle = None
+    if _pool is None:
+        return
+    _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    with _lock:
+        cancelados = [trabajo_id for trabajo_id, futuro in _futuros.items() if futuro.cancelled()]
+        claves = {trabajo_id: clave for clave, trabajo_id in _en_curso.items()}
+    for trabajo_id in cancelados:
+        estado = leer_estado(trabajo_id)
+        if estado:
+            estado.update(estado="error", error="El servidor se detuvo antes de ejecutar el trabajo")
+            _terminar(claves.get(trabajo_id, ""), estado)
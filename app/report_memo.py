@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Callable, Iterable, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from app import models
+from app.database import ReportesSessionLocal
+
+# ============================================================
+# MEMORIA PERSISTENTE DE PERÍODOS CERRADOS
+# ============================================================
+# Los reportes de un rango que ya terminó (antes de hoy, sin asignaciones ni
+# incidentes del rango todavía abiertos) no cambian: se guardan como JSON en
+# REPORTES_MEMO_DIR, uno por endpoint, rango, zona y huella del esquema, y se
+# reutilizan entre reinicios y workers. Las escrituras con fecha anterior a hoy
+# (eventos de sensores atrasados, solicitudes de ayuda borradas, recálculos de
+# resúmenes) invalidan los días afectados al confirmarse; para cargas hechas
+# por fuera de la aplicación: python -m app.report_memo --desde ... --hasta ...
+
+REPORTES_MEMO_DIR = os.getenv("REPORTES_MEMO_DIR", "reportes_cerrados")
+
+# Se escribe en cada invalidación: un cálculo que empezó antes no se guarda
+_MARCA = ".invalidado"
+
+_huella = None
+
+
+def _huella_corta() -> str:
+    global _huella
+    if _huella is None:
+        # Importado aquí: migrations importa aggregates, que usa este módulo
+        from app.migrations import huella_esquema
+        _huella = huella_esquema()[:16]
+    return _huella
+
+
+def _nombre(endpoint: str, inicio: date, fin: date, zona: Optional[str]) -> str:
+    # La zona va como hash: es texto libre y podría contener "__" o "/"
+    zona_archivo = hashlib.sha256(zona.encode("utf-8")).hexdigest()[:16] if zona else "-"
+    return f"{endpoint}__{inicio.isoformat()}__{fin.isoformat()}__{zona_archivo}__{_huella_corta()}.json"
+
+
+def _rango_del_nombre(nombre: str):
+    partes = nombre.split("__")
+    if len(partes) != 5:
+        return None
+    try:
+        return date.fromisoformat(partes[1]), date.fromisoformat(partes[2])
+    except ValueError:
+        return None
+
+
+def _leer_marca() -> str:
+    try:
+        with open(os.path.join(REPORTES_MEMO_DIR, _MARCA), encoding="utf-8") as archivo:
+            return archivo.read()
+    except FileNotFoundError:
+        return ""
+
+
+@event.listens_for(ReportesSessionLocal, "after_begin")
+def _recordar_marca(sesion: Session, transaccion, conexion):
+    """
+    Leer la marca al empezar la transacción del reporte, antes de su primera
+    consulta (y de su instantánea): una invalidación confirmada después la
+    cambia, y el resultado calculado con esa instantánea no se guarda
+    """
+    sesion.info["marca_memo"] = _leer_marca()
+
+
+def periodo_cerrado(db: Session, fecha_inicio: datetime, fecha_fin: datetime) -> bool:
+    """
+    El rango terminó antes de hoy y nada de lo que empezó en él sigue abierto
+    (una asignación abierta cambiaría el tiempo promedio al cerrarse, y un
+    incidente abierto la lista de incidentes)
+    """
+    if fecha_fin >= datetime.combine(date.today(), datetime.min.time()):
+        return False
+    # Una sola consulta con dos EXISTS acotados al rango: se detiene en la
+    # primera fila abierta, sin traer las demás
+    asignacion, incidente = models.Asignacion, models.Incidente
+    abierta = db.execute(select(
+        select(asignacion.id).where(
+            asignacion.hora_asignado >= fecha_inicio,
+            asignacion.hora_asignado <= fecha_fin,
+            asignacion.hora_liberado == None
+        ).exists()
+        | select(incidente.id).where(
+            incidente.hora_de_registro >= fecha_inicio,
+            incidente.hora_de_registro <= fecha_fin,
+            incidente.hora_de_solucion == None
+        ).exists()
+    )).scalar()
+    return not abierta
+
+
+def obtener_o_calcular(
+    db: Session,
+    endpoint: str,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    zona: Optional[str],
+    calcular: Callable[[], dict]
+) -> dict:
+    """
+    Resultado guardado del período si ya cerró; si no, calcular (y guardar si
+    cerró). db es una sesión de ReportesSessionLocal: sin la marca leída al
+    empezar su transacción, el resultado no se guarda.
+    """
+    if not periodo_cerrado(db, fecha_inicio, fecha_fin):
+        return calcular()
+    marca = db.info.get("marca_memo")
+
+    ruta = os.path.join(REPORTES_MEMO_DIR, _nombre(endpoint, fecha_inicio.date(), fecha_fin.date(), zona))
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    resultado = calcular()
+    if marca is None:
+        return resultado
+    try:
+        os.makedirs(REPORTES_MEMO_DIR, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo)
+        if _leer_marca() == marca:
+            os.replace(temporal, ruta)
+        else:
+            os.remove(temporal)  # Hubo una invalidación mientras se calculaba
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el reporte cerrado {ruta}: {e}")
+    return resultado
+
+
+def invalidar(desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """
+    Borrar los reportes guardados cuyo rango se cruza con [desde, hasta]
+    (sin límites: todos). Devuelve la cantidad borrada.
+    """
+    if not os.path.isdir(REPORTES_MEMO_DIR):
+        return 0
+    with open(os.path.join(REPORTES_MEMO_DIR, _MARCA), "w", encoding="utf-8") as archivo:
+        archivo.write(str(time.time_ns()))
+
+    borrados = 0
+    for nombre in os.listdir(REPORTES_MEMO_DIR):
+        rango = _rango_del_nombre(nombre)
+        if rango is None:
+            continue
+        inicio, fin = rango
+        if (desde is None or fin >= desde) and (hasta is None or inicio <= hasta):
+            try:
+                os.remove(os.path.join(REPORTES_MEMO_DIR, nombre))
+                borrados += 1
+            except FileNotFoundError:
+                pass
+    return borrados
+
+
+# ============ INVALIDACIÓN AL CONFIRMAR ESCRITURAS ============
+def marcar_dias(db: Session, dias: Iterable[date]):
+    """Marcar días anteriores a hoy cambiados por la transacción actual"""
+    hoy = date.today()
+    pasados = {dia for dia in dias if dia < hoy}
+    if pasados:
+        db.info.setdefault("dias_cerrados_cambiados", set()).update(pasados)
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_dias(sesion: Session):
+    dias = sesion.info.pop("dias_cerrados_cambiados", None)
+    if dias:
+        invalidar(min(dias), max(dias))
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_dias(sesion: Session):
+    sesion.info.pop("dias_cerrados_cambiados", None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Invalidar reportes guardados de períodos cerrados")
+    parser.add_argument("--desde", type=date.fromisoformat, help="primer día afectado (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="último día afectado (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    print(f"🗑️  Reportes guardados invalidados: {invalidar(args.desde, args.hasta)}")
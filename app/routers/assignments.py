@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 from app import crud, schemas, models
-from app.database import get_db
+from app.database import get_async_db, ejecutar_en_sesion
+from app.allocator import asignador
+from app.idempotency import indice_idempotencia
+from app.report_cache import marcar_cambio
 
 router = APIRouter(
     prefix="/asignaciones",
@@ -14,45 +19,50 @@ router = APIRouter(
 # FUNCIÓN AUXILIAR: Verificar si estacionamiento está lleno
 # ============================================================
 
-def verificar_y_registrar_estado_estacionamiento(db: Session):
+def verificar_y_registrar_estado_estacionamiento(db: Session, zona: str = models.ZONA_POR_DEFECTO):
     """
-    Verifica si el estacionamiento está lleno y registra/resuelve incidentes automáticamente.
+    Verifica si una zona del estacionamiento está llena y registra/resuelve incidentes automáticamente.
     
-    - Si se llena: crea incidente tipo "estacionamiento_lleno"
-    - Si deja de estar lleno: resuelve el incidente activo
+    - Si se llena: crea incidente tipo "estacionamiento_lleno" para la zona
+    - Si deja de estar llena: resuelve el incidente activo de la zona
     """
     try:
-        # Obtener todos los espacios
-        espacios = db.query(models.Espacio).all()
-        total_espacios = len(espacios)
+        # Ocupación actual de la zona desde los contadores (tiempo constante)
+        contadores = crud.get_contadores(db, zona)
+        total_espacios = contadores["total"]
         
         if total_espacios == 0:
             return
         
-        espacios_reservados = len([e for e in espacios if e.reservado == 'si'])
-        espacios_no_reservados = total_espacios - espacios_reservados
-        espacios_ocupados = len([e for e in espacios if e.estado == 'ocupado'])
+        espacios_no_reservados = contadores["no_reservados"]
+        espacios_ocupados = contadores["ocupados"]
         
         esta_lleno = espacios_ocupados >= espacios_no_reservados
         
         # Buscar si ya hay un incidente activo de "estacionamiento_lleno"
         incidente_activo = db.query(models.Incidente).filter(
+            models.Incidente.zona == zona,
             models.Incidente.tipo_de_incidente == "estacionamiento_lleno",
             models.Incidente.hora_de_solucion == None
         ).first()
         
         if esta_lleno and not incidente_activo:
             # El estacionamiento se acaba de llenar - CREAR INCIDENTE
-            # Usar espacio ID 1 como referencia (es un evento general, no específico de un espacio)
+            # Es un evento de la zona, no de un espacio: se referencia el
+            # primer espacio de la zona (así el incidente queda en su zona y
+            # el JOIN de _query_incidentes lo encuentra)
+            espacio_referencia = db.query(func.min(models.Espacio.id)).filter(models.Espacio.zona == zona).scalar()
             nuevo_incidente = models.Incidente(
-                id_de_espacio=1,  # ID genérico
+                id_de_espacio=espacio_referencia,
                 tipo_de_incidente="estacionamiento_lleno",
-                nota=f"Estacionamiento lleno: {espacios_ocupados}/{espacios_no_reservados} espacios no reservados ocupados",
-                hora_de_registro=datetime.now()
+                nota=f"Estacionamiento lleno (zona {zona}): {espacios_ocupados}/{espacios_no_reservados} espacios no reservados ocupados",
+                hora_de_registro=datetime.now(),
+                zona=zona
             )
             db.add(nuevo_incidente)
+            crud.sumar_a_resumenes(db, [(nuevo_incidente.hora_de_registro, zona, {"estacionamiento_lleno": 1})])
             db.commit()
-            print(f"🔥 INCIDENTE CREADO: Estacionamiento lleno ({espacios_ocupados}/{espacios_no_reservados})")
+            print(f"🔥 INCIDENTE CREADO: Estacionamiento lleno en zona {zona} ({espacios_ocupados}/{espacios_no_reservados})")
             
         elif not esta_lleno and incidente_activo:
             # El estacionamiento dejó de estar lleno - RESOLVER INCIDENTE
@@ -60,114 +70,274 @@ def verificar_y_registrar_estado_estacionamiento(db: Session):
             if not incidente_activo.nota:
                 incidente_activo.nota = ""
             incidente_activo.nota += f"\nResuelto automáticamente: espacio disponible ({espacios_ocupados}/{espacios_no_reservados})"
+            marcar_cambio(db)
             db.commit()
-            print(f"✅ INCIDENTE RESUELTO: Estacionamiento ya no está lleno ({espacios_ocupados}/{espacios_no_reservados})")
+            print(f"✅ INCIDENTE RESUELTO: Zona {zona} ya no está llena ({espacios_ocupados}/{espacios_no_reservados})")
     
     except Exception as e:
         print(f"⚠️ Error en verificar_y_registrar_estado_estacionamiento: {e}")
         # No lanzar excepción para no interrumpir el flujo principal
 
+def _detalle_rechazo(ci):
+    if ci:
+        return "No se encontró la reserva o no hay espacios reservados disponibles"
+    return "No hay espacios disponibles"
+
+def _rechazar(
+    db: Session,
+    asignacion: schemas.AsignacionCreate,
+    zona: str,
+    clave: Optional[models.ClaveIdempotencia],
+    idempotency_key: Optional[str],
+    registrar: bool = True
+):
+    """Responder 404 a una solicitud sin espacio, registrando el rechazo y el resultado de la clave"""
+    if registrar:
+        crud.registrar_rechazos(db, [asignacion.ci], zona)
+    detalle = _detalle_rechazo(asignacion.ci)
+    if clave is not None:
+        clave.status_code = 404
+        clave.detalle = detalle
+    db.commit()
+    print(f"🚫 SOLICITUD RECHAZADA registrada: CI={asignacion.ci}, zona={zona}")
+    
+    if idempotency_key:
+        indice_idempotencia.guardar(idempotency_key, {
+            "asignacion_id": None, "status_code": 404, "detalle": detalle
+        })
+    
+    # Lanzar excepción al usuario
+    raise HTTPException(status_code=404, detail=detalle)
+
+# ============================================================
+# FUNCIONES AUXILIARES: Idempotency-Key
+# ============================================================
+
+def _resultado_previo(db: Session, clave: str):
+    """Buscar el resultado de una clave: primero en memoria, después en la base de datos"""
+    resultado = indice_idempotencia.obtener(clave)
+    if resultado is None:
+        db_clave = crud.get_clave_idempotencia(db, clave)
+        if db_clave:
+            resultado = {
+                "asignacion_id": db_clave.asignacion_id,
+                "status_code": db_clave.status_code,
+                "detalle": db_clave.detalle
+            }
+            indice_idempotencia.guardar(clave, resultado)
+    return resultado
+
+def _repetir_resultado(db: Session, resultado: dict):
+    """Devolver el mismo resultado que obtuvo la solicitud original"""
+    if resultado["asignacion_id"] is None:
+        raise HTTPException(status_code=resultado["status_code"], detail=resultado["detalle"])
+    return crud.get_asignacion(db=db, asignacion_id=resultado["asignacion_id"])
+
 # ============================================================
 # ENDPOINTS
 # ============================================================
 
 @router.post("/solicitar", response_model=schemas.AsignacionResponse)
-def solicitar_espacio(asignacion: schemas.AsignacionCreate, db: Session = Depends(get_db)):
+async def solicitar_espacio(
+    asignacion: schemas.AsignacionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100)
+):
     """
     Solicitar un espacio de estacionamiento.
     - Si ci es None, es un usuario normal (anónimo).
     - Si ci tiene valor, busca la reserva asociada.
+    - zona indica el nivel / playa (por defecto "general").
     
     Este endpoint es usado por el User Interface (pantalla táctil).
+    Con el header Idempotency-Key, los reintentos del kiosco devuelven el
+    resultado original en lugar de ocupar otro espacio o registrar otro rechazo.
     """
+    return await ejecutar_en_sesion(
+        db, _solicitar_espacio, asignacion, idempotency_key, esquema=schemas.AsignacionResponse
+    )
+
+def _solicitar_espacio(db: Session, asignacion: schemas.AsignacionCreate, idempotency_key: Optional[str]):
+    clave = None
+    if idempotency_key:
+        resultado = _resultado_previo(db, idempotency_key)
+        if resultado is not None:
+            print(f"🔁 REINTENTO con Idempotency-Key={idempotency_key}")
+            return _repetir_resultado(db, resultado)
+        
+        clave = crud.reservar_clave_idempotencia(db, idempotency_key)
+        if clave is None:
+            # Otra solicitud con la misma clave terminó primero
+            resultado = _resultado_previo(db, idempotency_key)
+            if resultado is None:
+                raise HTTPException(status_code=409, detail="Solicitud en curso con la misma Idempotency-Key")
+            return _repetir_resultado(db, resultado)
+    
     # Verificar si hay espacios disponibles ANTES de intentar asignar
-    if asignacion.ci:
-        # Usuario con reserva - buscar espacio reservado disponible
-        espacio_disponible = db.query(models.Espacio).filter(
-            models.Espacio.estado == "libre",
-            models.Espacio.reservado == "si"
-        ).first()
-    else:
-        # Usuario normal - buscar espacio no reservado disponible
-        espacio_disponible = db.query(models.Espacio).filter(
-            models.Espacio.estado == "libre",
-            models.Espacio.reservado == "no"
-        ).first()
+    # (consulta al asignador en memoria, sin escanear la tabla espacio)
+    zona = asignacion.zona or models.ZONA_POR_DEFECTO
+    pool = "si" if asignacion.ci else "no"
+    espacio_disponible = asignador.disponibles(db, pool, zona) > 0
     
     # Si NO hay espacios disponibles, registrar rechazo
     if not espacio_disponible:
-        # Registrar incidente de solicitud rechazada
-        incidente_rechazo = models.Incidente(
-            id_de_espacio=1,  # ID genérico
-            tipo_de_incidente="solicitud_rechazada",
-            nota=f"Solicitud rechazada - CI: {asignacion.ci if asignacion.ci else 'Usuario anónimo'} - Sin espacios {'reservados' if asignacion.ci else 'no reservados'} disponibles",
-            hora_de_registro=datetime.now(),
-            hora_de_solucion=datetime.now()  # Auto-resuelto (es un evento puntual)
-        )
-        db.add(incidente_rechazo)
-        db.commit()
-        print(f"🚫 SOLICITUD RECHAZADA registrada: CI={asignacion.ci}")
+        if crud.get_contadores(db, zona)["total"] == 0:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Zona no encontrada")
         
-        # Lanzar excepción al usuario
-        if asignacion.ci:
-            raise HTTPException(status_code=404, detail="No se encontró la reserva o no hay espacios reservados disponibles")
-        else:
-            raise HTTPException(status_code=404, detail="No hay espacios disponibles")
+        _rechazar(db, asignacion, zona, clave, idempotency_key)
     
     # HAY espacio disponible - crear asignación
-    db_asignacion = crud.create_asignacion(db=db, ci=asignacion.ci)
+    db_asignacion = crud.create_asignacion(db=db, ci=asignacion.ci, clave=clave, zona=zona)
     
     if not db_asignacion:
-        raise HTTPException(status_code=500, detail="Error al crear la asignación")
+        # La reserva no existe, u otra solicitud tomó el último espacio entre
+        # la verificación y el reclamo (solo esto último cuenta como rechazo)
+        _rechazar(
+            db, asignacion, zona, clave, idempotency_key,
+            registrar=not asignacion.ci or crud.get_usuario_reserva(db, asignacion.ci) is not None
+        )
+    
+    if idempotency_key:
+        indice_idempotencia.guardar(idempotency_key, {
+            "asignacion_id": db_asignacion.id, "status_code": 200, "detalle": None
+        })
     
-    # Verificar si el estacionamiento se llenó con esta asignación
-    verificar_y_registrar_estado_estacionamiento(db)
+    # Verificar si la zona se llenó con esta asignación
+    verificar_y_registrar_estado_estacionamiento(db, zona)
     
     return db_asignacion
 
+@router.post("/solicitar/lote", response_model=schemas.AsignacionLoteResponse)
+async def solicitar_espacios_lote(lote: schemas.AsignacionLoteCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Solicitar varios espacios en una sola transacción (varias barreras de entrada).
+    Cada solicitud puede ser anónima o con ci, y de cualquier zona. Devuelve un resultado por solicitud,
+    en el mismo orden. La verificación de estacionamiento lleno y el registro de
+    rechazos se hacen una sola vez por zona del lote.
+    """
+    return await ejecutar_en_sesion(db, _solicitar_espacios_lote, lote)
+
+def _solicitar_espacios_lote(db: Session, lote: schemas.AsignacionLoteCreate):
+    asignacion_ids, zonas_desconocidas = crud.create_asignaciones_lote(db=db, solicitudes=lote.solicitudes)
+    
+    # Cargar espacios y usuarios de todas las asignaciones en una sola consulta
+    ids = [i for i in asignacion_ids if i is not None]
+    por_id = {}
+    if ids:
+        por_id = {
+            a.id: a for a in db.query(models.Asignacion).options(
+                joinedload(models.Asignacion.espacio),
+                joinedload(models.Asignacion.usuario_reserva)
+            ).filter(models.Asignacion.id.in_(ids)).all()
+        }
+    
+    resultados = []
+    zonas = set()
+    for indice, (solicitud, asignacion_id) in enumerate(zip(lote.solicitudes, asignacion_ids)):
+        ci = solicitud.ci
+        zona = solicitud.zona or models.ZONA_POR_DEFECTO
+        if zona in zonas_desconocidas:
+            resultados.append(schemas.ResultadoAsignacionLote(
+                indice=indice, ci=ci, zona=zona, asignada=False, detalle="Zona no encontrada"
+            ))
+            continue
+        zonas.add(zona)
+        if asignacion_id is None:
+            resultados.append(schemas.ResultadoAsignacionLote(
+                indice=indice, ci=ci, zona=zona, asignada=False, detalle=_detalle_rechazo(ci)
+            ))
+        else:
+            resultados.append(schemas.ResultadoAsignacionLote(
+                indice=indice, ci=ci, zona=zona, asignada=True,
+                asignacion=schemas.AsignacionResponse.model_validate(por_id[asignacion_id])
+            ))
+    
+    asignadas = len(ids)
+    rechazadas = len(lote.solicitudes) - asignadas
+    print(f"🚗 LOTE: {asignadas} asignadas, {rechazadas} rechazadas")
+    
+    # Verificar una sola vez por zona si se llenó con este lote
+    for zona in sorted(zonas):
+        verificar_y_registrar_estado_estacionamiento(db, zona)
+    
+    return schemas.AsignacionLoteResponse(
+        asignadas=asignadas,
+        rechazadas=rechazadas,
+        resultados=resultados
+    )
+
 @router.post("/", response_model=schemas.AsignacionResponse)
-def create_asignacion(asignacion: schemas.AsignacionCreate, db: Session = Depends(get_db)):
+async def create_asignacion(
+    asignacion: schemas.AsignacionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100)
+):
     """
     Solicitar un espacio de estacionamiento.
     - Si ci es None, es un usuario normal (anónimo).
     - Si ci tiene valor, busca la reserva asociada.
     """
     # Reutilizar la lógica de /solicitar
-    return solicitar_espacio(asignacion, db)
+    return await solicitar_espacio(asignacion, db, idempotency_key)
 
 @router.get("/activas", response_model=List[schemas.AsignacionResponse])
-def get_asignaciones_activas(db: Session = Depends(get_db)):
-    """Obtener todas las asignaciones activas (no liberadas)"""
-    return crud.get_asignaciones_activas(db=db)
+async def get_asignaciones_activas(zona: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Obtener todas las asignaciones activas (no liberadas), opcionalmente de una zona"""
+    return await ejecutar_en_sesion(db, crud.get_asignaciones_activas, zona, esquema=schemas.AsignacionResponse)
 
 @router.get("/{asignacion_id}", response_model=schemas.AsignacionResponse)
-def get_asignacion(asignacion_id: int, db: Session = Depends(get_db)):
+async def get_asignacion(asignacion_id: int, db: AsyncSession = Depends(get_async_db)):
     """Obtener una asignación específica"""
-    asignacion = crud.get_asignacion(db=db, asignacion_id=asignacion_id)
+    asignacion = await ejecutar_en_sesion(db, crud.get_asignacion, asignacion_id, esquema=schemas.AsignacionResponse)
     if not asignacion:
         raise HTTPException(status_code=404, detail="Asignación no encontrada")
     return asignacion
 
 @router.put("/{asignacion_id}/liberar", response_model=schemas.AsignacionResponse)
-def liberar_asignacion(asignacion_id: int, db: Session = Depends(get_db)):
+async def liberar_asignacion(asignacion_id: int, db: AsyncSession = Depends(get_async_db)):
     """Liberar una asignación (marcar salida del vehículo)"""
+    return await ejecutar_en_sesion(db, _liberar_asignacion, asignacion_id, esquema=schemas.AsignacionResponse)
+
+def _liberar_asignacion(db: Session, asignacion_id: int):
     asignacion = crud.liberar_asignacion(db=db, asignacion_id=asignacion_id)
     if not asignacion:
         raise HTTPException(status_code=404, detail="Asignación no encontrada")
     
-    # Verificar si el estacionamiento dejó de estar lleno con esta liberación
-    verificar_y_registrar_estado_estacionamiento(db)
+    # Verificar si la zona dejó de estar llena con esta liberación
+    verificar_y_registrar_estado_estacionamiento(db, asignacion.zona)
     
     return asignacion
 
 @router.put("/espacio/{espacio_id}/liberar", response_model=schemas.EspacioResponse)
-def liberar_espacio(espacio_id: int, db: Session = Depends(get_db)):
+async def liberar_espacio(espacio_id: int, db: AsyncSession = Depends(get_async_db)):
     """Liberar un espacio directamente (simula sensor detectando salida)"""
+    return await ejecutar_en_sesion(db, _liberar_espacio, espacio_id, esquema=schemas.EspacioResponse)
+
+def _liberar_espacio(db: Session, espacio_id: int):
     espacio = crud.liberar_espacio(db=db, espacio_id=espacio_id)
     if not espacio:
         raise HTTPException(status_code=404, detail="Espacio no encontrado")
     
-    # Verificar si el estacionamiento dejó de estar lleno con esta liberación
-    verificar_y_registrar_estado_estacionamiento(db)
+    # Verificar si la zona dejó de estar llena con esta liberación
+    verificar_y_registrar_estado_estacionamiento(db, espacio.zona)
+    
+    return espacio
+
+@router.post("/sensores/eventos", response_model=schemas.ResultadoEventosSensor)
+async def recibir_eventos_sensores(lote: schemas.LoteEventosSensor, db: AsyncSession = Depends(get_async_db)):
+    """
+    Recibir un lote de eventos de ocupación de sensores (libre / ocupado).
+    Los eventos duplicados de un mismo espacio se colapsan (gana el más reciente)
+    y todo el lote se aplica en una sola transacción.
+    """
+    return await ejecutar_en_sesion(db, _recibir_eventos_sensores, lote)
+
+def _recibir_eventos_sensores(db: Session, lote: schemas.LoteEventosSensor):
+    resultado = crud.aplicar_eventos_sensores(db=db, eventos=lote.eventos)
+    
+    # Verificar una sola vez por zona afectada si cambió de estado con este lote
+    for zona in resultado["zonas"]:
+        verificar_y_registrar_estado_estacionamiento(db, zona)
     
-    return espacio
\ No newline at end of file
+    return resultado
\ No newline at end of file
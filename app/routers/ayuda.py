@@ -2,10 +2,12 @@
 
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import List
-from ..database import get_db
-from ..models import SolicitudAyuda
+from ..database import get_async_db, ejecutar_en_sesion
+from ..models import SolicitudAyuda, ZONA_POR_DEFECTO
+from ..crud import sumar_a_resumenes
 from ..schemas import SolicitudAyudaCreate, SolicitudAyudaResponse, SolicitudAyudaUpdate
 
 router = APIRouter(prefix="/ayuda", tags=["Ayuda"])
@@ -34,6 +36,11 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+def _buscar_solicitud(db: Session, solicitud_id: int):
+    return db.query(SolicitudAyuda).filter(
+        SolicitudAyuda.id == solicitud_id
+    ).first()
+
 # ============================================================
 # ENDPOINTS
 # ============================================================
@@ -41,13 +48,13 @@ manager = ConnectionManager()
 @router.post("/solicitar", response_model=SolicitudAyudaResponse)
 async def solicitar_ayuda(
     solicitud: SolicitudAyudaCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Crear una nueva solicitud de ayuda.
     Usado por la interfaz de usuario (pantalla táctil).
     """
-    try:
+    def crear(sesion: Session):
         # Crear nueva solicitud
         nueva_solicitud = SolicitudAyuda(
             fecha_hora=datetime.now(),
@@ -55,9 +62,15 @@ async def solicitar_ayuda(
             atendida=False
         )
         
-        db.add(nueva_solicitud)
-        db.commit()
-        db.refresh(nueva_solicitud)
+        sesion.add(nueva_solicitud)
+        # Las solicitudes de ayuda no tienen zona: se resumen en la zona por defecto
+        sumar_a_resumenes(sesion, [(nueva_solicitud.fecha_hora, ZONA_POR_DEFECTO, {"solicitudes_ayuda": 1})])
+        sesion.commit()
+        sesion.refresh(nueva_solicitud)
+        return nueva_solicitud
+    
+    try:
+        nueva_solicitud = await ejecutar_en_sesion(db, crear, esquema=SolicitudAyudaResponse)
         
         # Notificar a todos los administradores conectados via WebSocket
         await manager.broadcast({
@@ -75,47 +88,45 @@ async def solicitar_ayuda(
         return nueva_solicitud
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error al crear solicitud de ayuda: {e}")
         raise HTTPException(status_code=500, detail=f"Error al crear solicitud: {str(e)}")
 
 @router.get("/pendientes", response_model=List[SolicitudAyudaResponse])
-def obtener_solicitudes_pendientes(db: Session = Depends(get_db)):
+async def obtener_solicitudes_pendientes(db: AsyncSession = Depends(get_async_db)):
     """
     Obtener todas las solicitudes de ayuda pendientes (no atendidas).
     Usado por el panel de administración.
     """
-    solicitudes = db.query(SolicitudAyuda).filter(
+    solicitudes = await ejecutar_en_sesion(db, lambda sesion: sesion.query(SolicitudAyuda).filter(
         SolicitudAyuda.atendida == False
     ).order_by(
         SolicitudAyuda.fecha_hora.desc()
-    ).all()
+    ).all(), esquema=SolicitudAyudaResponse)
     
     return solicitudes
 
 @router.get("/todas", response_model=List[SolicitudAyudaResponse])
-def obtener_todas_solicitudes(
+async def obtener_todas_solicitudes(
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtener todas las solicitudes de ayuda (atendidas y pendientes).
     Con límite de resultados.
     """
-    solicitudes = db.query(SolicitudAyuda).order_by(
+    solicitudes = await ejecutar_en_sesion(db, lambda sesion: sesion.query(SolicitudAyuda).order_by(
         SolicitudAyuda.fecha_hora.desc()
-    ).limit(limit).all()
+    ).limit(limit).all(), esquema=SolicitudAyudaResponse)
     
     return solicitudes
 
 @router.get("/{solicitud_id}", response_model=SolicitudAyudaResponse)
-def obtener_solicitud(solicitud_id: int, db: Session = Depends(get_db)):
+async def obtener_solicitud(solicitud_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Obtener una solicitud específica por ID.
     """
-    solicitud = db.query(SolicitudAyuda).filter(
-        SolicitudAyuda.id == solicitud_id
-    ).first()
+    solicitud = await ejecutar_en_sesion(db, _buscar_solicitud, solicitud_id, esquema=SolicitudAyudaResponse)
     
     if not solicitud:
         raise HTTPException(status_code=404, detail="Solicitud no encontrada")
@@ -126,30 +137,32 @@ def obtener_solicitud(solicitud_id: int, db: Session = Depends(get_db)):
 async def marcar_como_atendida(
     solicitud_id: int,
     update: SolicitudAyudaUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Marcar una solicitud como atendida.
     Opcionalmente agregar notas.
     """
-    solicitud = db.query(SolicitudAyuda).filter(
-        SolicitudAyuda.id == solicitud_id
-    ).first()
-    
-    if not solicitud:
-        raise HTTPException(status_code=404, detail="Solicitud no encontrada")
-    
-    # Actualizar campos
-    if update.atendida is not None:
-        solicitud.atendida = update.atendida
-        if update.atendida:
-            solicitud.fecha_hora_atencion = datetime.now()
-    
-    if update.notas is not None:
-        solicitud.notas = update.notas
+    def atender(sesion: Session):
+        solicitud = _buscar_solicitud(sesion, solicitud_id)
+        
+        if not solicitud:
+            raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+        
+        # Actualizar campos
+        if update.atendida is not None:
+            solicitud.atendida = update.atendida
+            if update.atendida:
+                solicitud.fecha_hora_atencion = datetime.now()
+        
+        if update.notas is not None:
+            solicitud.notas = update.notas
+        
+        sesion.commit()
+        sesion.refresh(solicitud)
+        return solicitud
     
-    db.commit()
-    db.refresh(solicitud)
+    solicitud = await ejecutar_en_sesion(db, atender, esquema=SolicitudAyudaResponse)
     
     # Notificar actualización via WebSocket
     await manager.broadcast({
@@ -163,19 +176,21 @@ async def marcar_como_atendida(
     return solicitud
 
 @router.delete("/{solicitud_id}")
-async def eliminar_solicitud(solicitud_id: int, db: Session = Depends(get_db)):
+async def eliminar_solicitud(solicitud_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Eliminar una solicitud de ayuda.
     """
-    solicitud = db.query(SolicitudAyuda).filter(
-        SolicitudAyuda.id == solicitud_id
-    ).first()
-    
-    if not solicitud:
-        raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+    def eliminar(sesion: Session):
+        solicitud = _buscar_solicitud(sesion, solicitud_id)
+        
+        if not solicitud:
+            raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+        
+        sesion.delete(solicitud)
+        sumar_a_resumenes(sesion, [(solicitud.fecha_hora, ZONA_POR_DEFECTO, {"solicitudes_ayuda": -1})])
+        sesion.commit()
     
-    db.delete(solicitud)
-    db.commit()
+    await ejecutar_en_sesion(db, eliminar)
     
     return {"message": "Solicitud eliminada exitosamente"}
 
@@ -207,17 +222,21 @@ async def websocket_ayuda(websocket: WebSocket):
 # ============================================================
 
 @router.get("/stats/resumen")
-def obtener_resumen_ayuda(db: Session = Depends(get_db)):
+async def obtener_resumen_ayuda(db: AsyncSession = Depends(get_async_db)):
     """
     Obtener estadísticas resumidas de solicitudes de ayuda.
     """
-    total = db.query(SolicitudAyuda).count()
-    pendientes = db.query(SolicitudAyuda).filter(
-        SolicitudAyuda.atendida == False
-    ).count()
-    atendidas = db.query(SolicitudAyuda).filter(
-        SolicitudAyuda.atendida == True
-    ).count()
+    def contar(sesion: Session):
+        total = sesion.query(SolicitudAyuda).count()
+        pendientes = sesion.query(SolicitudAyuda).filter(
+            SolicitudAyuda.atendida == False
+        ).count()
+        atendidas = sesion.query(SolicitudAyuda).filter(
+            SolicitudAyuda.atendida == True
+        ).count()
+        return total, pendientes, atendidas
+    
+    total, pendientes, atendidas = await ejecutar_en_sesion(db, contar)
     
     return {
         "total": total,
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app import crud, schemas
 from app.database import get_db
 
@@ -15,9 +15,9 @@ def create_incidente(incidente: schemas.IncidenteCreate, db: Session = Depends(g
     return crud.create_incidente(db=db, incidente=incidente)
 
 @router.get("/activos", response_model=List[schemas.IncidenteResponse])
-def get_incidentes_activos(db: Session = Depends(get_db)):
-    """Obtener incidentes no resueltos"""
-    return crud.get_incidentes_activos(db=db)
+def get_incidentes_activos(zona: Optional[str] = None, db: Session = Depends(get_db)):
+    """Obtener incidentes no resueltos (opcionalmente de una zona)"""
+    return crud.get_incidentes_activos(db=db, zona=zona)
 
 @router.get("/{incidente_id}", response_model=schemas.IncidenteResponse)
 def get_incidente(incidente_id: int, db: Session = Depends(get_db)):
@@ -1,18 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Optional
 from datetime import datetime, timedelta
-from ..database import get_db
-from ..models import Asignacion, Espacio, Incidente
-from collections import defaultdict
-
-# Importar SolicitudAyuda solo si existe
-try:
-    from ..models import SolicitudAyuda
-    AYUDA_DISPONIBLE = True
-except ImportError:
-    AYUDA_DISPONIBLE = False
-    print("⚠️  Tabla SolicitudAyuda no disponible")
+from urllib.parse import quote
+from ..database import get_db_reportes
+from .. import aggregates, archive, crud, export, report_jobs, report_memo, schemas
+from ..models import METRICAS_RESUMEN
+from ..report_cache import en_cache
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
@@ -37,11 +32,83 @@ def get_semana_actual():
         fecha_inicio = hoy - timedelta(days=7)
         return fecha_inicio, fecha_fin
 
+def _calcular_rango_detallado(db: Session, fecha_inicio_dt: datetime, fecha_fin_dt: datetime, zona: Optional[str]):
+    """Reporte de /reports/rango-detallado de un período"""
+    # ============================================================
+    # MÉTRICAS POR DÍA
+    # ============================================================
+    # Se leen de los resúmenes diarios (una consulta para todo el rango)
+    resumen_dia = aggregates.resumen_por_dia(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    metricas_por_dia = []
+    
+    fecha_actual = fecha_inicio_dt.date()
+    while fecha_actual <= fecha_fin_dt.date():
+        fecha = fecha_actual.isoformat()
+        resumen = resumen_dia.get(fecha) or dict.fromkeys(METRICAS_RESUMEN, 0)
+        
+        metricas_por_dia.append({
+            "fecha": fecha,
+            "total_vehiculos": resumen["llegadas"],
+            "tiempo_promedio": aggregates.tiempo_promedio_horas(resumen),
+            "solicitudes_ayuda": resumen["solicitudes_ayuda"],
+            "estacionamiento_lleno": resumen["estacionamiento_lleno"],
+            "solicitudes_rechazadas": resumen["rechazos"],
+            "incidentes_manuales": resumen["incidentes_manuales"]
+        })
+        
+        # Siguiente día
+        fecha_actual += timedelta(days=1)
+    
+    # ============================================================
+    # HORAS PICO (del rango completo)
+    # ============================================================
+    horas_ocupacion = aggregates.llegadas_por_hora(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    horas_pico_list = aggregates.horas_pico(horas_ocupacion, 10)
+    
+    # ============================================================
+    # INCIDENTES (del rango completo)
+    # ============================================================
+    incidentes_lista = archive.incidentes_en_rango(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    incidentes_dict = []
+    for inc in incidentes_lista:
+        incidentes_dict.append({
+            "id": inc.id,
+            "tipo_de_incidente": inc.tipo_de_incidente,
+            "hora_de_registro": inc.hora_de_registro.isoformat(),
+            "hora_de_solucion": inc.hora_de_solucion.isoformat() if inc.hora_de_solucion else None,
+            "nota": inc.nota,
+            "id_de_espacio": inc.id_de_espacio,
+            "zona": inc.zona,
+            "espacio": {
+                "numero_de_espacio": inc.numero_de_espacio
+            }
+        })
+    
+    print(f"📊 REPORTE DETALLADO:")
+    print(f"   Rango: {fecha_inicio_dt.date()} - {fecha_fin_dt.date()}")
+    print(f"   Días: {len(metricas_por_dia)}")
+    print(f"   Incidentes: {len(incidentes_dict)}")
+    
+    return {
+        "periodo": {
+            "inicio": fecha_inicio_dt.isoformat(),
+            "fin": fecha_fin_dt.isoformat()
+        },
+        "metricas_por_dia": metricas_por_dia,
+        "horas_pico": horas_pico_list,
+        "incidentes": incidentes_dict
+    }
+
 @router.get("/rango-detallado")
+@en_cache
 def obtener_reporte_rango_detallado(
     fecha_inicio: str,
     fecha_fin: str,
-    db: Session = Depends(get_db)
+    zona: Optional[str] = None,
+    db: Session = Depends(get_db_reportes)
 ):
     """Obtener reporte con métricas desglosadas por día (para Excel)"""
     try:
@@ -49,141 +116,13 @@ def obtener_reporte_rango_detallado(
         fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).replace(hour=0, minute=0, second=0, microsecond=0)
         fecha_fin_dt = datetime.fromisoformat(fecha_fin).replace(hour=23, minute=59, second=59, microsecond=999999)
         
-        # ============================================================
-        # MÉTRICAS POR DÍA
-        # ============================================================
-        metricas_por_dia = []
-        
-        # Iterar cada día en el rango
-        fecha_actual = fecha_inicio_dt
-        while fecha_actual <= fecha_fin_dt:
-            dia_inicio = fecha_actual.replace(hour=0, minute=0, second=0, microsecond=0)
-            dia_fin = fecha_actual.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            # Asignaciones del día
-            asignaciones_dia = db.query(Asignacion).filter(
-                Asignacion.hora_asignado >= dia_inicio,
-                Asignacion.hora_asignado <= dia_fin
-            ).all()
-            
-            # Calcular tiempo promedio del día
-            tiempos = []
-            for asig in asignaciones_dia:
-                if asig.hora_liberado:
-                    hora_asignado = asig.hora_asignado.replace(tzinfo=None) if asig.hora_asignado.tzinfo else asig.hora_asignado
-                    hora_liberado = asig.hora_liberado.replace(tzinfo=None) if asig.hora_liberado.tzinfo else asig.hora_liberado
-                    tiempo = (hora_liberado - hora_asignado).total_seconds() / 3600
-                    if tiempo > 0:
-                        tiempos.append(tiempo)
-            
-            tiempo_promedio = round(sum(tiempos) / len(tiempos), 1) if tiempos else 0
-            
-            # Solicitudes de ayuda del día
-            solicitudes_ayuda = 0
-            if AYUDA_DISPONIBLE:
-                try:
-                    solicitudes_ayuda = db.query(SolicitudAyuda).filter(
-                        SolicitudAyuda.fecha_hora >= dia_inicio,
-                        SolicitudAyuda.fecha_hora <= dia_fin
-                    ).count()
-                except:
-                    pass
-            
-            # Estacionamiento lleno del día
-            estacionamiento_lleno = db.query(Incidente).filter(
-                Incidente.tipo_de_incidente == "estacionamiento_lleno",
-                Incidente.hora_de_registro >= dia_inicio,
-                Incidente.hora_de_registro <= dia_fin
-            ).count()
-            
-            # Solicitudes rechazadas del día
-            solicitudes_rechazadas = db.query(Incidente).filter(
-                Incidente.tipo_de_incidente == "solicitud_rechazada",
-                Incidente.hora_de_registro >= dia_inicio,
-                Incidente.hora_de_registro <= dia_fin
-            ).count()
-            
-            # Incidentes manuales del día
-            incidentes_dia = db.query(Incidente).filter(
-                Incidente.hora_de_registro >= dia_inicio,
-                Incidente.hora_de_registro <= dia_fin,
-                Incidente.tipo_de_incidente.notin_(["estacionamiento_lleno", "solicitud_rechazada"])
-            ).count()
-            
-            metricas_por_dia.append({
-                "fecha": fecha_actual.date().isoformat(),
-                "total_vehiculos": len(asignaciones_dia),
-                "tiempo_promedio": tiempo_promedio,
-                "solicitudes_ayuda": solicitudes_ayuda,
-                "estacionamiento_lleno": estacionamiento_lleno,
-                "solicitudes_rechazadas": solicitudes_rechazadas,
-                "incidentes_manuales": incidentes_dia
-            })
-            
-            # Siguiente día
-            fecha_actual += timedelta(days=1)
-        
-        # ============================================================
-        # HORAS PICO (del rango completo)
-        # ============================================================
-        asignaciones_rango = db.query(Asignacion).filter(
-            Asignacion.hora_asignado >= fecha_inicio_dt,
-            Asignacion.hora_asignado <= fecha_fin_dt
-        ).all()
-        
-        horas_ocupacion = {}
-        for asig in asignaciones_rango:
-            hora = asig.hora_asignado.hour
-            horas_ocupacion[hora] = horas_ocupacion.get(hora, 0) + 1
-        
-        horas_pico_list = sorted(
-            [{"hora": f"{h:02d}:00-{(h+1):02d}:00", "ocupacion": count} 
-             for h, count in horas_ocupacion.items()],
-            key=lambda x: x["ocupacion"],
-            reverse=True
-        )[:10]  # Top 10 horas
-        
-        if horas_pico_list:
-            max_ocupacion = horas_pico_list[0]["ocupacion"]
-            for hora in horas_pico_list:
-                hora["ocupacion"] = round((hora["ocupacion"] / max_ocupacion * 100), 0) if max_ocupacion > 0 else 0
-        
-        # ============================================================
-        # INCIDENTES (del rango completo)
-        # ============================================================
-        incidentes_lista = db.query(Incidente).filter(
-            Incidente.hora_de_registro >= fecha_inicio_dt,
-            Incidente.hora_de_registro <= fecha_fin_dt
-        ).order_by(Incidente.hora_de_registro.desc()).all()
-        
-        incidentes_dict = []
-        for inc in incidentes_lista:
-            incidentes_dict.append({
-                "id": inc.id,
-                "tipo_de_incidente": inc.tipo_de_incidente,
-                "hora_de_registro": inc.hora_de_registro.isoformat(),
-                "hora_de_solucion": inc.hora_de_solucion.isoformat() if inc.hora_de_solucion else None,
-                "nota": inc.nota,
-                "id_de_espacio": inc.id_de_espacio,
-                "espacio": {
-                    "numero_de_espacio": inc.espacio.numero_de_espacio if inc.espacio else None
-                }
-            })
-        
-        print(f"📊 REPORTE DETALLADO:")
-        print(f"   Rango: {fecha_inicio} - {fecha_fin}")
-        print(f"   Días: {len(metricas_por_dia)}")
-        print(f"   Incidentes: {len(incidentes_dict)}")
-        
-        return {
-            "periodo": {
-                "inicio": fecha_inicio_dt.isoformat(),
-                "fin": fecha_fin_dt.isoformat()
-            },
-            "metricas_por_dia": metricas_por_dia,
-            "horas_pico": horas_pico_list,
-            "incidentes": incidentes_dict
-        }
+        # Un período ya cerrado se lee del disco si se calculó antes. El
+        # resultado ya es JSON nativo: JSONResponse evita recorrerlo con
+        # jsonable_encoder (lo más lento con miles de incidentes)
+        return JSONResponse(report_memo.obtener_o_calcular(
+            db, "rango-detallado", fecha_inicio_dt, fecha_fin_dt, zona,
+            lambda: _calcular_rango_detallado(db, fecha_inicio_dt, fecha_fin_dt, zona)
+        ))
         
     except Exception as e:
         print(f"❌ Error en /reports/rango-detallado: {e}")
@@ -191,11 +130,67 @@ def obtener_reporte_rango_detallado(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _calcular_periodo_rango(db: Session, fecha_inicio_dt: datetime, fecha_fin_dt: datetime, zona: Optional[str]):
+    """Partes de /reports/rango que dependen solo del período (no de la ocupación actual)"""
+    # Métricas del rango desde los resúmenes diarios
+    resumen = aggregates.resumen_total(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    total_vehiculos = resumen["llegadas"]
+    tiempo_promedio = aggregates.tiempo_promedio_horas(resumen)
+    
+    # Solicitudes de ayuda
+    solicitudes_ayuda = resumen["solicitudes_ayuda"]
+    
+    # Horas pico
+    horas_ocupacion = aggregates.llegadas_por_hora(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    horas_pico_list = aggregates.horas_pico(horas_ocupacion, 3)
+    
+    # Estacionamiento lleno, solicitudes rechazadas y asignaciones no utilizadas
+    estacionamiento_lleno = resumen["estacionamiento_lleno"]
+    solicitudes_rechazadas = resumen["rechazos"]
+    asignaciones_no_utilizadas = resumen["estadias_cortas"]
+    
+    # Incidentes manuales
+    total_incidentes = resumen["incidentes_manuales"]
+    
+    # Lista completa de incidentes
+    incidentes_lista = archive.incidentes_en_rango(db, fecha_inicio_dt, fecha_fin_dt, zona)
+    
+    incidentes_dict = []
+    for inc in incidentes_lista:
+        incidentes_dict.append({
+            "id": inc.id,
+            "tipo_de_incidente": inc.tipo_de_incidente,
+            "hora_de_registro": inc.hora_de_registro.isoformat(),
+            "hora_de_solucion": inc.hora_de_solucion.isoformat() if inc.hora_de_solucion else None,
+            "nota": inc.nota,
+            "id_de_espacio": inc.id_de_espacio,
+            "zona": inc.zona,
+            "espacio": {
+                "numero_de_espacio": inc.numero_de_espacio
+            }
+        })
+
+    return {
+        "total_vehiculos": total_vehiculos,
+        "tiempo_promedio": tiempo_promedio,
+        "solicitudes_ayuda": solicitudes_ayuda,
+        "estacionamiento_lleno": estacionamiento_lleno,
+        "solicitudes_rechazadas": solicitudes_rechazadas,
+        "asignaciones_no_utilizadas": asignaciones_no_utilizadas,
+        "total_incidentes": total_incidentes,
+        "horas_pico": horas_pico_list,
+        "incidentes": incidentes_dict
+    }
+
 @router.get("/rango")
+@en_cache
 def obtener_reporte_rango(
     fecha_inicio: str,
     fecha_fin: str,
-    db: Session = Depends(get_db)
+    zona: Optional[str] = None,
+    db: Session = Depends(get_db_reportes)
 ):
     """Obtener reporte para un rango de fechas específico"""
     try:
@@ -203,9 +198,9 @@ def obtener_reporte_rango(
         fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).replace(hour=0, minute=0, second=0, microsecond=0)
         fecha_fin_dt = datetime.fromisoformat(fecha_fin).replace(hour=23, minute=59, second=59, microsecond=999999)
         
-        # Obtener todos los espacios
-        espacios = db.query(Espacio).all()
-        total_espacios = len(espacios)
+        # Ocupación actual desde los contadores
+        contadores = crud.get_contadores(db, zona)
+        total_espacios = contadores["total"]
         
         if total_espacios == 0:
             return {
@@ -234,146 +229,52 @@ def obtener_reporte_rango(
                 "incidentes": []
             }
         
-        espacios_disponibles = len([e for e in espacios if e.estado == 'libre'])
-        espacios_ocupados = len([e for e in espacios if e.estado == 'ocupado'])
-        espacios_reservados = len([e for e in espacios if e.reservado == 'si'])
-        
-        # Obtener asignaciones del rango
-        asignaciones_rango = db.query(Asignacion).filter(
-            Asignacion.hora_asignado >= fecha_inicio_dt,
-            Asignacion.hora_asignado <= fecha_fin_dt
-        ).all()
-        
-        total_vehiculos = len(asignaciones_rango)
-        
-        # Calcular tiempo promedio
-        tiempos = []
-        for asig in asignaciones_rango:
-            if asig.hora_liberado:
-                hora_asignado = asig.hora_asignado.replace(tzinfo=None) if asig.hora_asignado.tzinfo else asig.hora_asignado
-                hora_liberado = asig.hora_liberado.replace(tzinfo=None) if asig.hora_liberado.tzinfo else asig.hora_liberado
-                
-                tiempo = (hora_liberado - hora_asignado).total_seconds() / 3600
-                
-                if tiempo > 0:
-                    tiempos.append(tiempo)
+        espacios_disponibles = contadores["disponibles"]
+        espacios_ocupados = contadores["ocupados"]
+        espacios_reservados = contadores["reservados"]
         
-        tiempo_promedio = round(sum(tiempos) / len(tiempos), 1) if tiempos else 0
+        # Métricas del período (se leen del disco si el período ya cerró)
+        periodo = report_memo.obtener_o_calcular(
+            db, "rango", fecha_inicio_dt, fecha_fin_dt, zona,
+            lambda: _calcular_periodo_rango(db, fecha_inicio_dt, fecha_fin_dt, zona)
+        )
         
         # Porcentaje de ocupación actual
         porcentaje_ocupacion = round((espacios_ocupados / total_espacios * 100), 0) if total_espacios > 0 else 0
         
-        # Solicitudes de ayuda
-        solicitudes_ayuda = 0
-        if AYUDA_DISPONIBLE:
-            try:
-                solicitudes_ayuda = db.query(SolicitudAyuda).filter(
-                    SolicitudAyuda.fecha_hora >= fecha_inicio_dt,
-                    SolicitudAyuda.fecha_hora <= fecha_fin_dt
-                ).count()
-            except:
-                pass
-        
-        # Horas pico
-        horas_ocupacion = {}
-        for asig in asignaciones_rango:
-            hora = asig.hora_asignado.hour
-            horas_ocupacion[hora] = horas_ocupacion.get(hora, 0) + 1
-        
-        horas_pico_list = sorted(
-            [{"hora": f"{h:02d}:00-{(h+1):02d}:00", "ocupacion": count} 
-             for h, count in horas_ocupacion.items()],
-            key=lambda x: x["ocupacion"],
-            reverse=True
-        )[:3]
-        
-        if horas_pico_list:
-            max_ocupacion = horas_pico_list[0]["ocupacion"]
-            for hora in horas_pico_list:
-                hora["ocupacion"] = round((hora["ocupacion"] / max_ocupacion * 100), 0) if max_ocupacion > 0 else 0
-        
-        # Estacionamiento lleno
-        estacionamiento_lleno = db.query(Incidente).filter(
-            Incidente.tipo_de_incidente == "estacionamiento_lleno",
-            Incidente.hora_de_registro >= fecha_inicio_dt,
-            Incidente.hora_de_registro <= fecha_fin_dt
-        ).count()
-        
-        # Solicitudes rechazadas
-        solicitudes_rechazadas = db.query(Incidente).filter(
-            Incidente.tipo_de_incidente == "solicitud_rechazada",
-            Incidente.hora_de_registro >= fecha_inicio_dt,
-            Incidente.hora_de_registro <= fecha_fin_dt
-        ).count()
-        
-        # Asignaciones no utilizadas
-        asignaciones_no_utilizadas = 0
-        for asig in asignaciones_rango:
-            if asig.hora_liberado:
-                duracion_segundos = (asig.hora_liberado - asig.hora_asignado).total_seconds()
-                if duracion_segundos < 60:
-                    asignaciones_no_utilizadas += 1
-        
-        # Incidentes manuales
-        total_incidentes = db.query(Incidente).filter(
-            Incidente.hora_de_registro >= fecha_inicio_dt,
-            Incidente.hora_de_registro <= fecha_fin_dt,
-            Incidente.tipo_de_incidente.notin_(["estacionamiento_lleno", "solicitud_rechazada"])
-        ).count()
-        
-        # Lista completa de incidentes
-        incidentes_lista = db.query(Incidente).filter(
-            Incidente.hora_de_registro >= fecha_inicio_dt,
-            Incidente.hora_de_registro <= fecha_fin_dt
-        ).order_by(Incidente.hora_de_registro.desc()).all()
-        
-        incidentes_dict = []
-        for inc in incidentes_lista:
-            incidentes_dict.append({
-                "id": inc.id,
-                "tipo_de_incidente": inc.tipo_de_incidente,
-                "hora_de_registro": inc.hora_de_registro.isoformat(),
-                "hora_de_solucion": inc.hora_de_solucion.isoformat() if inc.hora_de_solucion else None,
-                "nota": inc.nota,
-                "id_de_espacio": inc.id_de_espacio,
-                "espacio": {
-                    "numero_de_espacio": inc.espacio.numero_de_espacio if inc.espacio else None
-                }
-            })
-        
         print(f"📊 REPORTE PERSONALIZADO:")
         print(f"   Rango: {fecha_inicio} - {fecha_fin}")
-        print(f"   Vehículos: {total_vehiculos}")
-        print(f"   Incidentes: {len(incidentes_dict)}")
+        print(f"   Vehículos: {periodo['total_vehiculos']}")
+        print(f"   Incidentes: {len(periodo['incidentes'])}")
         
-        return {
+        return JSONResponse({
             "periodo": {
                 "tipo": "personalizado",
                 "inicio": fecha_inicio_dt.isoformat(),
                 "fin": fecha_fin_dt.isoformat()
             },
             "estadisticas": {
-                "total_incidentes": total_incidentes,
+                "total_incidentes": periodo["total_incidentes"],
                 "semana_actual": False
             },
             "metricas": {
-                "total_vehiculos": total_vehiculos,
-                "tiempo_promedio": tiempo_promedio,
+                "total_vehiculos": periodo["total_vehiculos"],
+                "tiempo_promedio": periodo["tiempo_promedio"],
                 "porcentaje_ocupacion": int(porcentaje_ocupacion),
-                "solicitudes_ayuda": solicitudes_ayuda,
-                "estacionamiento_lleno": estacionamiento_lleno,
-                "solicitudes_rechazadas": solicitudes_rechazadas,
-                "asignaciones_no_utilizadas": asignaciones_no_utilizadas
+                "solicitudes_ayuda": periodo["solicitudes_ayuda"],
+                "estacionamiento_lleno": periodo["estacionamiento_lleno"],
+                "solicitudes_rechazadas": periodo["solicitudes_rechazadas"],
+                "asignaciones_no_utilizadas": periodo["asignaciones_no_utilizadas"]
             },
-            "horas_pico": horas_pico_list,
+            "horas_pico": periodo["horas_pico"],
             "distribucion": {
                 "disponibles": espacios_disponibles,
                 "ocupados": espacios_ocupados,
                 "reservados": espacios_reservados,
                 "total": total_espacios
             },
-            "incidentes": incidentes_dict
-        }
+            "incidentes": periodo["incidentes"]
+        })
         
     except Exception as e:
         print(f"❌ Error en /reports/rango: {e}")
@@ -382,14 +283,15 @@ def obtener_reporte_rango(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/completo")
-def obtener_reporte_completo(db: Session = Depends(get_db)):
+@en_cache
+def obtener_reporte_completo(zona: Optional[str] = None, db: Session = Depends(get_db_reportes)):
     """Obtener reporte completo del sistema para la semana actual"""
     try:
         fecha_inicio, fecha_fin = get_semana_actual()
         
-        # Obtener todos los espacios
-        espacios = db.query(Espacio).all()
-        total_espacios = len(espacios)
+        # Ocupación actual desde los contadores
+        contadores = crud.get_contadores(db, zona)
+        total_espacios = contadores["total"]
         
         if total_espacios == 0:
             return {
@@ -417,121 +319,61 @@ def obtener_reporte_completo(db: Session = Depends(get_db)):
                 }
             }
         
-        espacios_disponibles = len([e for e in espacios if e.estado == 'libre'])
-        espacios_ocupados = len([e for e in espacios if e.estado == 'ocupado'])
-        espacios_reservados = len([e for e in espacios if e.reservado == 'si'])
-        
-        # Obtener asignaciones de la semana
-        asignaciones_semana = db.query(Asignacion).filter(
-            Asignacion.hora_asignado >= fecha_inicio,
-            Asignacion.hora_asignado <= fecha_fin
-        ).all()
-        
-        total_vehiculos = len(asignaciones_semana)
-        
-        # Calcular tiempo promedio
-        tiempos = []
-        for asig in asignaciones_semana:
-            if asig.hora_liberado:
-                # Convertir a naive datetime para evitar problemas de timezone
-                hora_asignado = asig.hora_asignado.replace(tzinfo=None) if asig.hora_asignado.tzinfo else asig.hora_asignado
-                hora_liberado = asig.hora_liberado.replace(tzinfo=None) if asig.hora_liberado.tzinfo else asig.hora_liberado
-                
-                tiempo = (hora_liberado - hora_asignado).total_seconds() / 3600
-                
-                # Solo agregar tiempos positivos (válidos)
-                if tiempo > 0:
-                    tiempos.append(tiempo)
-                else:
-                    print(f"⚠️ Tiempo negativo detectado: Asignación {asig.id} - {tiempo:.2f}h")
-        
-        tiempo_promedio = round(sum(tiempos) / len(tiempos), 1) if tiempos else 0
+        espacios_disponibles = contadores["disponibles"]
+        espacios_ocupados = contadores["ocupados"]
+        espacios_reservados = contadores["reservados"]
+        
+        # Métricas de la semana desde los resúmenes diarios
+        resumen = aggregates.resumen_total(db, fecha_inicio, fecha_fin, zona)
+        
+        total_vehiculos = resumen["llegadas"]
+        
+        # Tiempo promedio (solo estadías con duración positiva)
+        tiempo_promedio = aggregates.tiempo_promedio_horas(resumen)
         
         # Porcentaje de ocupación actual
         porcentaje_ocupacion = round((espacios_ocupados / total_espacios * 100), 0) if total_espacios > 0 else 0
         
         # Solicitudes de ayuda
-        solicitudes_ayuda = 0
-        if AYUDA_DISPONIBLE:
-            try:
-                solicitudes_ayuda = db.query(SolicitudAyuda).filter(
-                    SolicitudAyuda.fecha_hora >= fecha_inicio,
-                    SolicitudAyuda.fecha_hora <= fecha_fin
-                ).count()
-            except:
-                pass
+        solicitudes_ayuda = resumen["solicitudes_ayuda"]
         
         # ============================================================
         # HORAS PICO
         # ============================================================
-        horas_ocupacion = {}
-        for asig in asignaciones_semana:
-            hora = asig.hora_asignado.hour
-            horas_ocupacion[hora] = horas_ocupacion.get(hora, 0) + 1
-        
-        horas_pico_list = sorted(
-            [{"hora": f"{h:02d}:00-{(h+1):02d}:00", "ocupacion": count} 
-             for h, count in horas_ocupacion.items()],
-            key=lambda x: x["ocupacion"],
-            reverse=True
-        )[:3]
-        
-        if horas_pico_list:
-            max_ocupacion = horas_pico_list[0]["ocupacion"]
-            for hora in horas_pico_list:
-                hora["ocupacion"] = round((hora["ocupacion"] / max_ocupacion * 100), 0) if max_ocupacion > 0 else 0
+        horas_ocupacion = aggregates.llegadas_por_hora(db, fecha_inicio, fecha_fin, zona)
+        
+        horas_pico_list = aggregates.horas_pico(horas_ocupacion, 3)
         
         # ============================================================
-        # ESTACIONAMIENTO LLENO - Contar desde tabla INCIDENTES
+        # ESTACIONAMIENTO LLENO - Incidentes "estacionamiento_lleno"
         # ============================================================
-        estacionamiento_lleno = db.query(Incidente).filter(
-            Incidente.tipo_de_incidente == "estacionamiento_lleno",
-            Incidente.hora_de_registro >= fecha_inicio,
-            Incidente.hora_de_registro <= fecha_fin
-        ).count()
+        estacionamiento_lleno = resumen["estacionamiento_lleno"]
         
-        print(f"📊 Estacionamiento lleno esta semana: {estacionamiento_lleno} veces (desde incidentes)")
+        print(f"📊 Estacionamiento lleno esta semana: {estacionamiento_lleno} veces (desde resúmenes)")
         
         # ============================================================
-        # SOLICITUDES RECHAZADAS - Contar desde tabla INCIDENTES
+        # SOLICITUDES RECHAZADAS - Desde resúmenes (métrica rechazos)
         # ============================================================
-        solicitudes_rechazadas = db.query(Incidente).filter(
-            Incidente.tipo_de_incidente == "solicitud_rechazada",
-            Incidente.hora_de_registro >= fecha_inicio,
-            Incidente.hora_de_registro <= fecha_fin
-        ).count()
+        solicitudes_rechazadas = resumen["rechazos"]
         
         print(f"🚫 Solicitudes rechazadas esta semana: {solicitudes_rechazadas}")
         
         # ============================================================
-        # ASIGNACIONES NO UTILIZADAS - Por implementar
+        # ASIGNACIONES NO UTILIZADAS
         # ============================================================
         # Criterio: Asignaciones que fueron liberadas en menos de 1 minuto
-        asignaciones_no_utilizadas = 0
-        for asig in asignaciones_semana:
-            if asig.hora_liberado:
-                duracion_segundos = (asig.hora_liberado - asig.hora_asignado).total_seconds()
-                if duracion_segundos < 60:  # Menos de 1 minuto
-                    asignaciones_no_utilizadas += 1
+        asignaciones_no_utilizadas = resumen["estadias_cortas"]
         
         # ============================================================
         # INCIDENTES TOTALES (excluyendo automáticos)
         # ============================================================
         # Total de incidentes MANUALES (no automáticos)
-        total_incidentes = db.query(Incidente).filter(
-            Incidente.hora_de_registro >= fecha_inicio,
-            Incidente.hora_de_registro <= fecha_fin,
-            # Excluir incidentes automáticos del sistema
-            Incidente.tipo_de_incidente.notin_(["estacionamiento_lleno", "solicitud_rechazada"])
-        ).count()
+        total_incidentes = resumen["incidentes_manuales"]
         
         # ============================================================
         # LISTA COMPLETA DE INCIDENTES (para exportación)
         # ============================================================
-        incidentes_lista = db.query(Incidente).filter(
-            Incidente.hora_de_registro >= fecha_inicio,
-            Incidente.hora_de_registro <= fecha_fin
-        ).order_by(Incidente.hora_de_registro.desc()).all()
+        incidentes_lista = archive.incidentes_en_rango(db, fecha_inicio, fecha_fin, zona)
         
         # Convertir a diccionarios para JSON
         incidentes_dict = []
@@ -543,8 +385,9 @@ def obtener_reporte_completo(db: Session = Depends(get_db)):
                 "hora_de_solucion": inc.hora_de_solucion.isoformat() if inc.hora_de_solucion else None,
                 "nota": inc.nota,
                 "id_de_espacio": inc.id_de_espacio,
+                "zona": inc.zona,
                 "espacio": {
-                    "numero_de_espacio": inc.espacio.numero_de_espacio if inc.espacio else None
+                    "numero_de_espacio": inc.numero_de_espacio
                 }
             })
         
@@ -591,41 +434,36 @@ def obtener_reporte_completo(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/estadisticas/actual")
-def obtener_estadisticas_actuales(db: Session = Depends(get_db)):
+@en_cache
+def obtener_estadisticas_actuales(zona: Optional[str] = None, db: Session = Depends(get_db_reportes)):
     """Obtener estadísticas en tiempo real (sin filtro de semana)"""
     try:
-        espacios = db.query(Espacio).all()
+        contadores = crud.get_contadores(db, zona)
         
-        disponibles = sum(1 for e in espacios if e.estado == 'libre')
-        ocupados = sum(1 for e in espacios if e.estado == 'ocupado')
-        reservados = sum(1 for e in espacios if e.reservado == 'si')
+        disponibles = contadores["disponibles"]
+        ocupados = contadores["ocupados"]
+        reservados = contadores["reservados"]
+        total = contadores["total"]
         
         return {
             "disponibles": disponibles,
             "ocupados": ocupados,
             "reservados": reservados,
-            "total": len(espacios),
-            "porcentaje_ocupacion": round((ocupados / len(espacios) * 100), 0) if espacios else 0
+            "total": total,
+            "porcentaje_ocupacion": round((ocupados / total * 100), 0) if total else 0
         }
     except Exception as e:
         print(f"Error en estadisticas/actual: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/vehiculos-por-dia")
-def obtener_vehiculos_por_dia(db: Session = Depends(get_db)):
+@en_cache
+def obtener_vehiculos_por_dia(zona: Optional[str] = None, db: Session = Depends(get_db_reportes)):
     """Obtener vehículos ingresados por día en la semana actual"""
     try:
         fecha_inicio, fecha_fin = get_semana_actual()
         
-        asignaciones = db.query(Asignacion).filter(
-            Asignacion.hora_asignado >= fecha_inicio,
-            Asignacion.hora_asignado <= fecha_fin
-        ).all()
-        
-        conteo_por_fecha = {}
-        for asig in asignaciones:
-            fecha_str = asig.hora_asignado.date().isoformat()
-            conteo_por_fecha[fecha_str] = conteo_por_fecha.get(fecha_str, 0) + 1
+        resumen_dia = aggregates.resumen_por_dia(db, fecha_inicio, fecha_fin, zona)
         
         dias_es = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
         resultado = []
@@ -634,7 +472,7 @@ def obtener_vehiculos_por_dia(db: Session = Depends(get_db)):
         while fecha_actual <= fecha_fin.date():
             fecha_str = fecha_actual.isoformat()
             dia_semana = dias_es[fecha_actual.weekday()]
-            cantidad = conteo_por_fecha.get(fecha_str, 0)
+            cantidad = resumen_dia[fecha_str]["llegadas"] if fecha_str in resumen_dia else 0
             
             resultado.append({
                 "fecha": fecha_str,
@@ -650,4 +488,229 @@ def obtener_vehiculos_por_dia(db: Session = Depends(get_db)):
         print(f"Error en vehiculos-por-dia: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _validar_resolucion(resolucion: str):
+    if resolucion not in aggregates.RESOLUCIONES:
+        raise HTTPException(status_code=400, detail=f"Resolución desconocida: {resolucion} (válidas: {', '.join(aggregates.RESOLUCIONES)})")
+
+def _calcular_ocupacion_timeline(db: Session, fecha_inicio_dt: datetime, fecha_fin_dt: datetime, zona: Optional[str],
+                                 resolucion: str, capacidad: Optional[int]):
+    """Reporte de /reports/ocupacion-timeline (ValueError si tiene demasiados intervalos)"""
+    if capacidad is None:
+        # Lleno como en el incidente "estacionamiento_lleno": ocupados >= no reservados
+        capacidad = crud.get_contadores(db, zona)["no_reservados"]
+    timeline = aggregates.ocupacion_timeline(db, fecha_inicio_dt, fecha_fin_dt, zona, resolucion, capacidad)
+
+    print(f"📈 OCUPACIÓN: {fecha_inicio_dt.date()} - {fecha_fin_dt.date()} por {resolucion}, "
+          f"{len(timeline['intervalos'])} intervalos, máxima {timeline['totales']['ocupacion_maxima']}")
+
+    return {
+        "periodo": {
+            "inicio": fecha_inicio_dt.isoformat(),
+            "fin": fecha_fin_dt.isoformat()
+        },
+        "resolucion": resolucion,
+        "zona": zona,
+        "capacidad": capacidad,
+        **timeline
+    }
+
+@router.get("/ocupacion-timeline")
+@en_cache
+def obtener_ocupacion_timeline(
+    fecha_inicio: str,
+    fecha_fin: str,
+    resolucion: str = "hora",
+    zona: Optional[str] = None,
+    capacidad: Optional[int] = None,
+    db: Session = Depends(get_db_reportes)
+):
+    """
+    Ocupación simultánea por minuto, hora o día (resolucion): promedio, máxima,
+    espacio-horas y minutos con el estacionamiento lleno. Sin capacidad, se usa
+    la cantidad actual de espacios no reservados (de la zona), la misma
+    definición de lleno que el incidente "estacionamiento_lleno".
+    """
+    _validar_resolucion(resolucion)
+    try:
+        fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).replace(hour=0, minute=0, second=0, microsecond=0)
+        fecha_fin_dt = datetime.fromisoformat(fecha_fin).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {e}")
+
+    try:
+        return JSONResponse(_calcular_ocupacion_timeline(db, fecha_inicio_dt, fecha_fin_dt, zona, resolucion, capacidad))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error en /reports/ocupacion-timeline: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _validar_agrupar(agrupar: Optional[str]):
+    if agrupar not in (None, "dia", "espacio"):
+        raise HTTPException(status_code=400, detail=f"Agrupación desconocida: {agrupar} (válidas: dia, espacio)")
+
+def _calcular_percentiles_estadia(db: Session, fecha_inicio_dt: datetime, fecha_fin_dt: datetime, zona: Optional[str],
+                                  agrupar: Optional[str]):
+    """Reporte de /reports/estadias-percentiles"""
+    percentiles = aggregates.percentiles_estadia(db, fecha_inicio_dt, fecha_fin_dt, zona, agrupar)
+
+    total = percentiles["total"]
+    print(f"⏱️ ESTADÍAS: {fecha_inicio_dt.date()} - {fecha_fin_dt.date()}, {total['estadias']} estadías, "
+          f"p50 {total['p50_minutos']} / p90 {total['p90_minutos']} / p99 {total['p99_minutos']} min")
+
+    return {
+        "periodo": {
+            "inicio": fecha_inicio_dt.isoformat(),
+            "fin": fecha_fin_dt.isoformat()
+        },
+        "zona": zona,
+        **percentiles
+    }
+
+@router.get("/estadias-percentiles")
+@en_cache
+def obtener_percentiles_estadia(
+    fecha_inicio: str,
+    fecha_fin: str,
+    zona: Optional[str] = None,
+    agrupar: Optional[str] = None,
+    db: Session = Depends(get_db_reportes)
+):
+    """
+    Percentiles 50, 90 y 99 de la duración de las estadías (en minutos) que
+    llegaron en el rango, del total y por día o por espacio (agrupar). Se
+    calculan uniendo los sketches diarios, sin leer las asignaciones.
+    """
+    _validar_agrupar(agrupar)
+    try:
+        fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).replace(hour=0, minute=0, second=0, microsecond=0)
+        fecha_fin_dt = datetime.fromisoformat(fecha_fin).replace(hour=23, minute=59, second=59, microsecond=999999)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {e}")
+
+    try:
+        return JSONResponse(_calcular_percentiles_estadia(db, fecha_inicio_dt, fecha_fin_dt, zona, agrupar))
+    except Exception as e:
+        print(f"❌ Error en /reports/estadias-percentiles: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export/{origen}")
+def exportar_historial(
+    origen: str,
+    formato: str = "csv",
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    zona: Optional[str] = None
+):
+    """
+    Exportar asignaciones, incidentes o solicitudes de ayuda (origen) como CSV
+    o NDJSON, enviados por partes a medida que se leen. Sin fechas, exporta
+    todo el historial.
+    """
+    if origen not in export.COLUMNAS:
+        raise HTTPException(status_code=404, detail=f"Origen desconocido: {origen} (válidos: {', '.join(export.COLUMNAS)})")
+    if formato not in export.FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato desconocido: {formato} (válidos: {', '.join(export.FORMATOS)})")
+    try:
+        fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).replace(hour=0, minute=0, second=0, microsecond=0) if fecha_inicio else None
+        fecha_fin_dt = datetime.fromisoformat(fecha_fin).replace(hour=23, minute=59, second=59, microsecond=999999) if fecha_fin else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {e}")
+
+    nombre = "_".join(p for p in [origen, fecha_inicio_dt and fecha_inicio_dt.date().isoformat(),
+                                  fecha_fin_dt and fecha_fin_dt.date().isoformat(), zona and quote(zona, safe="")] if p)
+    return StreamingResponse(
+        export.exportar(origen, formato, fecha_inicio_dt, fecha_fin_dt, zona),
+        media_type=export.FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
+
+
+# ============================================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================================
+# Los mismos reportes, calculados fuera del pedido HTTP (ver app/report_jobs.py).
+# Reciben los parámetros ya validados y normalizados de crear_trabajo_reporte.
+def _dia_inicio(fecha: str) -> datetime:
+    return datetime.fromisoformat(fecha).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _dia_fin(fecha: str) -> datetime:
+    return datetime.fromisoformat(fecha).replace(hour=23, minute=59, second=59, microsecond=999999)
+
+def _trabajo_rango_detallado(db: Session, parametros: dict):
+    fecha_inicio_dt, fecha_fin_dt = _dia_inicio(parametros["fecha_inicio"]), _dia_fin(parametros["fecha_fin"])
+    return report_memo.obtener_o_calcular(
+        db, "rango-detallado", fecha_inicio_dt, fecha_fin_dt, parametros.get("zona"),
+        lambda: _calcular_rango_detallado(db, fecha_inicio_dt, fecha_fin_dt, parametros.get("zona"))
+    )
+
+def _trabajo_ocupacion_timeline(db: Session, parametros: dict):
+    return _calcular_ocupacion_timeline(
+        db, _dia_inicio(parametros["fecha_inicio"]), _dia_inicio(parametros["fecha_fin"]) + timedelta(days=1),
+        parametros.get("zona"), parametros["resolucion"], parametros.get("capacidad")
+    )
+
+def _trabajo_percentiles_estadia(db: Session, parametros: dict):
+    return _calcular_percentiles_estadia(
+        db, _dia_inicio(parametros["fecha_inicio"]), _dia_fin(parametros["fecha_fin"]), parametros.get("zona"), parametros.get("agrupar")
+    )
+
+TRABAJOS = {
+    "rango-detallado": _trabajo_rango_detallado,
+    "ocupacion-timeline": _trabajo_ocupacion_timeline,
+    "estadias-percentiles": _trabajo_percentiles_estadia,
+}
+
+@router.post("/trabajos", response_model=schemas.TrabajoReporteResponse, status_code=202)
+def crear_trabajo_reporte(trabajo: schemas.TrabajoReporteCreate):
+    """
+    Encolar un reporte largo y devolver su id sin esperar el cálculo. Un pedido
+    igual a uno que todavía no terminó devuelve ese mismo trabajo.
+    """
+    if trabajo.tipo not in TRABAJOS:
+        raise HTTPException(status_code=400, detail=f"Tipo de reporte desconocido: {trabajo.tipo} (válidos: {', '.join(TRABAJOS)})")
+    if trabajo.fecha_fin < trabajo.fecha_inicio:
+        raise HTTPException(status_code=400, detail="fecha_fin es anterior a fecha_inicio")
+
+    parametros = trabajo.model_dump(mode="json", exclude={"tipo"}, exclude_none=True)
+    if trabajo.tipo == "ocupacion-timeline":
+        parametros.setdefault("resolucion", "hora")
+        _validar_resolucion(parametros["resolucion"])
+    if trabajo.tipo == "estadias-percentiles":
+        _validar_agrupar(trabajo.agrupar)
+
+    calcular = TRABAJOS[trabajo.tipo]
+    try:
+        return report_jobs.enviar(trabajo.tipo, parametros, lambda db: calcular(db, parametros))
+    except report_jobs.ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+@router.get("/trabajos/{trabajo_id}", response_model=schemas.TrabajoReporteResponse)
+def obtener_trabajo_reporte(trabajo_id: str):
+    """Estado de un trabajo: pendiente, ejecutando, terminado o error"""
+    estado = report_jobs.leer_estado(trabajo_id)
+    if not estado:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    return estado
+
+@router.get("/trabajos/{trabajo_id}/resultado")
+def descargar_resultado_trabajo(trabajo_id: str):
+    """Resultado de un trabajo terminado (el mismo JSON que el endpoint del reporte)"""
+    estado = report_jobs.leer_estado(trabajo_id)
+    if not estado:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    if estado["estado"] == "error":
+        raise HTTPException(status_code=409, detail=f"El trabajo terminó con error: {estado['error']}")
+    if estado["estado"] != "terminado":
+        raise HTTPException(status_code=409, detail=f"El trabajo todavía no terminó (estado: {estado['estado']})")
+
+    parametros = estado["parametros"]
+    nombre = "_".join(x for x in [estado["tipo"], parametros["fecha_inicio"], parametros["fecha_fin"], parametros.get("zona") and quote(parametros["zona"], safe="")] if x)
+    # Se envía el archivo tal cual, sin cargarlo ni volver a serializarlo
+    return FileResponse(report_jobs.ruta_resultado(trabajo_id), media_type="application/json", filename=f"{nombre}.json")
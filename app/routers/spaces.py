@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app import crud, schemas
-from app.database import get_db
+from app.database import get_async_db, ejecutar_en_sesion
 
 router = APIRouter(
     prefix="/espacios",
@@ -10,32 +10,39 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.EspacioResponse)
-def create_espacio(espacio: schemas.EspacioCreate, db: Session = Depends(get_db)):
+async def create_espacio(espacio: schemas.EspacioCreate, db: AsyncSession = Depends(get_async_db)):
     """Crear un nuevo espacio de estacionamiento"""
-    return crud.create_espacio(db=db, espacio=espacio)
+    return await ejecutar_en_sesion(db, crud.create_espacio, espacio, esquema=schemas.EspacioResponse)
 
 @router.get("/", response_model=List[schemas.EspacioResponse])
-def get_espacios(db: Session = Depends(get_db)):
-    """Obtener todos los espacios"""
-    return crud.get_espacios(db=db)
+async def get_espacios(zona: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Obtener todos los espacios (opcionalmente de una zona)"""
+    return await ejecutar_en_sesion(db, crud.get_espacios, zona, esquema=schemas.EspacioResponse)
 
 @router.get("/disponibles", response_model=List[schemas.EspacioResponse])
-def get_espacios_disponibles(db: Session = Depends(get_db)):
-    """Obtener solo espacios disponibles"""
-    return crud.get_espacios_disponibles(db=db)
+async def get_espacios_disponibles(zona: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Obtener solo espacios disponibles (opcionalmente de una zona)"""
+    return await ejecutar_en_sesion(
+        db, lambda sesion: crud.get_espacios_disponibles(sesion, zona=zona), esquema=schemas.EspacioResponse
+    )
+
+@router.get("/zonas", response_model=List[str])
+async def get_zonas(db: AsyncSession = Depends(get_async_db)):
+    """Obtener las zonas (niveles / playas) existentes"""
+    return await ejecutar_en_sesion(db, crud.get_zonas)
 
 @router.get("/{espacio_id}", response_model=schemas.EspacioResponse)
-def get_espacio(espacio_id: int, db: Session = Depends(get_db)):
+async def get_espacio(espacio_id: int, db: AsyncSession = Depends(get_async_db)):
     """Obtener un espacio específico"""
-    espacio = crud.get_espacio(db=db, espacio_id=espacio_id)
+    espacio = await ejecutar_en_sesion(db, crud.get_espacio, espacio_id, esquema=schemas.EspacioResponse)
     if not espacio:
         raise HTTPException(status_code=404, detail="Espacio no encontrado")
     return espacio
 
 @router.put("/{espacio_id}", response_model=schemas.EspacioResponse)
-def update_espacio(espacio_id: int, espacio_update: schemas.EspacioUpdate, db: Session = Depends(get_db)):
-    """Actualizar un espacio (estado y/o reservado)"""
-    espacio = crud.update_espacio(db=db, espacio_id=espacio_id, espacio_update=espacio_update)
+async def update_espacio(espacio_id: int, espacio_update: schemas.EspacioUpdate, db: AsyncSession = Depends(get_async_db)):
+    """Actualizar un espacio (estado, reservado y/o zona)"""
+    espacio = await ejecutar_en_sesion(db, crud.update_espacio, espacio_id, espacio_update, esquema=schemas.EspacioResponse)
     if not espacio:
         raise HTTPException(status_code=404, detail="Espacio no encontrado")
     return espacio
\ No newline at end of file
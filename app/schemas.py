@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
 
@@ -47,6 +47,7 @@ class EspacioBase(BaseModel):
     numero_de_espacio: int = Field(..., gt=0)
     estado: str = "libre"  # libre, ocupado
     reservado: str = "no"  # si, no
+    zona: str = Field("general", min_length=1, max_length=50)
 
 class EspacioCreate(EspacioBase):
     pass
@@ -54,12 +55,14 @@ class EspacioCreate(EspacioBase):
 class EspacioUpdate(BaseModel):
     estado: Optional[str] = None
     reservado: Optional[str] = None
+    zona: Optional[str] = Field(None, min_length=1, max_length=50)
 
 class EspacioResponse(BaseModel):
     id: int
     numero_de_espacio: int
     estado: str
     reservado: str
+    zona: str
     
     class Config:
         from_attributes = True
@@ -72,11 +75,13 @@ class AsignacionBase(BaseModel):
 
 class AsignacionCreate(BaseModel):
     ci: Optional[int] = None  # CI del usuario con reserva, o null para usuario normal
+    zona: Optional[str] = Field(None, min_length=1, max_length=50)  # null = zona "general"
 
 class AsignacionResponse(BaseModel):
     id: int
     ci_reserva: Optional[int]
     id_de_espacio: int
+    zona: str
     hora_asignado: datetime
     hora_liberado: Optional[datetime]
     espacio: EspacioResponse
@@ -86,11 +91,50 @@ class AsignacionResponse(BaseModel):
         from_attributes = True
 
 
+class AsignacionLoteCreate(BaseModel):
+    solicitudes: List[AsignacionCreate] = Field(..., min_length=1, max_length=500)
+
+class ResultadoAsignacionLote(BaseModel):
+    indice: int
+    ci: Optional[int] = None
+    zona: str
+    asignada: bool
+    asignacion: Optional[AsignacionResponse] = None
+    detalle: Optional[str] = None
+
+class AsignacionLoteResponse(BaseModel):
+    asignadas: int
+    rechazadas: int
+    resultados: List[ResultadoAsignacionLote]
+
+
+class EventoSensor(BaseModel):
+    espacio_id: int
+    estado: str = Field(..., pattern="^(libre|ocupado)$")
+    timestamp: datetime
+
+class LoteEventosSensor(BaseModel):
+    eventos: List[EventoSensor] = Field(..., min_length=1, max_length=20000)
+
+class ResultadoEventosSensor(BaseModel):
+    recibidos: int
+    espacios: int
+    liberados: int
+    ocupados: int
+    asignaciones_cerradas: int
+    sin_cambios: int
+    futuros: int  # eventos descartados por tener hora futura
+    atrasados: int  # "libre" anteriores a la asignación activa, ignorados
+    desconocidos: List[int]
+    zonas: List[str]
+
+
 # ============ INCIDENTE SCHEMAS ============
 class IncidenteBase(BaseModel):
     id_de_espacio: int
     tipo_de_incidente: str
     nota: Optional[str] = None
+    zona: Optional[str] = None  # null = zona del espacio
 
 class IncidenteCreate(IncidenteBase):
     pass
@@ -102,6 +146,7 @@ class IncidenteUpdate(BaseModel):
 class IncidenteResponse(BaseModel):
     id: int
     id_de_espacio: int
+    zona: str
     tipo_de_incidente: str
     hora_de_registro: datetime
     hora_de_solucion: Optional[datetime]
@@ -126,10 +171,31 @@ class EstadisticasResponse(BaseModel):
     total_incidentes: int
     promedio_horas_ocupacion: float
 
+# ============ TRABAJOS DE REPORTES SCHEMAS ============
+class TrabajoReporteCreate(BaseModel):
+    tipo: str  # "rango-detallado", "ocupacion-timeline", "estadias-percentiles"
+    fecha_inicio: date
+    fecha_fin: date
+    zona: Optional[str] = None
+    resolucion: Optional[str] = None  # ocupacion-timeline
+    capacidad: Optional[int] = None  # ocupacion-timeline
+    agrupar: Optional[str] = None  # estadias-percentiles
+
+class TrabajoReporteResponse(BaseModel):
+    id: str
+    tipo: str
+    parametros: dict
+    estado: str  # "pendiente", "ejecutando", "terminado", "error"
+    creado: datetime
+    iniciado: Optional[datetime] = None
+    terminado: Optional[datetime] = None
+    vence: Optional[datetime] = None
+    error: Optional[str] = None
+
 
 # ============ WEBSOCKET MESSAGES ============
 class WebSocketMessage(BaseModel):
-    type: str  # "espacio_update", "nueva_asignacion", "nuevo_incidente"
+    type: str  # "espacio_update", "nueva_asignacion", "nuevo_incidente", "trabajo_reporte"
     data: dict
 
 
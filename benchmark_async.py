@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Benchmark: camino síncrono (threadpool) vs camino async (aiosqlite)
+# Ejecutar: python benchmark_async.py [--clientes 200] [--segundos 10] [--espacios 100]
+#
+# Levanta dos aplicaciones en proceso sobre la misma base SQLite temporal:
+#   - "sync":  los mismos handlers de /asignaciones y /espacios declarados con
+#              def + Depends(get_db), como antes (cada request ocupa un hilo
+#              del threadpool de Starlette, limitado a 40)
+#   - "async": la aplicación real (app.main), con AsyncSession y run_sync
+# Cada cliente repite: solicitar espacio -> liberar asignación -> listar disponibles.
+# Se informa throughput (req/s), latencias p50/p95 y errores de cada modo.
+#
+# Con más clientes que hilos, el modo sync puede agotar el pool de conexiones:
+# los 40 hilos esperan una conexión mientras las sesiones que las tienen
+# esperan un hilo libre para cerrarse. Para que el benchmark termine, ese modo
+# usa --timeout-pool (las esperas agotadas se cuentan como errores).
+
+import sys
+sys.path.append('.')
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+# La base de datos es ./parking.db: trabajar en un directorio temporal
+directorio = tempfile.mkdtemp(prefix="parking_benchmark_")
+os.chdir(directorio)
+
+import httpx
+from fastapi import FastAPI, Depends
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import (
+    Base, engine, async_engine, SessionLocal, SQLALCHEMY_DATABASE_URL, ES_SQLITE,
+    _opciones_engine, _configurar_conexion_sqlite
+)
+from app.allocator import asignador
+from app.main import app as app_async
+from app.routers import assignments
+from app import crud, models, schemas
+
+
+def crear_app_sync(timeout_pool):
+    """Los mismos handlers, servidos por el threadpool con una Session síncrona"""
+    engine_sync = create_engine(
+        SQLALCHEMY_DATABASE_URL, **_opciones_engine(), pool_timeout=timeout_pool
+    )
+    if ES_SQLITE:
+        event.listen(engine_sync, "connect", _configurar_conexion_sqlite)
+    Sesion = sessionmaker(autocommit=False, autoflush=False, bind=engine_sync)
+
+    def get_db():
+        db = Sesion()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.post("/asignaciones/solicitar", response_model=schemas.AsignacionResponse)
+    def solicitar(asignacion: schemas.AsignacionCreate, db: Session = Depends(get_db)):
+        return assignments._solicitar_espacio(db, asignacion, None)
+
+    @app.put("/asignaciones/{asignacion_id}/liberar", response_model=schemas.AsignacionResponse)
+    def liberar(asignacion_id: int, db: Session = Depends(get_db)):
+        return assignments._liberar_asignacion(db, asignacion_id)
+
+    @app.get("/espacios/disponibles", response_model=list[schemas.EspacioResponse])
+    def disponibles(db: Session = Depends(get_db)):
+        return crud.get_espacios_disponibles(db)
+
+    return app
+
+
+def preparar_base(cantidad_espacios):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.Espacio(numero_de_espacio=i, estado="libre", reservado="no")
+            for i in range(1, cantidad_espacios + 1)
+        ])
+        db.flush()
+        crud.recalcular_contadores(db)
+        db.commit()
+        asignador.cargar(db)
+    finally:
+        db.close()
+
+
+async def cliente(http, hasta, latencias, errores):
+    while time.perf_counter() < hasta:
+        inicio = time.perf_counter()
+        try:
+            r = await http.post("/asignaciones/solicitar", json={"ci": None})
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code == 200:
+                inicio = time.perf_counter()
+                r = await http.put(f"/asignaciones/{r.json()['id']}/liberar")
+                latencias.append(time.perf_counter() - inicio)
+            elif r.status_code != 404:
+                errores.append(r.status_code)
+            inicio = time.perf_counter()
+            r = await http.get("/espacios/disponibles")
+            latencias.append(time.perf_counter() - inicio)
+        except Exception as e:
+            errores.append(type(e).__name__)
+
+
+async def medir(app, clientes, segundos):
+    latencias, errores = [], []
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark") as http:
+        hasta = time.perf_counter() + segundos
+        await asyncio.gather(*[cliente(http, hasta, latencias, errores) for _ in range(clientes)])
+    # Las conexiones aiosqlite pertenecen a este event loop
+    await async_engine.dispose()
+    return latencias, errores
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del camino síncrono vs async")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--espacios", type=int, default=100)
+    parser.add_argument("--timeout-pool", type=float, default=5)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🚗 {args.clientes} clientes concurrentes durante {args.segundos:g}s ({args.espacios} espacios)")
+    print("=" * 60)
+
+    resultados = {}
+    for modo, app in (("sync", crear_app_sync(args.timeout_pool)), ("async", app_async)):
+        preparar_base(args.espacios)
+        latencias, errores = asyncio.run(medir(app, args.clientes, args.segundos))
+        resultados[modo] = len(latencias) / args.segundos
+        print(f"\n📊 {modo.upper()}")
+        print(f"   Requests:   {len(latencias)}")
+        print(f"   Throughput: {resultados[modo]:.1f} req/s")
+        print(f"   p50:        {percentil(latencias, 0.50) * 1000:.1f} ms")
+        print(f"   p95:        {percentil(latencias, 0.95) * 1000:.1f} ms")
+        print(f"   Errores:    {len(errores)}" + (f" ({', '.join(map(str, sorted(set(errores))))})" if errores else ""))
+        if latencias:
+            print(f"   Media:      {statistics.mean(latencias) * 1000:.1f} ms")
+
+    if resultados["sync"]:
+        print(f"\n✅ async / sync: {resultados['async'] / resultados['sync']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Cantidad de sentencias SQL por endpoint (detección de consultas N+1)
+# Ejecutar: python contar_consultas.py
+#
+# Crea una base SQLite temporal, llama a cada endpoint de listas y reportes
+# con pocos datos y de nuevo con diez veces más, y cuenta las sentencias que
+# llegan a la base (todos los engines: sync, async y de reportes). Cada
+# endpoint tiene una cantidad fija esperada (ESPERADAS) que no puede depender
+# de la cantidad de filas: una relación cargada perezosamente por fila la
+# haría crecer. Termina con código 1 si algún endpoint no coincide.
+
+import sys
+sys.path.append('.')
+
+import os
+import tempfile
+
+_directorio = tempfile.mkdtemp(prefix="parking_consultas_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directorio, 'parking.db')}"
+os.environ["REPORTES_MEMO_DIR"] = os.path.join(_directorio, "reportes_cerrados")
+os.environ["REPORTES_CACHE_TTL_SEGUNDOS"] = "0"  # Sin cache: se cuenta el cálculo
+os.environ["ARCHIVO_INTERVALO_HORAS"] = "0"
+
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import aggregates, crud, models
+from app.allocator import asignador
+from app.database import SessionLocal, async_engine, engine, engine_reportes
+from app.main import app
+
+HOY = datetime.now().date()
+HACE_UNA_SEMANA = (HOY - timedelta(days=7)).isoformat()
+
+# endpoint -> sentencias esperadas (las mismas con cualquier cantidad de filas)
+ESPERADAS = {
+    "/espacios/": 1,
+    "/espacios/disponibles": 1,
+    "/asignaciones/activas": 1,
+    "/asignaciones/1": 1,
+    "/incidentes/activos": 1,
+    "/incidentes/1": 1,
+    "/ayuda/pendientes": 1,
+    "/ayuda/todas": 1,
+    "/usuarios-reserva/": 1,
+    f"/reports/rango?fecha_inicio={HACE_UNA_SEMANA}&fecha_fin={HOY.isoformat()}": 6,
+    f"/reports/rango-detallado?fecha_inicio={HACE_UNA_SEMANA}&fecha_fin={HOY.isoformat()}": 5,
+    "/reports/completo": 6,
+    "/reports/estadisticas/actual": 2,
+    "/reports/vehiculos-por-dia": 2,
+    f"/reports/ocupacion-timeline?fecha_inicio={HACE_UNA_SEMANA}&fecha_fin={HOY.isoformat()}": 6,
+    f"/reports/estadias-percentiles?fecha_inicio={HACE_UNA_SEMANA}&fecha_fin={HOY.isoformat()}&agrupar=espacio": 4,
+    "/reports/export/incidentes": 3,
+}
+
+
+class ContadorSentencias:
+    def __init__(self):
+        self.cantidad = 0
+        self.sentencias = []
+
+    def __call__(self, conn, cursor, sentencia, parametros, contexto, executemany):
+        self.cantidad += 1
+        self.sentencias.append(" ".join(sentencia.split())[:110])
+
+    def reiniciar(self):
+        self.cantidad = 0
+        self.sentencias = []
+
+
+def cargar_datos(db, cantidad: int, desde: int):
+    """`cantidad` espacios con asignación activa, incidente abierto y solicitud de ayuda"""
+    ahora = datetime.now()
+    for i in range(desde, desde + cantidad):
+        ci = 1000 + i
+        db.add(models.UsuarioReserva(ci=ci, nombre=f"Usuario {i}"))
+        espacio = models.Espacio(numero_de_espacio=i, estado="ocupado", reservado="si" if i % 2 else "no",
+                                 zona="general" if i % 3 else "nivel2")
+        db.add(espacio)
+        db.flush()
+        db.add(models.Asignacion(ci_reserva=ci if i % 2 else None, id_de_espacio=espacio.id, zona=espacio.zona,
+                                 hora_asignado=ahora - timedelta(hours=i % 48)))
+        db.add(models.Asignacion(id_de_espacio=espacio.id, zona=espacio.zona,
+                                 hora_asignado=ahora - timedelta(days=2, hours=i % 24),
+                                 hora_liberado=ahora - timedelta(days=2, hours=i % 24) + timedelta(minutes=40)))
+        db.add(models.Incidente(id_de_espacio=espacio.id, zona=espacio.zona, tipo_de_incidente="otro",
+                                hora_de_registro=ahora - timedelta(hours=i % 30)))
+        db.add(models.SolicitudAyuda(fecha_hora=ahora - timedelta(hours=i % 30), ubicacion="Entrada"))
+    aggregates.reconstruir_resumenes(db)
+    aggregates.reconstruir_cuantiles(db)
+    db.commit()
+
+
+def medir(cliente, contador):
+    resultados = {}
+    for url in ESPERADAS:
+        contador.reiniciar()
+        respuesta = cliente.get(url)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {respuesta.status_code} {respuesta.text[:200]}")
+        resultados[url] = (contador.cantidad, list(contador.sentencias))
+    return resultados
+
+
+def main():
+    contador = ContadorSentencias()
+    engines = {engine, async_engine.sync_engine, engine_reportes}
+    for motor in engines:
+        event.listen(motor, "before_cursor_execute", contador)
+
+    errores = []
+    with TestClient(app) as cliente:
+        db = SessionLocal()
+        mediciones = []
+        for cantidad, desde in [(5, 1), (45, 6)]:
+            cargar_datos(db, cantidad, desde)
+            crud.recalcular_contadores(db)
+            db.commit()
+            asignador.cargar(db)
+            mediciones.append((desde + cantidad - 1, medir(cliente, contador)))
+        db.close()
+
+    print("=" * 60)
+    print("🔢 Sentencias SQL por endpoint (con 5 y con 50 espacios ocupados)")
+    print("=" * 60)
+    (filas_1, pocas), (filas_2, muchas) = mediciones
+    for url, esperadas in ESPERADAS.items():
+        cantidades = (pocas[url][0], muchas[url][0])
+        correcto = cantidades == (esperadas, esperadas)
+        print(f"{'✅' if correcto else '❌'} {url}: {cantidades[0]} / {cantidades[1]} (esperadas {esperadas})")
+        if not correcto:
+            errores.append(f"{url}: {cantidades[0]} con {filas_1} filas y {cantidades[1]} con {filas_2} (esperadas {esperadas})")
+            for sentencia in muchas[url][1][:12]:
+                print(f"     {sentencia}")
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print(f"✅ Los {len(ESPERADAS)} endpoints usan una cantidad fija de sentencias")
+
+
+if __name__ == "__main__":
+    main()
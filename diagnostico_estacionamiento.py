@@ -5,10 +5,11 @@
 import sys
 sys.path.append('.')
 
+from app.aggregates import ocupacion_timeline
 from app.database import SessionLocal
 from app.models import Espacio, Asignacion
 from datetime import datetime, timedelta
-from collections import defaultdict
+from sqlalchemy import func
 
 def get_semana_actual():
     hoy = datetime.now()
@@ -58,30 +59,21 @@ print(f"   Inicio: {fecha_inicio}")
 print(f"   Fin: {fecha_fin}")
 print()
 
-asignaciones_semana = db.query(Asignacion).filter(
+total_asignaciones = db.query(func.count(Asignacion.id)).filter(
     Asignacion.hora_asignado >= fecha_inicio,
     Asignacion.hora_asignado <= fecha_fin
-).all()
+).scalar()
 
-print(f"🚗 ASIGNACIONES ESTA SEMANA: {len(asignaciones_semana)}")
+print(f"🚗 ASIGNACIONES ESTA SEMANA: {total_asignaciones}")
 print()
 
-# 4. Calcular ocupación por hora
+# 4. Calcular ocupación simultánea por hora (barrido de llegadas y salidas)
 print("⏰ CALCULANDO OCUPACIÓN POR HORA...")
-ocupacion_por_hora = defaultdict(int)
-
-for asig in asignaciones_semana:
-    hora_inicio = asig.hora_asignado.replace(minute=0, second=0, microsecond=0)
-    
-    if asig.hora_liberado:
-        hora_fin = asig.hora_liberado.replace(minute=0, second=0, microsecond=0)
-    else:
-        hora_fin = datetime.now().replace(minute=0, second=0, microsecond=0)
-    
-    hora_actual = hora_inicio
-    while hora_actual <= hora_fin:
-        ocupacion_por_hora[hora_actual] += 1
-        hora_actual += timedelta(hours=1)
+timeline = ocupacion_timeline(db, fecha_inicio, fecha_fin, None, "hora", espacios_no_reservados)
+ocupacion_por_hora = {
+    datetime.fromisoformat(intervalo["inicio"]): intervalo["ocupacion_maxima"]
+    for intervalo in timeline["intervalos"]
+}
 
 # 5. Encontrar horas llenas
 horas_llenas = []
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# Generador de historial sintético para pruebas de carga y escala
+# Ejecutar: python generar_historial.py [--espacios 200] [--dias 365] [--zonas general,nivel2]
+#
+# Simula llegadas y estadías de vehículos día por día y carga el resultado con
+# INSERTs masivos (executemany, por lotes), no una fila por commit:
+#   - Llegadas: Poisson por día (menos fines de semana), repartidas según un
+#     perfil horario con picos de mañana y tarde
+#   - Estadías: log-normal (mediana --estadia-horas), más un pequeño porcentaje
+#     de asignaciones no utilizadas (< 1 minuto)
+#   - Cada llegada ocupa el espacio que se liberó primero en su zona y pool;
+#     si no hay ninguno libre se cuenta un rechazo (rechazo_por_minuto) y se
+#     abre un incidente "estacionamiento_lleno" hasta que se libere un espacio
+#   - Incidentes manuales y solicitudes de ayuda con tasas diarias fijas
+# Con la misma --semilla se generan los mismos datos.
+
+import sys
+sys.path.append('.')
+
+import argparse
+import heapq
+import math
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.database import engine, SessionLocal, Base
+from app.migrations import migrar
+from app import aggregates, archive, models, crud
+
+# Peso relativo de llegadas por hora del día (0-23)
+PERFIL_HORARIO = [
+    0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.5, 3.5, 5.0, 4.0, 3.0, 3.0,
+    3.5, 3.5, 3.0, 3.0, 3.5, 4.5, 4.0, 2.5, 1.5, 1.0, 0.6, 0.3,
+]
+FACTOR_FIN_DE_SEMANA = 0.6
+PORCENTAJE_NO_UTILIZADAS = 0.03
+PORCENTAJE_CON_RESERVA = 0.05
+ESTADIA_MAXIMA_HORAS = 14
+
+TIPOS_INCIDENTE_MANUAL = [
+    "sensor fuera de funcionamiento",
+    "ocupación sin asignar",
+    "vehículo mal estacionado",
+    "barrera trabada",
+]
+UBICACIONES_AYUDA = ["Kiosco entrada", "Kiosco salida", "Caja", "Ascensor"]
+
+TAMAÑO_LOTE = 50000
+
+
+def poisson(media: float) -> int:
+    """Muestra de Poisson (aproximación normal para medias grandes)"""
+    if media <= 0:
+        return 0
+    if media > 50:
+        return max(0, round(random.gauss(media, math.sqrt(media))))
+    limite, k, p = math.exp(-media), 0, 1.0
+    while True:
+        p *= random.random()
+        if p <= limite:
+            return k
+        k += 1
+
+
+def momentos_del_dia(dia: datetime, cantidad: int):
+    """Horas de llegada de un día según PERFIL_HORARIO, ordenadas"""
+    horas = random.choices(range(24), weights=PERFIL_HORARIO, k=cantidad)
+    return sorted(dia + timedelta(hours=h, seconds=random.random() * 3600) for h in horas)
+
+
+def duracion_estadia(mediana_horas: float) -> timedelta:
+    if random.random() < PORCENTAJE_NO_UTILIZADAS:
+        return timedelta(seconds=random.uniform(10, 59))
+    horas = random.lognormvariate(math.log(mediana_horas), 0.8)
+    return timedelta(hours=min(horas, ESTADIA_MAXIMA_HORAS))
+
+
+def _valor_sqlite(valor):
+    # Mismo formato que guarda SQLAlchemy para DateTime en SQLite, sin su
+    # procesador por fila (la mitad del tiempo de carga)
+    return valor.isoformat(" ", "microseconds") if isinstance(valor, datetime) else valor
+
+
+def insertar(conn, tabla, filas):
+    """
+    INSERT masivo por lotes (executemany). En SQLite se pasan tuplas ya
+    convertidas directamente al driver; si la tabla está vacía, los índices
+    secundarios se crean después de la carga en lugar de mantenerlos fila a fila.
+    """
+    if not filas:
+        return
+    if conn.dialect.name != "sqlite":
+        for inicio in range(0, len(filas), TAMAÑO_LOTE):
+            conn.execute(tabla.insert(), filas[inicio:inicio + TAMAÑO_LOTE])
+        return
+
+    indices = []
+    if conn.execute(tabla.select().limit(1)).first() is None:
+        indices = [indice for indice in tabla.indexes if not any(c.primary_key for c in indice.columns)]
+        for indice in indices:
+            indice.drop(conn)
+
+    columnas = list(filas[0])
+    sentencia = str(tabla.insert().compile(dialect=conn.dialect, column_keys=columnas))
+    for inicio in range(0, len(filas), TAMAÑO_LOTE):
+        conn.exec_driver_sql(sentencia, [
+            tuple(_valor_sqlite(fila[c]) for c in columnas) for fila in filas[inicio:inicio + TAMAÑO_LOTE]
+        ])
+
+    for indice in indices:
+        indice.create(conn)
+
+
+def preparar_espacios(db, cantidad, reservados, zonas):
+    """Usar los espacios existentes o crearlos repartidos entre las zonas"""
+    espacios = db.query(models.Espacio).order_by(models.Espacio.numero_de_espacio).all()
+    if espacios:
+        return espacios
+    db.add_all([
+        models.Espacio(
+            numero_de_espacio=i,
+            estado="libre",
+            reservado="si" if i <= reservados else "no",
+            zona=zonas[(i - 1) * len(zonas) // cantidad]
+        )
+        for i in range(1, cantidad + 1)
+    ])
+    db.commit()
+    return db.query(models.Espacio).order_by(models.Espacio.numero_de_espacio).all()
+
+
+def preparar_usuarios(db, cantidad):
+    """CIs de los usuarios con reserva (se crean si la base no tiene)"""
+    if not db.query(models.UsuarioReserva).first():
+        db.add_all([
+            models.UsuarioReserva(ci=1000000 + i, nombre=f"Usuario sintético {i}")
+            for i in range(1, cantidad + 1)
+        ])
+        db.commit()
+    return [ci for (ci,) in db.query(models.UsuarioReserva.ci).all()]
+
+
+def simular(espacios, usuarios, desde, hasta, llegadas_por_dia, estadia_horas, incidentes_por_dia, ayudas_por_dia):
+    # Espacios libres por (zona, pool): heap de (hora en que se libera, numero, id)
+    libres = {}
+    for espacio in espacios:
+        libres.setdefault((espacio.zona, espacio.reservado), []).append((desde, espacio.numero_de_espacio, espacio.id))
+    for heap in libres.values():
+        heapq.heapify(heap)
+    zonas = sorted({espacio.zona for espacio in espacios})
+    peso_zona = Counter(espacio.zona for espacio in espacios)
+    referencia_zona = {zona: min(e.id for e in espacios if e.zona == zona) for zona in zonas}
+
+    asignaciones, incidentes, ayudas = [], [], []
+    rechazos = Counter()
+    lleno_hasta = {}  # (zona, pool) -> fila del incidente "estacionamiento_lleno" abierto
+
+    dia = desde
+    while dia < hasta:
+        factor = FACTOR_FIN_DE_SEMANA if dia.weekday() >= 5 else 1.0
+        llegadas = momentos_del_dia(dia, poisson(llegadas_por_dia * factor))
+        zonas_llegada = random.choices(zonas, weights=[peso_zona[z] for z in zonas], k=len(llegadas))
+
+        for momento, zona in zip(llegadas, zonas_llegada):
+            if momento >= hasta:
+                break
+            ci = random.choice(usuarios) if usuarios and random.random() < PORCENTAJE_CON_RESERVA else None
+            pool = "si" if ci and (zona, "si") in libres else "no"
+            heap = libres.get((zona, pool))
+            if not heap or heap[0][0] > momento:
+                # Zona llena: rechazo por minuto y un incidente por episodio
+                rechazos[(momento.replace(second=0, microsecond=0), zona, pool)] += 1
+                if (zona, pool) not in lleno_hasta and pool == "no" and heap:
+                    incidente = {
+                        "id_de_espacio": referencia_zona[zona],
+                        "tipo_de_incidente": "estacionamiento_lleno",
+                        "hora_de_registro": momento,
+                        "hora_de_solucion": heap[0][0],
+                        "nota": f"Estacionamiento lleno (zona {zona})",
+                        "zona": zona,
+                    }
+                    incidentes.append(incidente)
+                    lleno_hasta[(zona, pool)] = incidente
+                continue
+            abierto = lleno_hasta.pop((zona, pool), None)
+            if abierto:
+                abierto["hora_de_solucion"] = max(heap[0][0], abierto["hora_de_registro"])
+
+            _, numero, espacio_id = heapq.heappop(heap)
+            salida = min(momento + duracion_estadia(estadia_horas), hasta)
+            heapq.heappush(heap, (salida, numero, espacio_id))
+            asignaciones.append({
+                "ci_reserva": ci,
+                "id_de_espacio": espacio_id,
+                "hora_asignado": momento,
+                "hora_liberado": salida,
+                "zona": zona,
+            })
+
+        for momento in momentos_del_dia(dia, poisson(incidentes_por_dia * factor)):
+            espacio = random.choice(espacios)
+            incidentes.append({
+                "id_de_espacio": espacio.id,
+                "tipo_de_incidente": random.choice(TIPOS_INCIDENTE_MANUAL),
+                "hora_de_registro": momento,
+                "hora_de_solucion": min(momento + timedelta(hours=random.expovariate(0.5)), hasta),
+                "nota": None,
+                "zona": espacio.zona,
+            })
+
+        for momento in momentos_del_dia(dia, poisson(ayudas_por_dia * factor)):
+            ayudas.append({
+                "fecha_hora": momento,
+                "atendida": True,
+                "fecha_hora_atencion": min(momento + timedelta(minutes=random.expovariate(1 / 6)), hasta),
+                "notas": None,
+                "ubicacion": random.choice(UBICACIONES_AYUDA),
+            })
+
+        dia += timedelta(days=1)
+
+    filas_rechazos = [
+        {"minuto": minuto, "zona": zona, "reservado": pool, "cantidad": cantidad}
+        for (minuto, zona, pool), cantidad in rechazos.items()
+    ]
+    return asignaciones, incidentes, ayudas, filas_rechazos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generar historial sintético de estacionamiento")
+    parser.add_argument("--espacios", type=int, default=200, help="espacios a crear si la base no tiene")
+    parser.add_argument("--reservados", type=int, default=10)
+    parser.add_argument("--usuarios", type=int, default=20, help="usuarios con reserva a crear si la base no tiene")
+    parser.add_argument("--zonas", default="general", help="zonas separadas por coma")
+    parser.add_argument("--dias", type=int, default=365, help="días de historial hasta hoy")
+    parser.add_argument("--llegadas-por-espacio", type=float, default=4.0, help="llegadas diarias por espacio")
+    parser.add_argument("--estadia-horas", type=float, default=2.5, help="mediana de la estadía")
+    parser.add_argument("--incidentes-por-dia", type=float, default=2.0)
+    parser.add_argument("--ayudas-por-dia", type=float, default=4.0)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--reiniciar", action="store_true", help="borrar todas las tablas antes de generar")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    zonas = [z.strip() for z in args.zonas.split(",") if z.strip()]
+
+    if args.reiniciar:
+        print("⚠️  Borrando todas las tablas...")
+        archive.eliminar_tablas_archivo(engine)
+        Base.metadata.drop_all(bind=engine)
+    migrar(engine)
+
+    db = SessionLocal()
+    try:
+        espacios = preparar_espacios(db, args.espacios, args.reservados, zonas)
+        usuarios = preparar_usuarios(db, args.usuarios)
+        hasta = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        desde = hasta - timedelta(days=args.dias)
+
+        print("=" * 60)
+        print(f"🚗 Historial sintético: {len(espacios)} espacios, {args.dias} días ({desde.date()} a {hasta.date()})")
+        print("=" * 60)
+
+        inicio = time.perf_counter()
+        asignaciones, incidentes, ayudas, rechazos = simular(
+            espacios, usuarios, desde, hasta,
+            args.llegadas_por_espacio * len(espacios), args.estadia_horas,
+            args.incidentes_por_dia, args.ayudas_por_dia
+        )
+        simulacion = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with engine.begin() as conn:
+            insertar(conn, models.Asignacion.__table__, asignaciones)
+            insertar(conn, models.Incidente.__table__, incidentes)
+            insertar(conn, models.SolicitudAyuda.__table__, ayudas)
+            # Rechazos: sumar a los minutos que ya existan en la base
+            insert = crud._insert_dialecto(db)(models.RechazoPorMinuto)
+            for lote in range(0, len(rechazos), TAMAÑO_LOTE):
+                conn.execute(insert.on_conflict_do_update(
+                    index_elements=["minuto", "zona", "reservado"],
+                    set_={"cantidad": models.RechazoPorMinuto.cantidad + insert.excluded.cantidad}
+                ), rechazos[lote:lote + TAMAÑO_LOTE])
+        carga = time.perf_counter() - inicio
+
+        # Resúmenes por día y hora y percentiles de estadía de los días generados
+        inicio = time.perf_counter()
+        horas_resumidas = aggregates.reconstruir_resumenes(db, desde.date(), hasta.date())
+        aggregates.reconstruir_cuantiles(db, desde.date(), hasta.date())
+        resumenes = time.perf_counter() - inicio
+
+        crud.recalcular_contadores(db)
+        db.commit()
+
+        total = len(asignaciones) + len(incidentes) + len(ayudas) + len(rechazos)
+        print(f"\n📊 Asignaciones:         {len(asignaciones)}")
+        print(f"⚠️  Incidentes:           {len(incidentes)}")
+        print(f"🆘 Solicitudes de ayuda: {len(ayudas)}")
+        print(f"🚫 Minutos con rechazos: {len(rechazos)} ({sum(r['cantidad'] for r in rechazos)} rechazos)")
+        print(f"\n⏱️  Simulación: {simulacion:.1f}s")
+        print(f"⏱️  Carga:      {carga:.1f}s ({total / carga if carga else 0:,.0f} filas/s)")
+        print(f"⏱️  Resúmenes:  {resumenes:.1f}s ({horas_resumidas} horas con actividad)")
+        print("\n✅ Historial generado. El archivo mensual moverá lo anterior a ARCHIVO_ANTIGUEDAD_DIAS")
+        print("   al iniciar la aplicación (o con: python -m app.archive)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
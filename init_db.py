@@ -1,14 +1,16 @@
 from app.database import engine, SessionLocal, Base
-from app import models, crud, schemas
+from app import archive, models, crud, schemas
+from app.migrations import migrar
 
 def init_database():
     """Inicializar la base de datos con datos de prueba"""
     
     print("Recreando tablas...")
-    # ⚠️ Esto elimina todas las tablas existentes
+    # ⚠️ Esto elimina todas las tablas existentes, también las de archivo mensual
+    archive.eliminar_tablas_archivo(engine)
     Base.metadata.drop_all(bind=engine)
     # Y las vuelve a crear con la definición actual de models.py
-    Base.metadata.create_all(bind=engine)
+    migrar(engine)
     
     db = SessionLocal()
     
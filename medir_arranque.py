@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Presupuesto de arranque: tiempo de importación de app.main y verificación del esquema
+# Ejecutar: python medir_arranque.py [--repeticiones 5] [--presupuesto-ms 1500]
+#
+# Cada medición corre en un proceso nuevo (como un worker de uvicorn recién
+# lanzado) dentro de un directorio temporal:
+#   - importar app.main (no debe tocar la base de datos)
+#   - verificar_esquema con la base vacía (migra) y con la huella al día (una consulta)
+# Con -X importtime se listan los módulos que más tardan en importarse.
+# Termina con código 1 si la mediana de importación supera el presupuesto.
+
+import sys
+sys.path.append('.')
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+MEDICION = """
+import json, time
+inicio = time.perf_counter()
+import app.main
+importacion = time.perf_counter() - inicio
+
+import os
+creo_base = os.path.exists("parking.db")
+
+from app.database import engine
+from app.migrations import verificar_esquema
+inicio = time.perf_counter()
+migro_vacia = verificar_esquema(engine)
+vacia = time.perf_counter() - inicio
+inicio = time.perf_counter()
+migro_al_dia = verificar_esquema(engine)
+al_dia = time.perf_counter() - inicio
+print(json.dumps({
+    "importacion": importacion, "creo_base": creo_base,
+    "vacia": vacia, "migro_vacia": migro_vacia,
+    "al_dia": al_dia, "migro_al_dia": migro_al_dia,
+}))
+"""
+
+
+def ejecutar(argumentos):
+    directorio = tempfile.mkdtemp(prefix="parking_arranque_")
+    entorno = dict(os.environ, PYTHONPATH=RAIZ, ARCHIVO_INTERVALO_HORAS="0")
+    return subprocess.run(
+        [sys.executable, "-W", "ignore"] + argumentos,
+        cwd=directorio, env=entorno, capture_output=True, text=True, check=True
+    )
+
+
+def modulos_mas_lentos(cantidad=10):
+    """Módulos con mayor tiempo propio de importación (python -X importtime)"""
+    salida = ejecutar(["-X", "importtime", "-c", "import app.main"]).stderr
+    modulos = []
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        modulos.append((int(propio), int(acumulado), nombre.strip()))
+    return sorted(modulos, reverse=True)[:cantidad]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medir el tiempo de arranque de un worker")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--presupuesto-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"⏱️  Arranque de un worker ({args.repeticiones} procesos nuevos)")
+    print("=" * 60)
+
+    mediciones = [json.loads(ejecutar(["-c", MEDICION]).stdout.strip().splitlines()[-1])
+                  for _ in range(args.repeticiones)]
+
+    importacion = statistics.median(m["importacion"] for m in mediciones) * 1000
+    vacia = statistics.median(m["vacia"] for m in mediciones) * 1000
+    al_dia = statistics.median(m["al_dia"] for m in mediciones) * 1000
+
+    print(f"\n📦 import app.main:                {importacion:.0f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+    print(f"🗄️  verificar_esquema (base vacía): {vacia:.0f} ms")
+    print(f"🗄️  verificar_esquema (huella ok):  {al_dia:.1f} ms")
+
+    print("\n🐢 Módulos más lentos (tiempo propio):")
+    for propio, acumulado, nombre in modulos_mas_lentos():
+        print(f"   {propio / 1000:7.1f} ms  (acumulado {acumulado / 1000:7.1f} ms)  {nombre}")
+
+    errores = []
+    if importacion > args.presupuesto_ms:
+        errores.append(f"La importación tarda {importacion:.0f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+    if any(m["creo_base"] for m in mediciones):
+        errores.append("Importar app.main creó la base de datos")
+    if not all(m["migro_vacia"] for m in mediciones):
+        errores.append("verificar_esquema no migró una base vacía")
+    if any(m["migro_al_dia"] for m in mediciones):
+        errores.append("verificar_esquema volvió a migrar con la huella al día")
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ Arranque dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
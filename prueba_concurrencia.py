@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Prueba de concurrencia: reclamo de espacios desde varias "terminales" a la vez
+# Ejecutar: python prueba_concurrencia.py [--procesos 4] [--hilos 75] [--espacios 20]
+#
+# Simula varios workers (procesos, cada uno con su propio asignador en memoria)
+# y muchos kioscos por worker (hilos) pidiendo espacio al mismo tiempo contra un
+# estacionamiento de 20 espacios en una base SQLite temporal.
+# Verifica que haya exactamente un ganador por espacio y ninguna asignación duplicada.
+
+import sys
+sys.path.append('.')
+
+import argparse
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app import models, crud
+
+
+def crear_sesiones(url):
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 60})
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def preparar_base(url, cantidad_espacios):
+    engine, Sesion = crear_sesiones(url)
+    Base.metadata.create_all(bind=engine)
+    db = Sesion()
+    try:
+        db.add_all([
+            models.Espacio(numero_de_espacio=i, estado="libre", reservado="no")
+            for i in range(1, cantidad_espacios + 1)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    engine.dispose()
+
+
+def reclamar(Sesion):
+    db = Sesion()
+    try:
+        asignacion = crud.create_asignacion(db=db, ci=None)
+        return asignacion.id_de_espacio if asignacion else None
+    finally:
+        db.close()
+
+
+def worker(url, hilos, barrera):
+    """Un proceso = un worker de uvicorn con su propio asignador"""
+    engine, Sesion = crear_sesiones(url)
+    barrera.wait()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        resultados = list(pool.map(lambda _: reclamar(Sesion), range(hilos)))
+    engine.dispose()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de reclamo concurrente de espacios")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=75)
+    parser.add_argument("--espacios", type=int, default=20)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="parking_concurrencia_")
+    url = f"sqlite:///{os.path.join(directorio, 'parking.db')}"
+    preparar_base(url, args.espacios)
+
+    total = args.procesos * args.hilos
+    print("=" * 60)
+    print(f"🚗 {total} solicitudes concurrentes contra {args.espacios} espacios")
+    print(f"   ({args.procesos} procesos x {args.hilos} hilos)")
+    print("=" * 60)
+
+    ctx = get_context("spawn")
+    with ctx.Manager() as manager:
+        barrera = manager.Barrier(args.procesos)
+        with ctx.Pool(args.procesos) as pool:
+            por_proceso = pool.starmap(worker, [(url, args.hilos, barrera)] * args.procesos)
+
+    ganadores = [espacio for resultados in por_proceso for espacio in resultados if espacio is not None]
+    rechazados = total - len(ganadores)
+
+    engine, Sesion = crear_sesiones(url)
+    db = Sesion()
+    activas = db.query(models.Asignacion.id_de_espacio).filter(
+        models.Asignacion.hora_liberado == None
+    ).all()
+    ocupados = db.query(models.Espacio).filter(models.Espacio.estado == "ocupado").count()
+    db.close()
+    engine.dispose()
+
+    duplicados_respuesta = [e for e, n in Counter(ganadores).items() if n > 1]
+    duplicados_db = [e for e, n in Counter(e for (e,) in activas).items() if n > 1]
+
+    print(f"✅ Asignaciones exitosas: {len(ganadores)}")
+    print(f"🚫 Rechazadas: {rechazados}")
+    print(f"🅿️  Espacios ocupados: {ocupados}")
+    print(f"📋 Asignaciones activas en DB: {len(activas)}")
+
+    errores = []
+    if len(ganadores) != args.espacios:
+        errores.append(f"se esperaban {args.espacios} ganadores, hubo {len(ganadores)}")
+    if duplicados_respuesta:
+        errores.append(f"espacios entregados más de una vez: {duplicados_respuesta}")
+    if duplicados_db:
+        errores.append(f"asignaciones activas duplicadas en DB: {duplicados_db}")
+    if ocupados != args.espacios or len(activas) != args.espacios:
+        errores.append("el estado de los espacios no coincide con las asignaciones activas")
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ Un único ganador por espacio, sin asignaciones duplicadas")
+
+
+if __name__ == "__main__":
+    main()
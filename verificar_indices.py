@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Verificación de índices: EXPLAIN QUERY PLAN de las sentencias de los reportes
+# Ejecutar: python verificar_indices.py
+#
+# Crea una base SQLite temporal con las migraciones (app/migrations.py), carga
+# historial (con un mes ya archivado), llama a los endpoints de /reports y a
+# los del camino caliente de asignaciones, y captura con before_cursor_execute
+# (como contar_consultas.py) las sentencias que llegan a la base. Cada una se
+# vuelve a preparar con EXPLAIN QUERY PLAN y sus mismos parámetros: ninguna
+# puede recorrer completa una tabla grande (TABLAS_GRANDES o un mes archivado).
+# Termina con código 1 si alguna lo hace.
+
+import sys
+sys.path.append('.')
+
+import os
+import re
+import tempfile
+
+_directorio = tempfile.mkdtemp(prefix="parking_indices_")
+_ruta = os.path.join(_directorio, "parking.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_ruta}"
+os.environ["REPORTES_MEMO_DIR"] = os.path.join(_directorio, "reportes_cerrados")
+os.environ["REPORTES_CACHE_TTL_SEGUNDOS"] = "0"  # Sin cache: se explica el cálculo
+os.environ["ARCHIVO_INTERVALO_HORAS"] = "0"
+
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+from app import aggregates, archive, crud, models
+from app.allocator import asignador
+from app.database import SessionLocal, async_engine, engine, engine_reportes
+from app.main import app
+
+HOY = datetime.now().date()
+DESDE = (HOY - timedelta(days=30)).isoformat()
+DESDE_ARCHIVO = (HOY - timedelta(days=110)).isoformat()
+RANGO = f"fecha_inicio={DESDE}&fecha_fin={HOY.isoformat()}"
+
+# Tablas que crecen con el historial: recorrerlas completas no escala
+TABLAS_GRANDES = {
+    "asignacion", "incidente", "solicitudes_ayuda", "rechazo_por_minuto",
+    "resumen_horario", "resumen_diario", "estadia_pendiente",
+    "cuantiles_estadia_diarios", "cuantiles_estadia_espacio",
+}
+_ARCHIVO = re.compile(r"\w+_archivo_\d{4}_\d{2}")
+_RECORRIDO = re.compile(r"SCAN (\w+)")
+
+# (método, url): el reporte que se explica
+PEDIDOS = [
+    ("GET", f"/reports/rango?{RANGO}"),
+    ("GET", f"/reports/rango?{RANGO}&zona=nivel2"),
+    ("GET", f"/reports/rango-detallado?{RANGO}"),
+    ("GET", f"/reports/rango-detallado?fecha_inicio={DESDE_ARCHIVO}&fecha_fin={HOY.isoformat()}&zona=nivel2"),
+    ("GET", "/reports/completo"),
+    ("GET", "/reports/completo?zona=nivel2"),
+    ("GET", "/reports/estadisticas/actual"),
+    ("GET", "/reports/vehiculos-por-dia"),
+    ("GET", f"/reports/ocupacion-timeline?{RANGO}"),
+    ("GET", f"/reports/ocupacion-timeline?{RANGO}&zona=nivel2"),
+    ("GET", f"/reports/estadias-percentiles?{RANGO}&agrupar=dia"),
+    ("GET", f"/reports/estadias-percentiles?{RANGO}&agrupar=espacio&zona=nivel2"),
+    ("GET", f"/reports/export/asignaciones?{RANGO}&zona=nivel2"),
+    ("GET", f"/reports/export/incidentes?fecha_inicio={DESDE_ARCHIVO}&fecha_fin={HOY.isoformat()}"),
+    ("GET", "/espacios/disponibles"),
+    ("GET", "/asignaciones/activas"),
+    ("POST", "/asignaciones/solicitar"),
+]
+
+
+class CapturaSentencias:
+    """Sentencias de lectura (y UPDATE / DELETE con WHERE) con sus parámetros"""
+
+    def __init__(self):
+        self.sentencias = []
+
+    def __call__(self, conn, cursor, sentencia, parametros, contexto, executemany):
+        if executemany or not sentencia.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+            return
+        self.sentencias.append((sentencia, tuple(parametros)))
+
+    def reiniciar(self):
+        self.sentencias = []
+
+
+def cargar_datos(db):
+    """200 espacios en dos zonas y 120 días de asignaciones, incidentes, ayudas y rechazos"""
+    ahora = datetime.now().replace(microsecond=0)
+    espacios = [
+        models.Espacio(numero_de_espacio=i, estado="libre", reservado="si" if i <= 10 else "no",
+                       zona="general" if i <= 100 else "nivel2")
+        for i in range(1, 201)
+    ]
+    db.add_all(espacios)
+    db.flush()
+
+    asignaciones, incidentes, ayudas, rechazos = [], [], [], []
+    for hora in range(120 * 24):
+        momento = ahora - timedelta(hours=hora, minutes=5)
+        for k in range(3):
+            espacio = espacios[(hora * 3 + k) % 200]
+            asignaciones.append(dict(
+                id_de_espacio=espacio.id, zona=espacio.zona, hora_asignado=momento,
+                hora_liberado=momento + timedelta(minutes=20 + 17 * k)
+            ))
+        if hora % 6 == 0:
+            incidentes.append(dict(
+                id_de_espacio=espacios[hora % 200].id, zona=espacios[hora % 200].zona,
+                tipo_de_incidente="estacionamiento_lleno" if hora % 12 else "otro",
+                hora_de_registro=momento, hora_de_solucion=momento + timedelta(minutes=30)
+            ))
+            ayudas.append(dict(fecha_hora=momento, atendida=True, ubicacion="Entrada"))
+            rechazos.append(dict(minuto=momento.replace(second=0), zona="nivel2", reservado="no", cantidad=2))
+    db.execute(models.Asignacion.__table__.insert(), asignaciones)
+    db.execute(models.Incidente.__table__.insert(), incidentes)
+    db.execute(models.SolicitudAyuda.__table__.insert(), ayudas)
+    db.execute(models.RechazoPorMinuto.__table__.insert(), rechazos)
+    aggregates.reconstruir_resumenes(db)
+    aggregates.reconstruir_cuantiles(db)
+    db.commit()
+
+    # Más de ARCHIVO_ANTIGUEDAD_DIAS: el mes más antiguo pasa a su tabla de archivo
+    archive.archivar(db)
+    crud.recalcular_contadores(db)
+    db.commit()
+    db.connection().exec_driver_sql("ANALYZE")
+    db.commit()
+
+
+def recorridos_completos(plan):
+    """Pasos del plan que recorren completa una tabla grande"""
+    return [
+        paso for paso in plan
+        if (m := _RECORRIDO.match(paso)) and (m.group(1) in TABLAS_GRANDES or _ARCHIVO.fullmatch(m.group(1)))
+    ]
+
+
+def main():
+    captura = CapturaSentencias()
+    errores = []
+    explicadas = 0
+
+    with TestClient(app) as cliente:
+        db = SessionLocal()
+        cargar_datos(db)
+        asignador.cargar(db)
+        # Algunas asignaciones activas y una estadía pendiente de compactar
+        for _ in range(5):
+            cliente.post("/asignaciones/solicitar", json={})
+        cliente.put(f"/asignaciones/{cliente.get('/asignaciones/activas').json()[0]['id']}/liberar")
+        db.close()
+
+        for motor in {engine, async_engine.sync_engine, engine_reportes}:
+            event.listen(motor, "before_cursor_execute", captura)
+
+        print("=" * 60)
+        print("🔍 EXPLAIN QUERY PLAN de las sentencias de cada endpoint")
+        print("=" * 60)
+        explicador = create_engine(f"sqlite:///{_ruta}")
+        with explicador.connect() as conn:
+            for metodo, url in PEDIDOS:
+                captura.reiniciar()
+                respuesta = cliente.request(metodo, url, json={} if metodo == "POST" else None)
+                sentencias = list(captura.sentencias)
+                if respuesta.status_code != 200:
+                    errores.append(f"{url}: HTTP {respuesta.status_code} {respuesta.text[:200]}")
+                    print(f"❌ {metodo} {url}: HTTP {respuesta.status_code}")
+                    continue
+
+                problemas = []
+                for sentencia, parametros in sentencias:
+                    plan = [fila[-1] for fila in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sentencia, parametros).all()]
+                    explicadas += 1
+                    recorridos = recorridos_completos(plan)
+                    if recorridos:
+                        problemas.append((sentencia, plan, recorridos))
+
+                print(f"{'✅' if not problemas else '❌'} {metodo} {url}: {len(sentencias)} sentencias")
+                for sentencia, plan, recorridos in problemas:
+                    print(f"     {' '.join(sentencia.split())[:160]}")
+                    for paso in plan:
+                        print(f"       {paso}")
+                    errores.append(f"{url}: {', '.join(recorridos)}")
+        explicador.dispose()
+
+        for motor in {engine, async_engine.sync_engine, engine_reportes}:
+            event.remove(motor, "before_cursor_execute", captura)
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print(f"✅ Las {explicadas} sentencias de {len(PEDIDOS)} endpoints usan índices en las tablas grandes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Verificación de migraciones: actualizar una base creada por la versión original
+# Ejecutar: python verificar_migraciones.py
+#
+# Crea una base SQLite temporal con el esquema original (sin zonas, contadores
+# ni índices del camino caliente), le carga datos como los que dejaba la
+# carrera de asignaciones de esa versión (dos asignaciones activas en el mismo
+# espacio) y la lleva a la última versión con app/migrations.py. Comprueba que
+# la migración termine, que quede una sola asignación activa por espacio y que
+# el estado de los espacios y los contadores coincidan. Termina con código 1
+# si algo no coincide.
+
+import sys
+sys.path.append('.')
+
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import VERSION_ACTUAL, migrar
+
+# Esquema de la versión original (Base.metadata.create_all de entonces)
+ESQUEMA_ORIGINAL = """
+CREATE TABLE admin (
+    id INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL, "contraseña" VARCHAR(255) NOT NULL,
+    fecha_creacion DATETIME, ultimo_login DATETIME, PRIMARY KEY (id), UNIQUE (nombre)
+);
+CREATE INDEX ix_admin_id ON admin (id);
+CREATE TABLE usuario_reserva (ci INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL, PRIMARY KEY (ci));
+CREATE INDEX ix_usuario_reserva_ci ON usuario_reserva (ci);
+CREATE TABLE espacio (
+    id INTEGER NOT NULL, numero_de_espacio INTEGER NOT NULL, estado VARCHAR(20) NOT NULL,
+    reservado VARCHAR(5) NOT NULL, PRIMARY KEY (id), UNIQUE (numero_de_espacio)
+);
+CREATE INDEX ix_espacio_id ON espacio (id);
+CREATE TABLE solicitudes_ayuda (
+    id INTEGER NOT NULL, fecha_hora DATETIME NOT NULL, atendida BOOLEAN, fecha_hora_atencion DATETIME,
+    notas TEXT, ubicacion VARCHAR(100), PRIMARY KEY (id)
+);
+CREATE INDEX ix_solicitudes_ayuda_id ON solicitudes_ayuda (id);
+CREATE TABLE asignacion (
+    id INTEGER NOT NULL, ci_reserva INTEGER, id_de_espacio INTEGER NOT NULL,
+    hora_asignado DATETIME DEFAULT CURRENT_TIMESTAMP, hora_liberado DATETIME, PRIMARY KEY (id),
+    FOREIGN KEY(ci_reserva) REFERENCES usuario_reserva (ci), FOREIGN KEY(id_de_espacio) REFERENCES espacio (id)
+);
+CREATE INDEX ix_asignacion_id ON asignacion (id);
+CREATE TABLE incidente (
+    id INTEGER NOT NULL, id_de_espacio INTEGER NOT NULL, tipo_de_incidente VARCHAR(100) NOT NULL,
+    hora_de_registro DATETIME DEFAULT CURRENT_TIMESTAMP, hora_de_solucion DATETIME, nota TEXT,
+    PRIMARY KEY (id), FOREIGN KEY(id_de_espacio) REFERENCES espacio (id)
+);
+CREATE INDEX ix_incidente_id ON incidente (id);
+"""
+
+
+def crear_base_original(ruta: str):
+    conn = sqlite3.connect(ruta)
+    conn.executescript(ESQUEMA_ORIGINAL)
+    conn.executemany(
+        "INSERT INTO espacio (id, numero_de_espacio, estado, reservado) VALUES (?, ?, ?, ?)",
+        [(1, 1, "ocupado", "no"), (2, 2, "libre", "no"), (3, 3, "ocupado", "si"), (4, 4, "libre", "si")]
+    )
+    conn.executemany(
+        "INSERT INTO asignacion (id, id_de_espacio, hora_asignado, hora_liberado) VALUES (?, ?, ?, ?)",
+        [
+            # Dos kioscos tomaron el espacio 1 casi a la vez (la carrera original)
+            (1, 1, "2025-03-01 10:00:00.000000", None),
+            (2, 1, "2025-03-01 10:00:02.000000", None),
+            (3, 3, "2025-03-01 11:00:00.000000", None),
+            (4, 2, "2025-02-28 08:00:00.000000", "2025-02-28 09:30:00.000000"),
+        ]
+    )
+    conn.execute(
+        "INSERT INTO incidente (id_de_espacio, tipo_de_incidente, hora_de_registro) VALUES (1, 'otro', '2025-03-01 12:00:00')"
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    directorio = tempfile.mkdtemp(prefix="parking_migraciones_")
+    ruta = os.path.join(directorio, "parking.db")
+    crear_base_original(ruta)
+    engine = create_engine(f"sqlite:///{ruta}")
+
+    errores = []
+
+    def comprobar(descripcion: str, correcto: bool, detalle=""):
+        print(f"{'✅' if correcto else '❌'} {descripcion}{f': {detalle}' if detalle else ''}")
+        if not correcto:
+            errores.append(descripcion)
+
+    print("=" * 60)
+    print("🗄️  Actualización de una base de la versión original")
+    print("=" * 60)
+    try:
+        version = migrar(engine)
+    except Exception as e:
+        comprobar("La migración termina", False, e)
+        sys.exit(1)
+    comprobar("La migración termina", version == VERSION_ACTUAL, f"versión {version}")
+
+    with engine.connect() as conn:
+        activas = conn.execute(text(
+            "SELECT id_de_espacio, id FROM asignacion WHERE hora_liberado IS NULL ORDER BY id_de_espacio"
+        )).all()
+        comprobar("Una sola asignación activa por espacio", [tuple(f) for f in activas] == [(1, 2), (3, 3)], activas)
+
+        cerrada = conn.execute(text("SELECT hora_liberado FROM asignacion WHERE id = 1")).scalar()
+        comprobar("La duplicada se cierra cuando empezó la vigente", str(cerrada).startswith("2025-03-01 10:00:02"), cerrada)
+
+        indices = {indice["name"] for indice in inspect(conn).get_indexes("asignacion")}
+        comprobar("Índice ux_asignacion_espacio_activa creado", "ux_asignacion_espacio_activa" in indices)
+        comprobar("Índices de asignaciones activas en un momento creados",
+                  {"ix_asignacion_hora_liberado", "ix_asignacion_zona_hora_liberado"} <= indices)
+
+        estados = dict(conn.execute(text("SELECT id, estado FROM espacio")).all())
+        comprobar("Espacios con asignación activa ocupados", estados[1] == "ocupado" and estados[3] == "ocupado", estados)
+
+        contadores = {
+            (zona, reservado): (total, ocupados)
+            for zona, reservado, total, ocupados in conn.execute(text(
+                "SELECT zona, reservado, SUM(total), SUM(ocupados) FROM contador_ocupacion GROUP BY zona, reservado"
+            ))
+        }
+        esperados = {("general", "no"): (2, 1), ("general", "si"): (2, 1)}
+        comprobar("Contadores de ocupación recalculados", contadores == esperados, contadores)
+
+        zonas = conn.execute(text(
+            "SELECT (SELECT COUNT(*) FROM espacio WHERE zona = 'general') + "
+            "(SELECT COUNT(*) FROM asignacion WHERE zona = 'general') + "
+            "(SELECT COUNT(*) FROM incidente WHERE zona = 'general')"
+        )).scalar()
+        comprobar("Columna zona agregada con la zona por defecto", zonas == 9, zonas)
+
+    comprobar("Volver a migrar no cambia nada", migrar(engine) == VERSION_ACTUAL)
+    engine.dispose()
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ La base original se actualiza sin errores")
+
+
+if __name__ == "__main__":
+    main()
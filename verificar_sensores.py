@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Verificación de eventos de sensores con hora inválida
+# Ejecutar: python verificar_sensores.py
+#
+# Crea una base SQLite temporal, asigna espacios por la API y envía a
+# /asignaciones/sensores/eventos un "libre" atrasado (anterior a la llegada de
+# la asignación activa) y uno con hora futura. Ninguno de los dos puede cerrar
+# la asignación: quedaría con hora_liberado < hora_asignado, o con una estadía
+# de años en los promedios y percentiles. Un "libre" válido en el mismo lote sí
+# se aplica. Termina con código 1 si algo no coincide.
+
+import sys
+sys.path.append('.')
+
+import os
+import tempfile
+
+_directorio = tempfile.mkdtemp(prefix="parking_sensores_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directorio, 'parking.db')}"
+os.environ["REPORTES_MEMO_DIR"] = os.path.join(_directorio, "reportes_cerrados")
+os.environ["REPORTES_CACHE_TTL_SEGUNDOS"] = "0"
+os.environ["ARCHIVO_INTERVALO_HORAS"] = "0"
+
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from app import crud, models
+from app.database import SessionLocal
+from app.main import app
+
+
+def main():
+    errores = []
+
+    def comprobar(descripcion: str, correcto: bool, detalle=""):
+        print(f"{'✅' if correcto else '❌'} {descripcion}{f': {detalle}' if detalle else ''}")
+        if not correcto:
+            errores.append(descripcion)
+
+    print("=" * 60)
+    print("📡 Eventos de sensores atrasados y con hora futura")
+    print("=" * 60)
+    with TestClient(app) as cliente:
+        for numero in (1, 2):
+            cliente.post("/espacios/", json={"numero_de_espacio": numero, "estado": "libre", "reservado": "no"})
+        asignaciones = [cliente.post("/asignaciones/solicitar", json={}).json() for _ in range(2)]
+        espacios = [asignacion["id_de_espacio"] for asignacion in asignaciones]
+        ahora = datetime.now()
+
+        resultado = cliente.post("/asignaciones/sensores/eventos", json={"eventos": [
+            # Atrasado: de una estadía anterior a la asignación activa
+            {"espacio_id": espacios[0], "estado": "libre", "timestamp": "2020-01-01T08:00:00"},
+            # Hora futura: reloj del sensor adelantado
+            {"espacio_id": espacios[1], "estado": "libre", "timestamp": (ahora + timedelta(days=365)).isoformat()},
+        ]}).json()
+        comprobar("El evento atrasado se ignora", resultado["atrasados"] == 1, resultado)
+        comprobar("El evento con hora futura se descarta", resultado["futuros"] == 1, resultado)
+        comprobar("No se libera ningún espacio", resultado["liberados"] == 0 and resultado["asignaciones_cerradas"] == 0)
+
+        activas = {asignacion["id_de_espacio"] for asignacion in cliente.get("/asignaciones/activas").json()}
+        comprobar("Las dos asignaciones siguen activas", activas == set(espacios), activas)
+
+        # En el mismo lote, el evento futuro no le gana al válido del mismo espacio
+        resultado = cliente.post("/asignaciones/sensores/eventos", json={"eventos": [
+            {"espacio_id": espacios[1], "estado": "libre", "timestamp": (ahora + timedelta(days=365)).isoformat()},
+            {"espacio_id": espacios[1], "estado": "libre", "timestamp": (datetime.now() + timedelta(seconds=1)).isoformat()},
+        ]}).json()
+        comprobar("El evento válido del lote se aplica", resultado["asignaciones_cerradas"] == 1, resultado)
+
+    db = SessionLocal()
+    try:
+        invertidas = db.query(models.Asignacion).filter(
+            models.Asignacion.hora_liberado < models.Asignacion.hora_asignado
+        ).count()
+        comprobar("Ninguna asignación termina antes de empezar", invertidas == 0, invertidas)
+
+        cerrada = db.query(models.Asignacion).filter(models.Asignacion.id_de_espacio == espacios[1]).one()
+        comprobar("La asignación se cierra con la hora del evento válido",
+                  cerrada.hora_liberado is not None and cerrada.hora_liberado - cerrada.hora_asignado < timedelta(minutes=1),
+                  cerrada.hora_liberado)
+
+        ocupados = crud.get_contadores(db)["ocupados"]
+        comprobar("Contadores: un espacio ocupado", ocupados == 1, ocupados)
+    finally:
+        db.close()
+
+    print()
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ Los eventos con hora inválida no cierran asignaciones")
+
+
+if __name__ == "__main__":
+    main()